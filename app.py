@@ -3,21 +3,43 @@
 import os
 import sys
 import logging
+import tempfile
 
 from celery.bin.celery import main as celery_main
 from selinon import Config
 
-from thoth.worker import get_config_files
+from thoth.worker import get_worker_queues
+from thoth.worker import set_config_without_tasks
 
 _LOGGER = logging.getLogger(__name__)
 
-Config.set_config_yaml(*get_config_files())
+_METRICS_PORT = os.getenv('THOTH_WORKER_METRICS_PORT')
+if _METRICS_PORT:
+    # Celery runs tasks in forked processes, collect metrics from all of them. This has to be set before
+    # prometheus_client gets imported.
+    if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='thoth_worker_metrics_')
+    os.environ['prometheus_multiproc_dir'] = os.environ['PROMETHEUS_MULTIPROC_DIR']
+
+# No task implementation is needed to resolve queues, tasks get imported once the entrypoint is loaded.
+set_config_without_tasks()
 
 SELINON_DISPATCHER = bool(int(os.getenv('SELINON_DISPATCHER', '0')))
-QUEUES = list(Config.dispatcher_queues.values() if SELINON_DISPATCHER else Config.task_queues.values())
+QUEUES = sorted(set(Config.dispatcher_queues.values() if SELINON_DISPATCHER else Config.task_queues.values()))
+
+_SELECTED_QUEUES = get_worker_queues()
+if _SELECTED_QUEUES is not None:
+    QUEUES = [queue for queue in QUEUES if queue in _SELECTED_QUEUES]
+
+# Let the entrypoint know which tasks should be imported.
+os.environ['THOTH_WORKER_QUEUES'] = ','.join(QUEUES)
 
 _LOGGER.info("Worker will listen on %r", QUEUES)
 
+if _METRICS_PORT:
+    from thoth.worker.metrics import start_metrics_server
+    start_metrics_server(int(_METRICS_PORT))
+
 # Act like we would invoke celery directly from command line.
 sys.argv = [
     '/usr/bin/celery',
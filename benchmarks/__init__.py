@@ -0,0 +1 @@
+"""Benchmarks of thoth-worker, see README.rst for instructions."""
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Simulate a fan-out burst against a local broker stand-in, compare fixed replicas with recommended ones.
+
+The broker and the bookkeeping Redis are fakeredis, time is simulated - producers push messages with a quiet
+rate and a burst in between, replicas consume them with a per-queue service time and report processed messages
+the same way the trace function does. Recommendations are applied after a pod start delay:
+
+  PYTHONPATH=. pipenv run python3 -m benchmarks.autoscale --burst-rate 20 --burst-seconds 600
+"""
+
+import argparse
+import json
+import random
+import sys
+import typing
+
+import fakeredis
+
+from thoth.worker.queues import QueueMonitor
+from thoth.worker.queues import RedisBroker
+from thoth.worker.queues import record_processed
+
+# Queues of each group and time (in seconds) a replica spends processing one message of the queue.
+_GROUPS = {
+    "dispatcher": {"thoth_worker_dispatcher": 0.05},
+    "worker": {"download_project_info_task": 0.6, "retrieve_project_readme_task": 0.3},
+}
+
+
+class _SimulatedClock:
+    """Simulated time, in seconds."""
+
+    def __init__(self):
+        """Start at zero."""
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """Get the current simulated time."""
+        return self.now
+
+
+def _simulate(args: argparse.Namespace, autoscale: bool) -> dict:
+    """Run the simulation, replicas are either fixed or follow recommendations."""
+    rng = random.Random(args.seed)
+    clock = _SimulatedClock()
+    broker = fakeredis.FakeStrictRedis()
+    bookkeeping = fakeredis.FakeStrictRedis()
+    monitor = QueueMonitor(
+        RedisBroker(broker), {group: sorted(queues) for group, queues in _GROUPS.items()}, bookkeeping, clock
+    )
+
+    replicas = {group: args.replicas for group in _GROUPS}
+    # Replica changes waiting for pods to start, as (time effective, group, replicas).
+    pending: typing.List[typing.Tuple[float, str, int]] = []
+    waits: typing.List[float] = []
+    max_depth = 0
+    max_replicas = dict(replicas)
+    replica_seconds = 0.0
+    message_id = 0
+
+    for second in range(args.duration):
+        clock.now = float(second)
+        burst = args.quiet_seconds <= second < args.quiet_seconds + args.burst_seconds
+        rate = args.burst_rate if burst else args.quiet_rate
+
+        # Each project info task triggers a readme task and a dispatcher wakeup, as in the pypi_project flow.
+        for _ in range(sum(rng.random() < rate / 10 for _ in range(10))):
+            for queue in ("download_project_info_task", "retrieve_project_readme_task", "thoth_worker_dispatcher"):
+                broker.lpush(queue, json.dumps({"id": message_id, "enqueued": clock.now}))
+                message_id += 1
+
+        for time_effective, group, count in list(pending):
+            if time_effective <= clock.now:
+                replicas[group] = count
+                pending.remove((time_effective, group, count))
+
+        for group, queues in _GROUPS.items():
+            replica_seconds += replicas[group]
+            max_replicas[group] = max(max_replicas[group], replicas[group])
+            # Each replica (concurrency 1) has one second of work time, queues are served round robin.
+            budget = float(replicas[group])
+            while budget > 0:
+                consumed = False
+                for queue, service_time in sorted(queues.items()):
+                    if budget <= 0:
+                        break
+                    message = broker.rpop(queue)
+                    if message is None:
+                        continue
+                    consumed = True
+                    budget -= service_time
+                    waits.append(clock.now - json.loads(message)["enqueued"])
+                    record_processed(bookkeeping, queue, service_time)
+                if not consumed:
+                    break
+
+        max_depth = max(max_depth, sum(broker.llen(queue) for queues in _GROUPS.values() for queue in queues))
+
+        if second % args.interval == 0:
+            report = monitor.sample()
+            if autoscale:
+                for group, stats in report["groups"].items():
+                    if stats["recommended_replicas"] != replicas[group]:
+                        pending.append((clock.now + args.start_delay, group, stats["recommended_replicas"]))
+
+    waits.sort()
+    return {
+        "messages": message_id,
+        "processed": len(waits),
+        "left_in_queues": sum(broker.llen(queue) for queues in _GROUPS.values() for queue in queues),
+        "max_depth": max_depth,
+        "wait_p50_seconds": waits[len(waits) // 2] if waits else None,
+        "wait_p95_seconds": waits[int(0.95 * (len(waits) - 1))] if waits else None,
+        "wait_max_seconds": waits[-1] if waits else None,
+        "replica_seconds": replica_seconds,
+        "max_replicas": max_replicas,
+    }
+
+
+def main() -> None:
+    """Run the autoscaling simulation."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=int, default=3600, help="Simulated seconds.")
+    parser.add_argument("--quiet-rate", type=float, default=0.5, help="Projects scheduled per second when quiet.")
+    parser.add_argument("--burst-rate", type=float, default=20.0, help="Projects scheduled per second in a burst.")
+    parser.add_argument("--quiet-seconds", type=int, default=600, help="Seconds before the burst starts.")
+    parser.add_argument("--burst-seconds", type=int, default=600, help="Duration of the burst.")
+    parser.add_argument("--replicas", type=int, default=2, help="Fixed number of replicas of each deployment.")
+    parser.add_argument("--interval", type=int, default=15, help="Seconds between samples of queues.")
+    parser.add_argument("--start-delay", type=int, default=30, help="Seconds for a pod to start.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the random generator.")
+    args = parser.parse_args()
+
+    report = {"fixed": _simulate(args, autoscale=False), "autoscaled": _simulate(args, autoscale=True)}
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Synthetic data and local stand-ins for PyPI, GitHub, Travis CI and Ceph used in benchmarks."""
+
+import io
+import json
+import random
+import re
+import socketserver
+import threading
+import types
+import typing
+import zlib
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlparse
+
+from botocore.response import StreamingBody
+
+
+class CephStandIn:
+    """Base of in-memory Ceph stand-ins, subclasses implement store_blob and retrieve_blob of the Ceph adapter.
+
+    Storage adapters read and write through the low level boto3 client, which is mimicked on top of them.
+    """
+
+    bucket = "bucket"
+    prefix = ""
+
+    @property
+    def _s3(self) -> types.SimpleNamespace:
+        """Mimic boto3 resource of the Ceph adapter, only its low level client is provided."""
+        return types.SimpleNamespace(meta=types.SimpleNamespace(client=_CephClient(self)))
+
+
+class _CephClient:
+    """Low level boto3 client of a Ceph stand-in."""
+
+    def __init__(self, ceph: CephStandIn):
+        """Bind the client to the given Ceph stand-in."""
+        self.ceph = ceph
+
+    def get_object(self, Bucket: str, Key: str) -> dict:  # noqa: N803
+        """Retrieve the given object."""
+        blob = self.ceph.retrieve_blob(Key[len(self.ceph.prefix):])
+        return {"Body": StreamingBody(io.BytesIO(blob), len(blob))}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes) -> dict:  # noqa: N803
+        """Store the given object."""
+        return self.ceph.store_blob(Body, Key[len(self.ceph.prefix):])
+
+
+class SyntheticCorpus:
+    """Deterministic synthetic data generated on demand, nothing is kept in memory."""
+
+    def __init__(
+        self,
+        projects: int,
+        vocabulary_size: int = 5000,
+        github_ratio: float = 0.4,
+        readme_ratio: float = 0.7,
+        organizations: int = 2,
+        repos_per_organization: int = 5,
+        builds_per_repo: int = 20,
+        seed: int = 42,
+    ):
+        """Configure scale of the synthetic data set."""
+        self.projects = projects
+        self.vocabulary_size = vocabulary_size
+        self.github_ratio = github_ratio
+        self.readme_ratio = readme_ratio
+        self.organizations = organizations
+        self.repos_per_organization = repos_per_organization
+        self.builds_per_repo = builds_per_repo
+        self.seed = seed
+
+    @staticmethod
+    def project_name(idx: int) -> str:
+        """Get name of the project with the given index."""
+        return f"project-{idx:07d}"
+
+    @staticmethod
+    def project_index(project_name: str) -> typing.Optional[int]:
+        """Get index of the given project, None if the project does not exist in the corpus."""
+        match = re.fullmatch(r"project-(\d+)", project_name)
+        return int(match.group(1)) if match else None
+
+    def iter_project_names(self) -> typing.Generator[str, None, None]:
+        """Iterate over all project names in the corpus."""
+        for idx in range(self.projects):
+            yield self.project_name(idx)
+
+    def _random(self, *key) -> random.Random:
+        """Get a random generator seeded for the given key so data are reproducible."""
+        return random.Random(zlib.crc32(repr((self.seed,) + key).encode()))
+
+    def _words(self, rnd: random.Random, count: int) -> typing.List[str]:
+        """Pick words from the vocabulary, lower indexes are more frequent."""
+        return [f"word{int(rnd.paretovariate(1.2)) % self.vocabulary_size}" for _ in range(count)]
+
+    def is_github_hosted(self, idx: int) -> bool:
+        """Check whether the project with the given index has a GitHub home page."""
+        return self._random("github", idx).random() < self.github_ratio
+
+    def project_info(self, idx: int) -> dict:
+        """Generate PyPI JSON API document for the given project."""
+        rnd = self._random("project", idx)
+        name = self.project_name(idx)
+        if self.is_github_hosted(idx):
+            home_page = f"https://github.com/owner-{idx % 1000}/{name}"
+        else:
+            home_page = f"https://{name}.example.com"
+
+        releases = {}
+        for release in range(rnd.randint(1, 30)):
+            releases[f"0.{release}.0"] = [
+                {
+                    "filename": f"{name}-0.{release}.0.tar.gz",
+                    "size": rnd.randint(1000, 10 ** 6),
+                    "upload_time": f"20{10 + release % 10}-01-01T00:00:00",
+                    "digests": {"sha256": "%064x" % rnd.getrandbits(256)},
+                }
+            ]
+
+        return {
+            "info": {
+                "name": name,
+                "keywords": " ".join(self._words(rnd, rnd.randint(0, 8))),
+                "description": " ".join(self._words(rnd, rnd.randint(20, 400))),
+                "home_page": home_page,
+                "requires_dist": [self.project_name(rnd.randrange(self.projects)) for _ in range(rnd.randint(0, 5))],
+            },
+            "releases": releases,
+        }
+
+    def readme(self, idx: int) -> typing.Optional[str]:
+        """Generate README for the given project, None if the project has no README."""
+        rnd = self._random("readme", idx)
+        if rnd.random() >= self.readme_ratio:
+            return None
+
+        return "# README\n\n" + " ".join(self._words(rnd, rnd.randint(50, 2000)))
+
+    def topics(self, idx: int) -> typing.List[str]:
+        """Generate GitHub topics for the given project."""
+        rnd = self._random("topics", idx)
+        return sorted(set(self._words(rnd, rnd.randint(0, 6))))
+
+    def organization_repos(self, organization: str) -> typing.List[str]:
+        """Get repositories for the given Travis CI organization."""
+        return [f"repo-{idx}" for idx in range(self.repos_per_organization)]
+
+    def repo_builds(self, slug: str) -> typing.List[dict]:
+        """Get Travis CI builds for the given repository slug."""
+        base = zlib.crc32(slug.encode()) % 10 ** 6 * 1000
+        return [
+            {
+                "id": base + idx,
+                "finished_at": "2020-01-01T00:00:00Z",
+                "jobs": [{"id": (base + idx) * 10 + job} for job in range(2)],
+            }
+            for idx in range(self.builds_per_repo)
+        ]
+
+    def job_log(self, job_id: int) -> str:
+        """Generate a Travis CI job log."""
+        rnd = self._random("log", job_id)
+        lines = []
+        for line_idx in range(rnd.randint(50, 500)):
+            if rnd.random() < 0.02:
+                lines.append(f"\x1b[31;1mERROR: {' '.join(self._words(rnd, 6))} failed\x1b[0m")
+            else:
+                lines.append(f"$ step {line_idx}: " + " ".join(self._words(rnd, 8)))
+        return "\n".join(lines)
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """A threading HTTP server (http.server.ThreadingHTTPServer is not available in Python 3.6)."""
+
+    daemon_threads = True
+
+
+class _FakeServiceHandler(BaseHTTPRequestHandler):
+    """Base class for handlers of fake services."""
+
+    corpus: SyntheticCorpus = None
+    # Share of requests failed transiently, half of them rate limited.
+    failure_rate: float = 0.0
+
+    def log_message(self, format, *args):  # noqa
+        """Do not log each request."""
+
+    def _send(self, status: int, body: typing.Union[bytes, str, dict, list], content_type: str = None) -> None:
+        """Send the given response."""
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+            content_type = content_type or "application/json"
+        if isinstance(body, str):
+            body = body.encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type or "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self) -> None:
+        """Respond with HTTP 404."""
+        self._send(404, "Not found")
+
+    def _inject_failure(self) -> bool:
+        """Fail the request transiently based on the configured failure rate, return True if failed."""
+        failure = random.random()
+        if failure >= self.failure_rate:
+            return False
+
+        if failure < self.failure_rate / 2:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self._send(503, "Service unavailable")
+        return True
+
+
+class _FakePyPIHandler(_FakeServiceHandler):
+    """Fake PyPI - simple index and JSON API."""
+
+    # Serve the JSON form of the simple index if requested.
+    json_index: bool = True
+
+    def do_GET(self):  # noqa
+        """Serve PyPI endpoints."""
+        if self._inject_failure():
+            return
+
+        path = urlparse(self.path).path
+        accept = self.headers.get("Accept", "")
+        if path.rstrip("/") == "/simple" and self.json_index and "application/vnd.pypi.simple.v1+json" in accept:
+            # PEP 691 JSON form.
+            self.send_response(200)
+            self.send_header("Content-Type", "application/vnd.pypi.simple.v1+json")
+            self.end_headers()
+            self.wfile.write(b'{"meta": {"api-version": "1.0", "_last-serial": 1}, "projects": [')
+            for idx, project_name in enumerate(self.corpus.iter_project_names()):
+                separator = ", " if idx else ""
+                self.wfile.write(f'{separator}{{"_last-serial": {idx}, "name": "{project_name}"}}'.encode())
+            self.wfile.write(b"]}\n")
+            return
+
+        if path.rstrip("/") == "/simple":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.end_headers()
+            self.wfile.write(b"<!DOCTYPE html>\n<html><body>\n")
+            for project_name in self.corpus.iter_project_names():
+                self.wfile.write(f'<a href="/simple/{project_name}/">{project_name}</a>\n'.encode())
+            self.wfile.write(b"</body></html>\n")
+            return
+
+        match = re.fullmatch(r"/pypi/([^/]+)/json/?", path)
+        idx = self.corpus.project_index(match.group(1)) if match else None
+        if idx is None or idx >= self.corpus.projects:
+            return self._not_found()
+
+        self._send(200, self.corpus.project_info(idx))
+
+
+class _FakeGitHubHandler(_FakeServiceHandler):
+    """Fake GitHub - raw content of README files and topics API."""
+
+    def do_GET(self):  # noqa
+        """Serve GitHub endpoints."""
+        if self._inject_failure():
+            return
+
+        path = urlparse(self.path).path
+
+        match = re.fullmatch(r"/raw/[^/]+/([^/]+)/master/README(\.\w+)?", path)
+        if match:
+            idx = self.corpus.project_index(match.group(1))
+            readme = self.corpus.readme(idx) if idx is not None else None
+            if readme is None or match.group(2) != ".md":
+                return self._not_found()
+            return self._send(200, readme)
+
+        match = re.fullmatch(r"/api/repos/[^/]+/([^/]+)/topics", path)
+        if match:
+            idx = self.corpus.project_index(match.group(1))
+            if idx is None:
+                return self._not_found()
+            return self._send(200, {"names": self.corpus.topics(idx)})
+
+        self._not_found()
+
+
+class _FakeTravisHandler(_FakeServiceHandler):
+    """Fake Travis CI API v3."""
+
+    _PAGE_SIZE = 25
+
+    def _paginate(self, key: str, items: list, params: dict) -> None:
+        """Respond with a page of items."""
+        offset = int(params.get("offset", ["0"])[0])
+        limit = int(params.get("limit", [str(self._PAGE_SIZE)])[0])
+        self._send(200, {
+            key: items[offset:offset + limit],
+            "@pagination": {"count": len(items), "is_last": offset + limit >= len(items)},
+        })
+
+    def do_GET(self):  # noqa
+        """Serve Travis CI endpoints."""
+        if self._inject_failure():
+            return
+
+        url = urlparse(self.path)
+        path = unquote(url.path)
+        params = parse_qs(url.query)
+
+        match = re.fullmatch(r"/owner/([^/]+)/repos", path)
+        if match:
+            organization = match.group(1)
+            repos = [{"slug": f"{organization}/{repo}"} for repo in self.corpus.organization_repos(organization)]
+            return self._paginate("repositories", repos, params)
+
+        match = re.fullmatch(r"/repo/([^/]+/[^/]+)/builds", path)
+        if match:
+            return self._paginate("builds", self.corpus.repo_builds(match.group(1)), params)
+
+        match = re.fullmatch(r"/job/(\d+)/log.txt", path)
+        if match:
+            return self._send(200, self.corpus.job_log(int(match.group(1))))
+
+        self._not_found()
+
+
+class FakeServices:
+    """Run fake PyPI, GitHub and Travis CI servers in background threads."""
+
+    def __init__(self, corpus: SyntheticCorpus, host: str = "127.0.0.1", failure_rate: float = 0.0):
+        """Prepare servers, each listens on a random free port and fails the given share of requests."""
+        self.corpus = corpus
+        self.servers = {}
+        handlers = (("pypi", _FakePyPIHandler), ("github", _FakeGitHubHandler), ("travis", _FakeTravisHandler))
+        for name, handler in handlers:
+            handler_class = type(handler.__name__, (handler,), {"corpus": corpus, "failure_rate": failure_rate})
+            self.servers[name] = _ThreadingHTTPServer((host, 0), handler_class)
+
+    def url(self, name: str) -> str:
+        """Get base URL of the given service."""
+        host, port = self.servers[name].server_address
+        return f"http://{host}:{port}"
+
+    def get_environment(self) -> dict:
+        """Get environment variables pointing tasks to the fake services."""
+        return {
+            "THOTH_WORKER_PYPI_URL": self.url("pypi") + "/simple",
+            "THOTH_WORKER_PYPI_API_URL": self.url("pypi") + "/pypi",
+            "THOTH_WORKER_GITHUB_RAW_URL": self.url("github") + "/raw",
+            "THOTH_WORKER_GITHUB_API_URL": self.url("github") + "/api",
+            "THOTH_WORKER_TRAVIS_API_URL": self.url("travis"),
+        }
+
+    def start(self) -> None:
+        """Start serving requests in background threads."""
+        for server in self.servers.values():
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop all the servers."""
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Run real Selinon flows against local stand-ins and report throughput.
+
+Ceph is replaced by an in-process S3 server (moto), Redis by fakeredis (unless --redis-url is given) and PyPI,
+GitHub and Travis CI by local HTTP servers serving synthetic data (see benchmarks/fakes.py). Each flow is run
+using Selinon's executor in a separate process so peak memory is reported per flow:
+
+  PYTHONPATH=. pipenv run python3 -m benchmarks.flows --projects 10000 --flow keywords --flow project2vec
+"""
+
+import argparse
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from .fakes import FakeServices
+from .fakes import SyntheticCorpus
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+_CONFIG_DIR = os.path.join(_PROJECT_DIR, "thoth", "worker", "config")
+_BUCKET = "thoth-benchmark"
+_BUCKET_PREFIX = "benchmark/"
+
+_FLOWS = {
+    "pypi": None,
+    "keywords": None,
+    "project2vec": None,
+    "project_readme_files": None,
+    "project_github_info": None,
+    "travis_org_logs": {"organization": "org-0", "token": "benchmark"},
+}
+# Flows that require project information to be present on Ceph.
+_CEPH_DRIVEN_FLOWS = frozenset(("keywords", "project2vec", "project_readme_files", "project_github_info"))
+# Flows fanned out over projects in the index of GitHub repositories, the index is built before the flow is run.
+_GITHUB_INDEXED_FLOWS = frozenset(("project_readme_files", "project_github_info"))
+# Tasks reducing results of fan-out flows.
+_REDUCE_TASKS = frozenset(("KeywordsAggregationTask", "Project2VecCreationTask"))
+
+# Task durations collected in the child process running a flow.
+_TASK_STARTS: typing.Dict[str, float] = {}
+_TASK_DURATIONS: typing.Dict[str, typing.List[float]] = {}
+_TASK_FAILURES: typing.Dict[str, int] = {}
+
+
+def trace_benchmark(event: int, msg_dict: dict) -> None:
+    """A Selinon trace function collecting task durations."""
+    from selinon.trace import Trace
+
+    if event == Trace.TASK_START:
+        _TASK_STARTS[msg_dict["task_id"]] = time.monotonic()
+    elif event in (Trace.TASK_END, Trace.TASK_FAILURE):
+        start = _TASK_STARTS.pop(msg_dict["task_id"], None)
+        if start is not None:
+            _TASK_DURATIONS.setdefault(msg_dict["task_name"], []).append(time.monotonic() - start)
+        if event == Trace.TASK_FAILURE:
+            _TASK_FAILURES[msg_dict["task_name"]] = _TASK_FAILURES.get(msg_dict["task_name"], 0) + 1
+
+
+def _get_free_port() -> int:
+    """Get a free TCP port on localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _write_nodes_definition(output_dir: str) -> str:
+    """Write nodes definition extended with the benchmark trace function."""
+    with open(os.path.join(_CONFIG_DIR, "nodes.yaml")) as nodes_file:
+        nodes = yaml.safe_load(nodes_file)
+
+    nodes["global"]["trace"].append({"function": {"name": "trace_benchmark", "import": "benchmarks.flows"}})
+
+    nodes_definition = os.path.join(output_dir, "nodes.yaml")
+    with open(nodes_definition, "w") as nodes_file:
+        yaml.safe_dump(nodes, nodes_file)
+
+    return nodes_definition
+
+
+def _seed_ceph(corpus: SyntheticCorpus, s3_endpoint: str, workers: int = 32) -> None:
+    """Upload project information and README files of the synthetic corpus onto Ceph stand-in."""
+    import boto3
+
+    client = boto3.client(
+        "s3", endpoint_url=s3_endpoint, aws_access_key_id="benchmark", aws_secret_access_key="benchmark"
+    )
+
+    def put(idx: int) -> None:
+        name = corpus.project_name(idx)
+        client.put_object(
+            Bucket=_BUCKET,
+            Key=f"{_BUCKET_PREFIX}pypi_project/ProjectInfo/{name}",
+            Body=json.dumps(corpus.project_info(idx)).encode(),
+        )
+        readme = corpus.readme(idx)
+        if readme is not None:
+            client.put_object(
+                Bucket=_BUCKET,
+                Key=f"{_BUCKET_PREFIX}readme/{name}",
+                Body=json.dumps({"result": {"type": "Markdown", "content": readme}}).encode(),
+            )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(put, range(corpus.projects)):
+            pass
+
+
+def _run_flow_child(flow_name: str, nodes_definition: str, concurrency: int, redis_url: typing.Optional[str]) -> None:
+    """Run the given flow in this process and report results on stdout."""
+    if not redis_url:
+        # Make all Redis clients (Selinon storages and worker's bookkeeping) talk to the same fake server.
+        import redis
+        import fakeredis
+
+        redis.Redis = fakeredis.FakeRedis
+        redis.StrictRedis = fakeredis.FakeStrictRedis
+
+    from selinon.executor import Executor
+
+    flow_definitions = [
+        os.path.join(_CONFIG_DIR, "flows", flow_file)
+        for flow_file in sorted(os.listdir(os.path.join(_CONFIG_DIR, "flows")))
+        if flow_file.endswith((".yaml", ".yml"))
+    ]
+    executor = Executor(
+        nodes_definition, flow_definitions, concurrency=concurrency, sleep_time=0, show_progressbar=False
+    )
+
+    if flow_name in _GITHUB_INDEXED_FLOWS:
+        from thoth.worker.github_index import build_github_index
+
+        build_github_index()
+
+    start = time.monotonic()
+    executor.run(flow_name, _FLOWS[flow_name])
+    duration = time.monotonic() - start
+
+    tasks = sum(len(durations) for durations in _TASK_DURATIONS.values()) + sum(_TASK_FAILURES.values())
+    reduce_durations = [d for name in _REDUCE_TASKS for d in _TASK_DURATIONS.get(name, [])]
+    result = {
+        "duration": duration,
+        "tasks": tasks,
+        "tasks_per_second": tasks / duration if duration else 0.0,
+        "reduce_latency": max(reduce_durations) if reduce_durations else None,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "failures": _TASK_FAILURES,
+        "task_duration_median": {
+            name: statistics.median(durations) for name, durations in _TASK_DURATIONS.items()
+        },
+    }
+    print(json.dumps(result))
+
+
+def _compare(report: dict, baseline: dict) -> dict:
+    """Compare report with a baseline, positive numbers mean an improvement."""
+    comparison = {}
+    for flow_name, result in report.items():
+        flow_baseline = baseline.get(flow_name)
+        if not flow_baseline:
+            continue
+
+        comparison[flow_name] = {}
+        for metric, higher_is_better in (("tasks_per_second", True), ("reduce_latency", False), ("peak_rss_kb", False)):
+            if not result.get(metric) or not flow_baseline.get(metric):
+                continue
+            change = (result[metric] - flow_baseline[metric]) / flow_baseline[metric]
+            comparison[flow_name][metric] = change if higher_is_better else -change
+
+    return comparison
+
+
+def main() -> None:
+    """Run flow benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flow", action="append", choices=sorted(_FLOWS), help="Flow to benchmark (can be repeated).")
+    parser.add_argument("--projects", type=int, default=10000, help="Number of synthetic projects.")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1, help="Executor concurrency.")
+    parser.add_argument("--redis-url", help="Use a local Redis instead of fakeredis.")
+    parser.add_argument(
+        "--baseline", default=os.path.join(_PROJECT_DIR, "benchmarks", "baseline.json"), help="Baseline file."
+    )
+    parser.add_argument("--save-baseline", action="store_true", help="Store results as a new baseline.")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--nodes-definition", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return _run_flow_child(args.child, args.nodes_definition, args.concurrency, args.redis_url)
+
+    from moto.server import ThreadedMotoServer
+    import boto3
+
+    corpus = SyntheticCorpus(projects=args.projects)
+    flows = args.flow or ["keywords", "project2vec"]
+    if "project2vec" in flows and "keywords" not in flows[:flows.index("project2vec")]:
+        # project2vec uses keywords aggregated by the keywords flow.
+        flows.insert(flows.index("project2vec"), "keywords")
+
+    s3_port = _get_free_port()
+    s3_server = ThreadedMotoServer(ip_address="127.0.0.1", port=s3_port)
+    s3_server.start()
+    s3_endpoint = f"http://127.0.0.1:{s3_port}"
+    boto3.client(
+        "s3", endpoint_url=s3_endpoint, aws_access_key_id="benchmark", aws_secret_access_key="benchmark"
+    ).create_bucket(Bucket=_BUCKET)
+
+    services = FakeServices(corpus)
+    services.start()
+
+    env = dict(os.environ)
+    env.update(services.get_environment())
+    env.update({
+        "THOTH_CEPH_BUCKET": _BUCKET,
+        "THOTH_CEPH_BUCKET_PREFIX": _BUCKET_PREFIX,
+        "THOTH_CEPH_KEY_ID": "benchmark",
+        "THOTH_CEPH_SECRET_KEY": "benchmark",
+        "THOTH_S3_ENDPOINT_URL": s3_endpoint,
+        "PYTHONPATH": _PROJECT_DIR,
+    })
+    if args.redis_url:
+        env["THOTH_WORKER_REDIS_URL"] = args.redis_url
+
+    report = {}
+    try:
+        if _CEPH_DRIVEN_FLOWS.intersection(flows):
+            start = time.monotonic()
+            _seed_ceph(corpus, s3_endpoint)
+            print(f"Seeded {corpus.projects} projects in {time.monotonic() - start:.2f}s", file=sys.stderr)
+
+        with tempfile.TemporaryDirectory(prefix="thoth_worker_benchmark_") as tmp_dir:
+            nodes_definition = _write_nodes_definition(tmp_dir)
+            for flow_name in flows:
+                command = [
+                    sys.executable, "-m", "benchmarks.flows",
+                    "--child", flow_name,
+                    "--nodes-definition", nodes_definition,
+                    "--concurrency", str(args.concurrency),
+                ]
+                if args.redis_url:
+                    command.extend(["--redis-url", args.redis_url])
+
+                output = subprocess.check_output(command, env=env, cwd=_PROJECT_DIR)
+                report[flow_name] = json.loads(output.decode().strip().splitlines()[-1])
+                report[flow_name]["projects"] = corpus.projects
+    finally:
+        services.stop()
+        s3_server.stop()
+
+    result = {"report": report}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as baseline_file:
+            result["comparison"] = _compare(report, json.load(baseline_file))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare fan-out of GitHub flows over all projects with fan-out prefiltered by the index of GitHub repositories.
+
+Project information of the synthetic corpus is stored in an in-memory Ceph stand-in with a fixed read latency,
+the index is kept in fakeredis. Reported are subflows spawned, Ceph reads done by GitHub tasks to find the
+repository, tasks failing as the project is not hosted on GitHub and time spent on the lookups:
+
+  PYTHONPATH=. pipenv run python3 -m benchmarks.github_index --projects 20000
+"""
+
+import argparse
+import json
+import sys
+import time
+import typing
+
+import fakeredis
+
+from thoth.worker import github_index
+from thoth.worker import storages
+from thoth.worker.github_index import get_github_repos
+from thoth.worker.github_index import parse_github_repo
+from thoth.worker.storages import ProjectInfoStore
+
+from .fakes import CephStandIn
+from .fakes import SyntheticCorpus
+
+
+class _ReadCountingCeph(CephStandIn):
+    """Ceph stand-in counting reads, each read takes the given latency."""
+
+    def __init__(self, latency: float):
+        """Create an empty store with the given read latency, in seconds."""
+        self.latency = latency
+        self.reads = 0
+        self.objects: typing.Dict[str, bytes] = {}
+
+    def store_blob(self, blob: bytes, object_key: str) -> dict:
+        """Store the given object."""
+        self.objects[object_key] = blob
+        return {}
+
+    def retrieve_blob(self, object_key: str) -> bytes:
+        """Retrieve the given object after the read latency."""
+        from thoth.storages.exceptions import NotFoundError
+
+        self.reads += 1
+        time.sleep(self.latency)
+        if object_key not in self.objects:
+            raise NotFoundError(object_key)
+        return self.objects[object_key]
+
+
+def _lookup_repos(store: ProjectInfoStore, items: typing.List[dict]) -> dict:
+    """Find GitHub repositories of fanned out projects as GitHub tasks do, report reads and failures."""
+    reads = store.ceph.reads
+    failed = 0
+    start = time.monotonic()
+    for node_args in items:
+        if node_args.get("owner") and node_args.get("repo"):
+            continue
+
+        home_page = store.retrieve_project_info_projection(node_args["package_name"]).get("info", {}).get("home_page")
+        if parse_github_repo(home_page) is None:
+            # The task raises FatalTaskError.
+            failed += 1
+
+    return {
+        "subflows": len(items),
+        "ceph_reads": store.ceph.reads - reads,
+        "failed_tasks": failed,
+        "lookup_seconds": time.monotonic() - start,
+    }
+
+
+def main() -> None:
+    """Run the GitHub repository index benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=20000, help="Number of projects with project information.")
+    parser.add_argument("--latency-ms", type=float, default=0.2, help="Latency of a Ceph read.")
+    args = parser.parse_args()
+
+    connection = fakeredis.FakeRedis()
+    github_index.get_redis_connection = lambda: connection
+    # Redis bookkeeping of incremental runs is not part of the measurement.
+    storages.mark_dirty = lambda package_name: None
+
+    corpus = SyntheticCorpus(args.projects)
+    store = ProjectInfoStore("bucket", "project-info/", "", "", "", projection_prefix="project-info-projection/")
+    store.ceph = _ReadCountingCeph(args.latency_ms / 1000)
+    store.projection_store.ceph = store.ceph
+
+    start = time.monotonic()
+    for idx in range(corpus.projects):
+        node_args = {"package_name": corpus.project_name(idx)}
+        store.store(node_args, "pypi_project", "ProjectInfoTask", str(idx), corpus.project_info(idx))
+    # Storing includes the incremental index update.
+    store_seconds = time.monotonic() - start
+    connection.set(github_index._BUILT_KEY, "benchmark")
+
+    all_projects = [{"package_name": corpus.project_name(idx)} for idx in range(corpus.projects)]
+    start = time.monotonic()
+    indexed_projects = [
+        {"package_name": package_name, "owner": owner, "repo": repo}
+        for package_name, (owner, repo) in sorted(get_github_repos().items())
+    ]
+    index_read_seconds = time.monotonic() - start
+
+    report = {
+        "projects": corpus.projects,
+        "store_us": store_seconds / corpus.projects * 1e6,
+        "all_projects": _lookup_repos(store, all_projects),
+        "github_index": dict(_lookup_repos(store, indexed_projects), index_read_seconds=index_read_seconds),
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
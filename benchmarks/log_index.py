@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure build throughput, size and query latency of the Travis CI log index on a synthetic log corpus.
+
+Shards are kept in memory, phrase lookups are checked against a scan of all the logs:
+
+  PYTHONPATH=. pipenv run python3 -m benchmarks.log_index --builds 5000
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import typing
+
+from thoth.worker.log_index import LogIndex
+from thoth.worker.log_index import extract_error_lines
+from thoth.worker.log_index import extract_segment
+from thoth.worker.log_index import merge_segments
+from thoth.worker.log_index import normalize_line
+
+from .fakes import SyntheticCorpus
+
+_JOBS_PER_BUILD = 2
+
+
+def _iter_builds(corpus: SyntheticCorpus, start: int, end: int) -> typing.Generator[typing.List[dict], None, None]:
+    """Generate logs of jobs of builds in the given range, as produced by TravisLogTxt."""
+    for build in range(start, end):
+        yield [
+            {
+                "organization": "org",
+                "repo": f"repo-{build % 100}",
+                "build": build,
+                "job": build * _JOBS_PER_BUILD + job,
+                "log": corpus.job_log(build * _JOBS_PER_BUILD + job),
+            }
+            for job in range(_JOBS_PER_BUILD)
+        ]
+
+
+def _build_segments(corpus: SyntheticCorpus, start: int, end: int) -> typing.Tuple[typing.List[dict], dict]:
+    """Create segments for builds in the given range, measure extraction throughput."""
+    segments = []
+    log_bytes = 0
+    duration = 0.0
+    for build_log in _iter_builds(corpus, start, end):
+        log_bytes += sum(len(job["log"]) for job in build_log)
+        started = time.perf_counter()
+        segments.append(extract_segment(build_log))
+        duration += time.perf_counter() - started
+
+    return segments, {
+        "builds": end - start,
+        "log_bytes": log_bytes,
+        "extract_seconds": duration,
+        "builds_per_second": (end - start) / duration,
+        "log_mb_per_second": log_bytes / duration / 2 ** 20,
+    }
+
+
+def _merge(segments: typing.List[dict], manifest: typing.Optional[dict], blobs: dict, shards: int) -> dict:
+    """Merge segments into in-memory shards, measure merge time."""
+    started = time.perf_counter()
+    manifest = merge_segments(segments, manifest, blobs.__getitem__, blobs.__setitem__, shards)
+    manifest["merge_seconds"] = time.perf_counter() - started
+    return manifest
+
+
+def _measure(query: typing.Callable, arguments: typing.List[typing.Any]) -> dict:
+    """Measure latency of the given query, in milliseconds."""
+    durations = []
+    for argument in arguments:
+        start = time.perf_counter()
+        query(argument)
+        durations.append((time.perf_counter() - start) * 1000)
+
+    durations.sort()
+    return {
+        "queries": len(durations),
+        "median_ms": statistics.median(durations),
+        "p99_ms": durations[int(0.99 * (len(durations) - 1))],
+        "max_ms": durations[-1],
+    }
+
+
+def _scan(corpus: SyntheticCorpus, builds: int, phrase: str) -> typing.Tuple[typing.List[int], float]:
+    """Find jobs with the given phrase in their error lines by scanning all the logs, as done without the index.
+
+    Only time spent scanning is reported (in milliseconds), not generation of logs.
+    """
+    padded_phrase = f" {normalize_line(phrase)} "
+    job_ids = []
+    duration = 0.0
+    for build_log in _iter_builds(corpus, 0, builds):
+        start = time.perf_counter()
+        for job in build_log:
+            if any(padded_phrase in f" {line} " for line in extract_error_lines(job["log"])):
+                job_ids.append(job["job"])
+        duration += time.perf_counter() - start
+
+    return job_ids, duration * 1000
+
+
+def main() -> None:
+    """Run the log index benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--builds", type=int, default=5000, help="Number of builds indexed.")
+    parser.add_argument("--shards", type=int, default=64, help="Number of index shards.")
+    parser.add_argument("--queries", type=int, default=1000, help="Number of queries measured.")
+    parser.add_argument("--scan-queries", type=int, default=3, help="Phrase queries checked using a scan of logs.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the random generator.")
+    args = parser.parse_args()
+
+    corpus = SyntheticCorpus(projects=1, seed=args.seed)
+    rng = random.Random(args.seed)
+    blobs: typing.Dict[str, bytes] = {}
+
+    # The second half is merged incrementally into the first generation.
+    half = args.builds // 2
+    segments, extract_first = _build_segments(corpus, 0, half)
+    manifest = _merge(segments, None, blobs, args.shards)
+    first_merge = manifest.pop("merge_seconds")
+    segments, extract_second = _build_segments(corpus, half, args.builds)
+    manifest = _merge(segments, manifest, blobs, args.shards)
+    second_merge = manifest.pop("merge_seconds")
+
+    generation = f"shards/{manifest['generation']}/"
+    index_bytes = sum(len(blob) for key, blob in blobs.items() if key.startswith(generation))
+    index = LogIndex(manifest, blobs.__getitem__)
+
+    lines = [
+        line
+        for segment in segments
+        for job in segment["jobs"].values()
+        for line in job["lines"]
+        if len(line.split()) > 2
+    ]
+    phrases = []
+    for line in rng.sample(lines, min(args.queries, len(lines))):
+        tokens = line.split()
+        start = rng.randrange(len(tokens) - 2)
+        phrases.append(" ".join(tokens[start:start + 3]))
+    terms = [rng.choice(phrase.split()) for phrase in phrases]
+
+    report = {
+        "builds": args.builds,
+        "jobs": manifest["jobs"],
+        "tokens": manifest["tokens"],
+        "log_bytes": extract_first["log_bytes"] + extract_second["log_bytes"],
+        "index_bytes": index_bytes,
+        "extract": {"first": extract_first, "second": extract_second},
+        "merge_seconds": {"first": first_merge, "incremental": second_merge},
+        "term": _measure(index.search_term, terms),
+        "phrase": _measure(index.search_phrase, phrases),
+    }
+
+    mismatches = 0
+    scan_durations = []
+    for phrase in phrases[:args.scan_queries]:
+        expected, duration = _scan(corpus, args.builds, phrase)
+        scan_durations.append(duration)
+        mismatches += expected != [job["job"] for job in index.search_phrase(phrase)]
+
+    if scan_durations:
+        report["scan"] = {"queries": len(scan_durations), "median_ms": statistics.median(scan_durations)}
+        report["scan_mismatches"] = mismatches
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare bytes read by downstream tasks from full project information documents and from their projections.
+
+Documents are generated from the synthetic corpus and serialized as stored on Ceph:
+
+  PYTHONPATH=. pipenv run python3 -m benchmarks.projection --documents 5000
+"""
+
+import argparse
+import json
+import sys
+import time
+import typing
+
+from thoth.worker.serialization import deserialize
+from thoth.worker.serialization import get_configured_serializer
+from thoth.worker.serialization import serialize
+from thoth.worker.storages import ProjectInfoProjectionStore
+
+from .fakes import SyntheticCorpus
+
+
+def _summarize(sizes: typing.List[int], decode_seconds: float) -> dict:
+    """Summarize sizes of documents read, in bytes."""
+    sizes = sorted(sizes)
+    return {
+        "mean_bytes": sum(sizes) / len(sizes),
+        "p99_bytes": sizes[int(0.99 * (len(sizes) - 1))],
+        "max_bytes": sizes[-1],
+        "decode_us": decode_seconds / len(sizes) * 1e6,
+    }
+
+
+def main() -> None:
+    """Run the projection benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=5000, help="Number of project information documents.")
+    args = parser.parse_args()
+
+    corpus = SyntheticCorpus(args.documents)
+    serializer = get_configured_serializer("ceph")
+    report = {}
+    for name, transform in (("full", None), ("projection", ProjectInfoProjectionStore.project)):
+        sizes = []
+        decode_seconds = 0.0
+        for idx in range(args.documents):
+            document = corpus.project_info(idx)
+            blob = serialize(transform(document) if transform else document, serializer, pretty=True)
+            sizes.append(len(blob))
+            start = time.perf_counter()
+            deserialize(blob)
+            decode_seconds += time.perf_counter() - start
+        report[name] = _summarize(sizes, decode_seconds)
+
+    report["mean_bytes_ratio"] = report["full"]["mean_bytes"] / report["projection"]["mean_bytes"]
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
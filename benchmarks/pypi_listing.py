@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure peak memory and time of listing projects on a fake PyPI simple index of growing size.
+
+The streaming listing (JSON and HTML form of the index, chunks written to an in-memory Ceph stand-in) is compared
+with downloading and parsing the whole index and returning all the projects as a single result:
+
+  PYTHONPATH=. pipenv run python3 -m benchmarks.pypi_listing --projects 50000 200000
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+import tracemalloc
+import typing
+
+from thoth.worker import http_client
+from thoth.worker.simple_index import iter_project_names
+from thoth.worker.storages import PyPIListingStore
+
+from .fakes import CephStandIn
+from .fakes import FakeServices
+from .fakes import SyntheticCorpus
+
+
+class _MemoryCeph(CephStandIn):
+    """Ceph stand-in keeping only sizes of chunks, as chunks are not held in memory of the listing pod."""
+
+    def __init__(self):
+        """Start with no objects stored."""
+        self.documents: typing.Dict[str, bytes] = {}
+        self.stored_bytes = 0
+
+    def store_blob(self, blob: bytes, object_key: str) -> dict:
+        """Record size of the stored object, keep the latest listing manifest."""
+        self.stored_bytes += len(blob)
+        if object_key == "latest.json":
+            self.documents[object_key] = blob
+        return {}
+
+    def retrieve_blob(self, object_key: str) -> bytes:
+        """Retrieve the latest listing manifest."""
+        from thoth.storages.exceptions import NotFoundError
+
+        if object_key not in self.documents:
+            raise NotFoundError(object_key)
+        return self.documents[object_key]
+
+    def delete(self, object_key: str) -> None:
+        """Nothing to delete, chunks are not kept."""
+
+
+def _list_materialized(index_url: str) -> int:
+    """Download and parse the whole index, return all projects as a single result (as PyPIListingTask did)."""
+    response = http_client.get(index_url + "/", headers={"Accept": "text/html"})
+    response.raise_for_status()
+    result = [{"package_name": name} for name in re.findall(r"<a [^>]*>([^<]+)</a>", response.text)]
+    return len(json.dumps(result))
+
+
+def _list_streaming(index_url: str) -> int:
+    """List projects using the streaming listing, chunks are written to the Ceph stand-in."""
+    store = PyPIListingStore("bucket", "pypi-listing/", "", "", "")
+    store.ceph = _MemoryCeph()
+    store.store_listing("benchmark", iter_project_names(index_url))
+    return store.ceph.stored_bytes
+
+
+def _measure(listing: typing.Callable[[str], int], index_url: str) -> dict:
+    """Measure peak memory allocated by Python (in MiB) and time of the given listing."""
+    tracemalloc.start()
+    start = time.monotonic()
+    size = listing(index_url)
+    duration = time.monotonic() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"peak_mib": peak / 2 ** 20, "seconds": duration, "result_bytes": size}
+
+
+def main() -> None:
+    """Run the PyPI listing benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, nargs="+", default=[50000, 200000], help="Sizes of the index.")
+    args = parser.parse_args()
+
+    report = {}
+    for projects in args.projects:
+        services = FakeServices(SyntheticCorpus(projects))
+        services.start()
+        index_url = services.url("pypi") + "/simple"
+        pypi_handler = services.servers["pypi"].RequestHandlerClass
+        try:
+            report[projects] = {"materialized": _measure(_list_materialized, index_url)}
+            report[projects]["streaming_json"] = _measure(_list_streaming, index_url)
+            pypi_handler.json_index = False
+            report[projects]["streaming_html"] = _measure(_list_streaming, index_url)
+        finally:
+            services.stop()
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure rework caused by transient failures of fake PyPI and GitHub, with and without in-task retries.
+
+Task runs retrieving project information and GitHub topics are done against fake services failing the given share
+of requests (503 or 429 with Retry-After). A failed task run is rerun until it succeeds, as an operator rerunning
+the flow would do:
+
+  PYTHONPATH=. pipenv run python3 -m benchmarks.retry --projects 1000 --failure-rate 0.05
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+
+from thoth.worker import http_client
+from thoth.worker import retry
+from thoth.worker.retry import run_with_retry_budget
+
+from .fakes import FakeServices
+from .fakes import SyntheticCorpus
+
+
+def _run_tasks(services: FakeServices, corpus: SyntheticCorpus, attempts: int) -> dict:
+    """Run tasks for all the projects, operations are attempted at most the given number of times per task run."""
+    retry._ATTEMPTS = attempts
+    requests_issued = 0
+    task_runs = 0
+    failed_task_runs = 0
+
+    def get(url: str) -> None:
+        http_client.get(url).raise_for_status()
+
+    def run_task(idx: int) -> None:
+        project_name = corpus.project_name(idx)
+        get(services.url("pypi") + f"/pypi/{project_name}/json")
+        get(services.url("github") + f"/api/repos/org/{project_name}/topics")
+
+    # Count requests including retries issued by the HTTP client.
+    original_get = http_client._get
+
+    def counting_get(*args, **kwargs):
+        nonlocal requests_issued
+        requests_issued += 1
+        return original_get(*args, **kwargs)
+
+    http_client._get = counting_get
+    start = time.monotonic()
+    try:
+        for idx in range(corpus.projects):
+            while True:
+                task_runs += 1
+                try:
+                    run_with_retry_budget(lambda: run_task(idx))
+                    break
+                except Exception:
+                    failed_task_runs += 1
+    finally:
+        http_client._get = original_get
+
+    return {
+        "task_runs": task_runs,
+        "failed_task_runs": failed_task_runs,
+        "requests": requests_issued,
+        "rework_requests": requests_issued - 2 * corpus.projects,
+        "seconds": time.monotonic() - start,
+    }
+
+
+def main() -> None:
+    """Run the retry benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=1000, help="Number of projects (task runs) processed.")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="Share of requests failed transiently.")
+    parser.add_argument("--attempts", type=int, default=5, help="Maximum number of attempts of a request.")
+    args = parser.parse_args()
+
+    # Keep the benchmark short, delays between retries are not what is measured.
+    retry._BASE_DELAY = 0.01
+    logging.getLogger(retry.__name__).setLevel(logging.ERROR)
+    corpus = SyntheticCorpus(args.projects)
+    services = FakeServices(corpus, failure_rate=args.failure_rate)
+    services.start()
+    try:
+        report = {
+            "without_retries": _run_tasks(services, corpus, attempts=1),
+            "with_retries": _run_tasks(services, corpus, attempts=args.attempts),
+        }
+    finally:
+        services.stop()
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
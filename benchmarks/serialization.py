@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare encode and decode time and payload size of serialization formats for each document type.
+
+Documents are generated from the synthetic corpus, only formats whose packages are installed are measured:
+
+  PYTHONPATH=. pipenv run python3 -m benchmarks.serialization --documents 200
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import typing
+import uuid
+
+from thoth.worker.serialization import SERIALIZERS
+from thoth.worker.serialization import deserialize
+from thoth.worker.serialization import serialize
+
+from .fakes import SyntheticCorpus
+
+
+def _generate_documents(
+    corpus: SyntheticCorpus, documents: int, dimensions: int, keywords: int
+) -> typing.Dict[str, typing.Tuple[typing.List[typing.Any], bool]]:
+    """Generate documents of each type, stating whether they are stored pretty-printed (on Ceph)."""
+    run_id = uuid.uuid4().hex
+    meta = {"datetime": "2020-01-01T00:00:00.000000"}
+    return {
+        # Ceph documents.
+        "project_info": ([corpus.project_info(idx) for idx in range(documents)], True),
+        "readme": ([{"result": corpus.readme(idx), "@meta": meta} for idx in range(documents)], True),
+        "github_info": ([{"result": corpus.topics(idx), "@meta": meta} for idx in range(documents)], True),
+        "aggregated_keywords": ([{"result": {f"keyword-{idx}": idx % 1000 + 1 for idx in range(keywords)}}], True),
+        # Task results in Redis.
+        "project_keywords": (
+            [
+                {
+                    "project": corpus.project_name(idx),
+                    "keywords": {word: 1 for word in corpus.topics(idx)},
+                    "previous": None,
+                }
+                for idx in range(documents)
+            ],
+            False,
+        ),
+        "project2vec_vector": (
+            [
+                {
+                    "project": corpus.project_name(idx),
+                    "inputs_hash": "0" * 64,
+                    "vocabulary_version": "0" * 64,
+                    "vector": [int(idx % (position + 2) == 0) for position in range(dimensions)],
+                }
+                for idx in range(documents)
+            ],
+            False,
+        ),
+        "pypi_listing": ([[{"package_name": name} for name in corpus.iter_project_names()]], False),
+        # Celery messages.
+        "node_args": (
+            [
+                {"package_name": corpus.project_name(idx), "run_id": run_id, "priority": "high"}
+                for idx in range(documents)
+            ],
+            False,
+        ),
+    }
+
+
+def _measure(documents: typing.List[typing.Any], serializer, pretty: bool, repeat: int) -> dict:
+    """Measure encode and decode time (per document, in microseconds) and payload size."""
+    encode = []
+    decode = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        blobs = [serialize(document, serializer, pretty) for document in documents]
+        encode.append((time.perf_counter() - start) / len(documents) * 1e6)
+
+        start = time.perf_counter()
+        for blob in blobs:
+            deserialize(blob)
+        decode.append((time.perf_counter() - start) / len(documents) * 1e6)
+
+    return {
+        "encode_us": statistics.median(encode),
+        "decode_us": statistics.median(decode),
+        "mean_size": sum(len(blob) for blob in blobs) / len(blobs),
+    }
+
+
+def main() -> None:
+    """Run the serialization benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=200, help="Number of documents of each type.")
+    parser.add_argument("--projects", type=int, default=100000, help="Number of projects in the synthetic corpus.")
+    parser.add_argument("--dimensions", type=int, default=5000, help="Size of project2vec vectors.")
+    parser.add_argument("--keywords", type=int, default=200000, help="Number of aggregated keywords.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of measurements, the median is reported.")
+    args = parser.parse_args()
+
+    corpus = SyntheticCorpus(args.projects)
+    report = {}
+    generated = _generate_documents(corpus, args.documents, args.dimensions, args.keywords)
+    for document_type, (documents, pretty) in generated.items():
+        report[document_type] = {
+            name: _measure(documents, serializer, pretty, args.repeat)
+            for name, serializer in sorted(SERIALIZERS.items())
+        }
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure build time, size and query latency of the similarity index on a synthetic project2vec model.
+
+Keywords of projects follow a Zipf distribution, the model is generated directly in the sparse form:
+
+  PYTHONPATH=. pipenv run python3 -m benchmarks.similarity --projects 400000 --keywords 50000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import typing
+
+import numpy as np
+
+from thoth.worker.similarity import SimilarityIndex
+from thoth.worker.similarity import write_index
+
+
+def generate_model(
+    projects: int, keywords: int, mean_keywords: int, seed: int
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Generate a synthetic project-keyword matrix in CSR form."""
+    rng = np.random.RandomState(seed)
+    counts = rng.poisson(mean_keywords, projects)
+    rows = np.repeat(np.arange(projects, dtype=np.int64), counts)
+    columns = (rng.zipf(1.3, len(rows)) - 1) % keywords
+    # Drop duplicate keywords of a project, unique also sorts entries by project and keyword.
+    entries = np.unique(rows * keywords + columns)
+    indptr = np.zeros(projects + 1, dtype=np.int64)
+    np.cumsum(np.bincount(entries // keywords, minlength=projects), out=indptr[1:])
+    return indptr, (entries % keywords).astype(np.int32)
+
+
+def _measure(query: typing.Callable, arguments: typing.List[typing.Any]) -> dict:
+    """Measure latency of the given query, in milliseconds."""
+    durations = []
+    for argument in arguments:
+        start = time.perf_counter()
+        query(argument)
+        durations.append((time.perf_counter() - start) * 1000)
+
+    durations.sort()
+    return {
+        "queries": len(durations),
+        "median_ms": statistics.median(durations),
+        "p99_ms": durations[int(0.99 * (len(durations) - 1))],
+        "max_ms": durations[-1],
+    }
+
+
+def _linear_scan(indptr: np.ndarray, indices: np.ndarray, project: int) -> None:
+    """Find the most similar project by scanning all vectors in Python, as done without the index."""
+    query = set(indices[indptr[project]:indptr[project + 1]].tolist())
+    best = None
+    for idx in range(len(indptr) - 1):
+        other = set(indices[indptr[idx]:indptr[idx + 1]].tolist())
+        union = len(query | other)
+        score = len(query & other) / union if union else 0.0
+        if idx != project and (best is None or score > best[0]):
+            best = (score, idx)
+
+
+def main() -> None:
+    """Run the similarity index benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=400000, help="Number of projects in the model.")
+    parser.add_argument("--keywords", type=int, default=50000, help="Number of keywords (model dimensions).")
+    parser.add_argument("--mean-keywords", type=int, default=20, help="Mean number of keywords per project.")
+    parser.add_argument("--queries", type=int, default=1000, help="Number of queries measured.")
+    parser.add_argument("--linear-scan-queries", type=int, default=3, help="Queries measured using a linear scan.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the random generator.")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    indptr, indices = generate_model(args.projects, args.keywords, args.mean_keywords, args.seed)
+    generate_duration = time.monotonic() - start
+
+    package_names = [f"project-{idx:07d}" for idx in range(args.projects)]
+    keywords = [f"keyword-{idx:06d}" for idx in range(args.keywords)]
+    rng = np.random.RandomState(args.seed + 1)
+
+    with tempfile.TemporaryDirectory(prefix="thoth_similarity_benchmark_") as index_dir:
+        start = time.monotonic()
+        write_index(index_dir, package_names, keywords, indptr, indices)
+        build_duration = time.monotonic() - start
+        index_size = sum(os.path.getsize(os.path.join(index_dir, name)) for name in os.listdir(index_dir))
+
+        start = time.monotonic()
+        index = SimilarityIndex(index_dir)
+        load_duration = time.monotonic() - start
+
+        query_projects = [package_names[idx] for idx in rng.randint(0, args.projects, args.queries)]
+        query_keywords = [keywords[idx] for idx in rng.randint(0, args.keywords, args.queries)]
+        report = {
+            "projects": args.projects,
+            "keywords": args.keywords,
+            "entries": int(indptr[-1]),
+            "generate_seconds": generate_duration,
+            "build_seconds": build_duration,
+            "load_seconds": load_duration,
+            "index_bytes": index_size,
+            "dense_tsv_bytes": 2 * args.projects * args.keywords,
+            "similar_jaccard": _measure(lambda name: index.get_similar_projects(name, 10), query_projects),
+            "similar_cosine": _measure(lambda name: index.get_similar_projects(name, 10, "cosine"), query_projects),
+            "keyword_projects": _measure(index.get_keyword_projects, query_keywords),
+        }
+
+        if args.linear_scan_queries:
+            report["linear_scan"] = _measure(
+                lambda idx: _linear_scan(indptr, indices, idx),
+                list(rng.randint(0, args.projects, args.linear_scan_queries)),
+            )
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure worker cold start time and RSS for different queue sets.
+
+Each measurement runs in a fresh interpreter that sets Selinon configuration the same way the worker does:
+
+  python3 benchmarks/startup.py --queues all --queues dispatcher --queues download_project_info_task
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+_MEASURE_SNIPPET = """
+import json
+import resource
+import time
+
+start = time.monotonic()
+from thoth.worker import get_worker_queues
+from thoth.worker import set_config
+set_config(queues=get_worker_queues())
+duration = time.monotonic() - start
+
+print(json.dumps({"duration": duration, "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+
+def _get_queue_sets(queues_args: list) -> dict:
+    """Translate queue set specification to queues as passed to the worker."""
+    result = {}
+    for queue_spec in queues_args:
+        if queue_spec == "all":
+            result[queue_spec] = None
+        elif queue_spec == "dispatcher":
+            # Dispatcher serves no task queue, no task is imported.
+            result[queue_spec] = ""
+        else:
+            result[queue_spec] = queue_spec
+
+    return result
+
+
+def _measure(queues: str, cache_dir: str) -> dict:
+    """Run a single measurement in a fresh interpreter."""
+    env = dict(os.environ)
+    env.pop("THOTH_WORKER_QUEUES", None)
+    if queues is not None:
+        env["THOTH_WORKER_QUEUES"] = queues
+    # An empty cache directory turns caching off, YAML configuration files are parsed on each start.
+    env["THOTH_WORKER_CONFIG_CACHE_DIR"] = cache_dir or ""
+
+    output = subprocess.check_output([sys.executable, "-c", _MEASURE_SNIPPET], env=env, cwd=_PROJECT_DIR)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def _summarize(measurements: list) -> dict:
+    """Summarize measurements done."""
+    durations = [m["duration"] for m in measurements]
+    return {
+        "duration_median": statistics.median(durations),
+        "duration_max": max(durations),
+        "max_rss_kb": max(m["max_rss_kb"] for m in measurements),
+    }
+
+
+def main() -> None:
+    """Run startup benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--queues",
+        action="append",
+        help="Queue set to measure - 'all', 'dispatcher' or a comma separated list of queues (can be repeated).",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Number of measurements per scenario.")
+    args = parser.parse_args()
+
+    report = {}
+    for name, queues in _get_queue_sets(args.queues or ["all", "dispatcher"]).items():
+        report[name] = {"yaml": _summarize([_measure(queues, None) for _ in range(args.repeat)])}
+
+        cache_dir = tempfile.mkdtemp(prefix="thoth_worker_config_")
+        try:
+            # The first run compiles configuration, the following runs reuse it.
+            report[name]["precompiled_cold"] = _summarize([_measure(queues, cache_dir)])
+            report[name]["precompiled"] = _summarize([_measure(queues, cache_dir) for _ in range(args.repeat)])
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
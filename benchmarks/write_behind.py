@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare time tasks spend storing results on Ceph with synchronous writes and with write-behind.
+
+Ceph is an in-memory stand-in with a fixed write latency. Measured are stores of project information (the document
+and its projection) and a PyPI listing written in chunks while the index is parsed, both run in a task scope:
+
+  PYTHONPATH=. pipenv run python3 -m benchmarks.write_behind --latency-ms 20
+"""
+
+import argparse
+import json
+import sys
+import time
+import typing
+
+from thoth.worker import storages
+from thoth.worker import write_behind
+from thoth.worker.storages import ProjectInfoStore
+from thoth.worker.storages import PyPIListingStore
+from thoth.worker.write_behind import write_behind_scope
+
+from .fakes import CephStandIn
+from .fakes import SyntheticCorpus
+
+
+class _SlowCeph(CephStandIn):
+    """Ceph stand-in with a fixed latency of writes, objects are kept in memory."""
+
+    def __init__(self, latency: float):
+        """Create an empty store with the given write latency, in seconds."""
+        self.latency = latency
+        self.objects: typing.Dict[str, bytes] = {}
+
+    def store_blob(self, blob: bytes, object_key: str) -> dict:
+        """Store the given object after the write latency."""
+        time.sleep(self.latency)
+        self.objects[object_key] = blob
+        return {}
+
+    def retrieve_blob(self, object_key: str) -> bytes:
+        """Retrieve the given object."""
+        from thoth.storages.exceptions import NotFoundError
+
+        if object_key not in self.objects:
+            raise NotFoundError(object_key)
+        return self.objects[object_key]
+
+    def delete(self, object_key: str) -> None:
+        """Delete the given object."""
+        self.objects.pop(object_key, None)
+
+
+def _store_project_info(corpus: SyntheticCorpus, latency: float) -> float:
+    """Store project information of all the projects in the corpus, return mean time per task in milliseconds."""
+    store = ProjectInfoStore("bucket", "project-info/", "", "", "", projection_prefix="project-info-projection/")
+    store.ceph = _SlowCeph(latency)
+    store.projection_store.ceph = store.ceph
+
+    start = time.monotonic()
+    for idx in range(corpus.projects):
+        node_args = {"package_name": corpus.project_name(idx)}
+        with write_behind_scope():
+            store.store(node_args, "pypi_project", "ProjectInfoTask", str(idx), corpus.project_info(idx))
+    return (time.monotonic() - start) / corpus.projects * 1000
+
+
+def _store_listing(corpus: SyntheticCorpus, latency: float, parse_ms: float) -> float:
+    """Store listing of the corpus in chunks while names are produced, return time in seconds."""
+    store = PyPIListingStore("bucket", "pypi-listing/", "", "", "")
+    store.ceph = _SlowCeph(latency)
+
+    def iter_names() -> typing.Generator[str, None, None]:
+        for idx, name in enumerate(corpus.iter_project_names()):
+            if idx % 1000 == 0:
+                # Time spent downloading and parsing the next part of the index.
+                time.sleep(parse_ms / 1000)
+            yield name
+
+    start = time.monotonic()
+    with write_behind_scope():
+        store.store_listing("benchmark", iter_names())
+    return time.monotonic() - start
+
+
+def main() -> None:
+    """Run the write-behind benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latency of a Ceph write.")
+    parser.add_argument("--projects", type=int, default=200, help="Number of project information documents stored.")
+    parser.add_argument("--listing", type=int, default=200000, help="Number of projects in the listing.")
+    parser.add_argument("--parse-ms", type=float, default=5.0, help="Time to parse 1000 names of the index.")
+    args = parser.parse_args()
+
+    # Redis bookkeeping of incremental runs and of the GitHub repository index is not part of the measurement.
+    storages.mark_dirty = lambda package_name: None
+    storages.update_github_repo = lambda package_name, projection: None
+    latency = args.latency_ms / 1000
+    report = {}
+    for mode, enabled in (("synchronous", False), ("write_behind", True)):
+        write_behind._ENABLED = enabled
+        report[mode] = {
+            "project_info_store_ms": _store_project_info(SyntheticCorpus(args.projects), latency),
+            "pypi_listing_seconds": _store_listing(SyntheticCorpus(args.listing), latency, args.parse_ms),
+        }
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,18 @@ setup(
         ]
     },
     scripts=[],
+    entry_points={
+        'console_scripts': [
+            'thoth-worker-progress=thoth.worker.progress:main',
+            'thoth-worker-bulk=thoth.worker.bulk:main',
+            'thoth-worker-vocabulary=thoth.worker.vocabulary:main',
+            'thoth-worker-similarity=thoth.worker.similarity:main',
+            'thoth-worker-priority=thoth.worker.priority:main',
+            'thoth-worker-log-index=thoth.worker.log_index:main',
+            'thoth-worker-queues=thoth.worker.queues:main',
+            'thoth-worker-github-index=thoth.worker.github_index:main',
+        ],
+    },
     install_requires=get_requirements(),
     include_package_data=True,
     author='Fridolin Pokorny',
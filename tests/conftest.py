@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Fixtures shared by tests of thoth-worker."""
+
+import socket
+import typing
+import uuid
+
+import fakeredis
+import pytest
+import redis
+
+from thoth.worker.utils import get_redis_connection
+
+_S3_CREDENTIALS = "test"
+
+
+@pytest.fixture
+def redis_connection(monkeypatch):
+    """Redis used for bookkeeping, connections are made to fakeredis."""
+    connection = fakeredis.FakeRedis()
+    monkeypatch.setattr(redis.Redis, "from_url", lambda *args, **kwargs: connection)
+    get_redis_connection.cache_clear()
+    yield connection
+    get_redis_connection.cache_clear()
+
+
+@pytest.fixture(scope="session")
+def s3_endpoint() -> typing.Generator[str, None, None]:
+    """Endpoint of an in-process S3 server standing in for Ceph."""
+    from moto.server import ThreadedMotoServer
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    yield f"http://127.0.0.1:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def ceph_adapter(s3_endpoint: str) -> typing.Callable:
+    """Create connected storage adapters of the given class, each test gets its own bucket."""
+    import boto3
+
+    bucket = uuid.uuid4().hex
+    boto3.client(
+        "s3",
+        endpoint_url=s3_endpoint,
+        aws_access_key_id=_S3_CREDENTIALS,
+        aws_secret_access_key=_S3_CREDENTIALS,
+        region_name="us-east-1",
+    ).create_bucket(Bucket=bucket)
+
+    def create_adapter(adapter_class: type, prefix: str = "test/", **kwargs):
+        adapter = adapter_class(bucket, prefix, _S3_CREDENTIALS, _S3_CREDENTIALS, s3_endpoint, **kwargs)
+        adapter.connect()
+        return adapter
+
+    return create_adapter
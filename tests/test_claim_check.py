@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of offloading large task results from Redis onto Ceph."""
+
+import fakeredis
+import pytest
+from thoth.storages.exceptions import NotFoundError
+
+from thoth.worker.serialization import get_configured_serializer
+from thoth.worker.serialization import serialize
+from thoth.worker.storages import ClaimCheckRedis
+from thoth.worker.storages import ClaimCheckStore
+
+_THRESHOLD = 100
+
+
+@pytest.fixture
+def storage(ceph_adapter) -> ClaimCheckRedis:
+    """Redis storage offloading results larger than the threshold, connected to fakeredis and the S3 server."""
+    storage = ClaimCheckRedis("bucket", "claim-check/", "key", "secret", "endpoint", threshold=_THRESHOLD)
+    storage.claim_check_store = ceph_adapter(ClaimCheckStore, prefix="claim-check/")
+    storage.conn = fakeredis.FakeRedis()
+    return storage
+
+
+def _result_of_size(size: int) -> dict:
+    """Create a result of the given size once serialized for Redis."""
+    result = {"keywords": ""}
+    result["keywords"] = "k" * (size - len(serialize(result, get_configured_serializer("redis"))))
+    assert len(serialize(result, get_configured_serializer("redis"))) == size
+    return result
+
+
+def _is_offloaded(storage: ClaimCheckRedis, task_id: str) -> bool:
+    """Check whether the result of the given task is kept on Ceph."""
+    try:
+        storage.claim_check_store.retrieve_result(f"flow/Task/{task_id}")
+    except NotFoundError:
+        return False
+    return True
+
+
+class TestClaimCheckRedis:
+    """Test store and retrieve round trips of results of different sizes."""
+
+    @pytest.mark.parametrize(
+        "size,offloaded", [(20, False), (_THRESHOLD, False), (_THRESHOLD + 1, True), (10 ** 6, True)]
+    )
+    def test_round_trip(self, storage: ClaimCheckRedis, size: int, offloaded: bool) -> None:
+        """Test only results larger than the threshold are offloaded, retrieval is transparent."""
+        result = _result_of_size(size)
+        storage.store({}, "flow", "Task", "task-id", result)
+
+        assert storage.retrieve("flow", "Task", "task-id") == result
+        assert _is_offloaded(storage, "task-id") == offloaded
+        assert len(storage.conn.get("task-id")) <= max(size, _THRESHOLD)
+
+    def test_delete(self, storage: ClaimCheckRedis) -> None:
+        """Test deleting results deletes offloaded results as well."""
+        storage.store({}, "flow", "Task", "small", _result_of_size(20))
+        storage.store({}, "flow", "Task", "large", _result_of_size(_THRESHOLD * 10))
+
+        deleted, _ = storage.delete_results(["small", "large"])
+        assert deleted == 2
+        assert not storage.conn.exists("small", "large")
+        assert not _is_offloaded(storage, "large")
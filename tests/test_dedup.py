@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of deduplication of task invocations."""
+
+import fakeredis
+import pytest
+from selinon import SelinonTask
+from selinon.errors import Retry
+from selinon.trace import Trace
+
+from thoth.worker.dedup import get_invocation_key
+from thoth.worker.dedup import is_deduplicated
+from thoth.worker.dedup import run_deduplicated
+from thoth.worker.dedup import trace_dedup
+from thoth.worker.storages import ExpiringRedis
+
+
+class ProjectInfoTask:
+    """A task deduplicated by default, only attributes used by deduplication are set."""
+
+    retry = staticmethod(SelinonTask.retry)
+
+    def __init__(self, task_id: str):
+        """Initialize the task with the given id."""
+        self.task_name = "ProjectInfoTask"
+        self.task_id = task_id
+
+
+def _run(task, node_args: dict) -> dict:
+    """Run method of the task."""
+    return {"package_name": node_args["package_name"], "task_id": task.task_id}
+
+
+class TestGetInvocationKey:
+    """Test keys identifying task invocations."""
+
+    def test_same_invocation(self) -> None:
+        """Test the key does not depend on order of node arguments."""
+        assert get_invocation_key("ProjectInfoTask", {"package_name": "flask", "index": "pypi"}) == get_invocation_key(
+            "ProjectInfoTask", {"index": "pypi", "package_name": "flask"}
+        )
+
+    def test_different_node_args(self) -> None:
+        """Test invocations with different node arguments are distinguished."""
+        assert get_invocation_key("ProjectInfoTask", {"package_name": "flask"}) != get_invocation_key(
+            "ProjectInfoTask", {"package_name": "django"}
+        )
+
+    def test_different_task(self) -> None:
+        """Test invocations of different tasks are distinguished."""
+        key = get_invocation_key("ProjectInfoTask", {"package_name": "flask"})
+        assert key.startswith("ProjectInfoTask:")
+        assert key != get_invocation_key("GitHubReadmeTask", {"package_name": "flask"})
+
+    def test_ignored_node_args(self) -> None:
+        """Test node arguments not affecting results are ignored."""
+        node_args = {
+            "package_name": "flask",
+            "run_id": "run-1",
+            "fan_out": "iter_pypi_projects",
+            "resume": True,
+            "profile": True,
+            "incremental": True,
+            "priority": 9,
+            "priority_score": 0.5,
+            "priority_high": True,
+            "owner": "pallets",
+            "repo": "flask",
+        }
+        assert get_invocation_key("GitHubReadmeTask", node_args) == get_invocation_key(
+            "GitHubReadmeTask", {"package_name": "flask"}
+        )
+
+    def test_non_dict_node_args(self) -> None:
+        """Test node arguments which are not a dictionary."""
+        assert get_invocation_key("StackOverflowKeywordsAggregationTask", None) == get_invocation_key(
+            "StackOverflowKeywordsAggregationTask", None
+        )
+        assert get_invocation_key("Task", ["a", "b"]) != get_invocation_key("Task", ["b", "a"])
+
+
+class TestRunDeduplicated:
+    """Test leases and reuse of results of deduplicated invocations."""
+
+    def test_duplicate_retried(self, redis_connection) -> None:
+        """Test a duplicate of a running invocation is retried instead of waiting for it."""
+        run_deduplicated(ProjectInfoTask("first"), _run, {"package_name": "flask"})
+
+        with pytest.raises(Retry):
+            run_deduplicated(ProjectInfoTask("second"), _run, {"package_name": "flask", "run_id": "other"})
+
+        # Other invocations are not affected by the lease.
+        assert run_deduplicated(ProjectInfoTask("third"), _run, {"package_name": "django"})["task_id"] == "third"
+
+    def test_duplicate_reuses_result(self, redis_connection) -> None:
+        """Test a duplicate retried once the first invocation finished reuses its result."""
+        run_deduplicated(ProjectInfoTask("first"), _run, {"package_name": "flask"})
+        trace_dedup(Trace.TASK_END, {"task_id": "first", "task_name": "ProjectInfoTask"})
+
+        result = run_deduplicated(ProjectInfoTask("second"), _run, {"package_name": "flask"})
+        assert is_deduplicated(result)
+        assert result == {"@deduplicated": "first"}
+
+    def test_failed_invocation(self, redis_connection) -> None:
+        """Test the lease of a failed invocation is released and the duplicate is run."""
+
+        def fail(task, node_args):
+            raise ValueError("failed")
+
+        with pytest.raises(ValueError):
+            run_deduplicated(ProjectInfoTask("first"), fail, {"package_name": "flask"})
+
+        assert run_deduplicated(ProjectInfoTask("second"), _run, {"package_name": "flask"})["task_id"] == "second"
+
+    def test_failed_result_store(self, redis_connection) -> None:
+        """Test an invocation whose result was not stored is not marked done."""
+        run_deduplicated(ProjectInfoTask("first"), _run, {"package_name": "flask"})
+        trace_dedup(Trace.TASK_FAILURE, {"task_id": "first", "task_name": "ProjectInfoTask"})
+
+        assert run_deduplicated(ProjectInfoTask("second"), _run, {"package_name": "flask"})["task_id"] == "second"
+
+    def test_copy_result(self) -> None:
+        """Test Redis storage copies the result stored by the invocation a deduplicated run reused."""
+        storage = ExpiringRedis(ttl=60)
+        storage.conn = fakeredis.FakeRedis()
+        storage.store({}, "flow", "ProjectInfoTask", "first", {"package_name": "flask"})
+        storage.store({}, "flow", "ProjectInfoTask", "second", {"@deduplicated": "first"})
+
+        assert storage.retrieve("flow", "ProjectInfoTask", "second") == {"package_name": "flask"}
+        assert storage.conn.ttl("second") > 0
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the index of GitHub repositories."""
+
+import pytest
+from selinon import StoragePool
+
+from thoth.worker.github_index import build_github_index
+from thoth.worker.github_index import get_github_repos
+from thoth.worker.github_index import parse_github_repo
+from thoth.worker.github_index import update_github_repo
+from thoth.worker.storages import ProjectInfoStore
+
+
+class TestParseGitHubRepo:
+    """Test parsing GitHub repositories from home pages of projects."""
+
+    @pytest.mark.parametrize(
+        "home_page,expected",
+        [
+            ("https://github.com/pallets/flask", ("pallets", "flask")),
+            ("https://github.com/pallets/flask/", ("pallets", "flask")),
+            ("http://github.com/pallets/flask/tree/main/docs", ("pallets", "flask")),
+            ("https://github.com/pallets/flask?tab=readme", ("pallets", "flask")),
+            ("https://github.com/pallets", None),
+            ("https://github.com/", None),
+            ("https://github.com//flask", None),
+            ("https://gitlab.com/pallets/flask", None),
+            ("https://www.github.com/pallets/flask", None),
+            ("https://palletsprojects.com/p/flask/", None),
+            ("", None),
+            (None, None),
+        ],
+    )
+    def test_parse_github_repo(self, home_page: str, expected) -> None:
+        """Test owner and repository are parsed only from GitHub URLs."""
+        assert parse_github_repo(home_page) == expected
+
+
+class TestGitHubIndex:
+    """Test updates and reads of the index."""
+
+    def test_not_built(self, redis_connection) -> None:
+        """Test the index is reported as not built."""
+        update_github_repo("flask", {"info": {"home_page": "https://github.com/pallets/flask"}})
+        assert get_github_repos() is None
+
+    def test_update(self, redis_connection) -> None:
+        """Test the index follows home pages of updated projects."""
+        redis_connection.set("thoth:github:index:built", "2020-01-01T00:00:00")
+        assert get_github_repos() == {}
+
+        update_github_repo("flask", {"info": {"home_page": "https://github.com/pallets/flask"}})
+        update_github_repo("django", {"info": {"home_page": "https://github.com/django/django"}})
+        update_github_repo("numpy", {"info": {"home_page": "https://numpy.org"}})
+        assert get_github_repos() == {"flask": ("pallets", "flask"), "django": ("django", "django")}
+
+        update_github_repo("flask", {"info": {"home_page": "https://palletsprojects.com/p/flask/"}})
+        update_github_repo("django", {"info": {}})
+        assert get_github_repos() == {}
+
+    def test_build(self, ceph_adapter, redis_connection, monkeypatch) -> None:
+        """Test the index is built from projections of stored project information and replaces the previous one."""
+        project_info_store = ceph_adapter(ProjectInfoStore, prefix="project-info/", projection_prefix="projection/")
+        monkeypatch.setattr(StoragePool, "get_connected_storage", lambda storage_name: project_info_store)
+        for package_name, home_page in (
+            ("flask", "https://github.com/pallets/flask"),
+            ("numpy", "https://numpy.org"),
+            ("requests", "https://github.com/psf/requests/"),
+        ):
+            document = {"info": {"home_page": home_page}}
+            project_info_store.store({"package_name": package_name}, "flow", "ProjectInfoTask", None, document)
+
+        redis_connection.hset("thoth:github:index", "removed", "owner/repo")
+        assert build_github_index(prefetch=2) == 2
+        assert get_github_repos() == {"flask": ("pallets", "flask"), "requests": ("psf", "requests")}
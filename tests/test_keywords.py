@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of incremental aggregation of keywords."""
+
+import random
+import typing
+
+import pytest
+
+from thoth.worker.tasks.keywords import KeywordsAggregationTask
+
+
+def _aggregate(projects: typing.Dict[str, dict]) -> dict:
+    """Aggregate keywords of all the given projects from scratch."""
+    result = {}
+    for keywords in projects.values():
+        KeywordsAggregationTask.add_keywords(result, keywords)
+    return result
+
+
+def _random_keywords(rng: random.Random) -> dict:
+    """Generate keywords of a single project."""
+    return {f"keyword{i}": rng.randint(1, 5) for i in rng.sample(range(20), rng.randint(0, 8))}
+
+
+class TestKeywordsAggregation:
+    """Test incremental aggregation gives the same result as a full recount."""
+
+    def test_add_subtract(self) -> None:
+        """Test subtracting the only contribution removes keywords."""
+        result = {}
+        KeywordsAggregationTask.add_keywords(result, {"flask": 2, "web": 1})
+        KeywordsAggregationTask.add_keywords(result, {"flask": 1})
+        assert result == {"flask": 3, "web": 1}
+
+        KeywordsAggregationTask.subtract_keywords(result, {"flask": 2, "web": 1})
+        assert result == {"flask": 1}
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_incremental_equals_full(self, seed: int) -> None:
+        """Test applying changes of projects incrementally matches aggregation of the changed projects."""
+        rng = random.Random(seed)
+        projects = {f"project{i}": _random_keywords(rng) for i in range(30)}
+        result = _aggregate(projects)
+
+        for _ in range(5):
+            changed = rng.sample(sorted(projects), 10)
+            for project in changed:
+                keywords = _random_keywords(rng)
+                KeywordsAggregationTask.subtract_keywords(result, projects[project])
+                KeywordsAggregationTask.add_keywords(result, keywords)
+                projects[project] = keywords
+
+            assert result == _aggregate(projects)
+
+    def test_new_project(self) -> None:
+        """Test projects without a previous contribution are only added."""
+        projects = {"flask": {"web": 2}}
+        result = _aggregate(projects)
+
+        projects["django"] = {"web": 1, "orm": 1}
+        KeywordsAggregationTask.subtract_keywords(result, {})
+        KeywordsAggregationTask.add_keywords(result, projects["django"])
+        assert result == _aggregate(projects)
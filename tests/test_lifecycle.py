@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of deleting consumed temporary results."""
+
+import pytest
+from selinon import Config
+from selinon import StoragePool
+from selinon.trace import Trace
+
+from thoth.worker import lifecycle
+from thoth.worker.lifecycle import register_consumed
+from thoth.worker.lifecycle import trace_lifecycle
+from thoth.worker.storages import ExpiringRedis
+
+
+@pytest.fixture
+def storage(redis_connection, monkeypatch) -> ExpiringRedis:
+    """Storage of results of PyPIProjectKeywordsTask."""
+    storage = ExpiringRedis(ttl=60)
+    storage.conn = redis_connection
+    monkeypatch.setattr(Config, "task2storage_mapping", {"PyPIProjectKeywordsTask": "TemporaryStorage"})
+    monkeypatch.setattr(StoragePool, "get_connected_storage", lambda storage_name: storage)
+    return storage
+
+
+def _flow_end(dispatcher_id: str, parent: dict = None, finished_nodes: dict = None) -> None:
+    """Report end of a flow to the trace function."""
+    trace_lifecycle(
+        Trace.FLOW_END,
+        {
+            "flow_name": "flow",
+            "dispatcher_id": dispatcher_id,
+            "parent": parent,
+            "state": {"finished_nodes": finished_nodes or {}},
+        },
+    )
+
+
+class TestTraceLifecycle:
+    """Test consumed results are deleted once the flow ends."""
+
+    def test_cleanup(self, storage: ExpiringRedis, redis_connection) -> None:
+        """Test registered results are deleted and reported once the flow running the reducer ends."""
+        for task_id in ("task-1", "task-2", "task-3"):
+            storage.store({}, "flow", "PyPIProjectKeywordsTask", task_id, {"project": task_id})
+        register_consumed("dispatcher", "PyPIProjectKeywordsTask", ["task-1", "task-2"])
+
+        _flow_end("dispatcher", parent={"_parent": "parent-dispatcher"}, finished_nodes={"KeywordsAggregationTask": []})
+        assert not redis_connection.exists("task-1")
+        assert not redis_connection.exists("task-2")
+        assert redis_connection.exists("task-3")
+        assert not redis_connection.keys("thoth:lifecycle:dispatcher*")
+        assert redis_connection.hget("thoth:lifecycle:report", "TemporaryStorage:keys") == b"2"
+
+    def test_top_level_flow(self, storage: ExpiringRedis, redis_connection) -> None:
+        """Test the top-level flow is cleaned up regardless of tasks run in it."""
+        storage.store({}, "flow", "PyPIProjectKeywordsTask", "task-1", {"project": "flask"})
+        register_consumed("dispatcher", "PyPIProjectKeywordsTask", ["task-1"])
+
+        _flow_end("dispatcher")
+        assert not redis_connection.exists("task-1")
+
+    def test_subflow_skipped(self, redis_connection, monkeypatch) -> None:
+        """Test subflows without any reducer do not query registrations."""
+        cleaned_up = []
+        monkeypatch.setattr(lifecycle, "cleanup_consumed", cleaned_up.append)
+
+        _flow_end("dispatcher", parent={"ProjectInfoTask": ["task-1"]}, finished_nodes={"ProjectInfoTask": ["task"]})
+        trace_lifecycle(Trace.FLOW_FAILURE, {"flow_name": "flow", "dispatcher_id": "failed"})
+        assert cleaned_up == []
+
+        _flow_end("reducer", parent={"_flow": "x"}, finished_nodes={"Project2VecCreationTask": ["task"]})
+        assert cleaned_up == ["reducer"]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of parallel sharded listing of objects stored on Ceph."""
+
+import pytest
+
+from thoth.storages.ceph import CephStore
+from thoth.worker.listing import drop_cached_document_listing
+from thoth.worker.listing import get_cached_document_listing
+from thoth.worker.listing import get_shards
+from thoth.worker.listing import iter_document_listing
+from thoth.worker.listing import iter_sharded_listing
+from thoth.worker.storages import ReadmeStore
+
+# Keys on, right before and right after shard boundaries, and keys outside of boundary characters.
+_KEYS = ["!first", "a", "a-", "aa", "a/b", "b", "l", "lz", "m", "m0", "n", "z", "zz", "~last"]
+_SHARD_CHARACTERS = "am"
+
+
+@pytest.fixture
+def ceph(ceph_adapter) -> CephStore:
+    """Ceph adapter with keys around shard boundaries stored."""
+    ceph = ceph_adapter(ReadmeStore, prefix="listing/").ceph
+    for key in _KEYS:
+        ceph.store_blob(b"", key)
+    # Not listed, outside of the prefix.
+    ceph_adapter(ReadmeStore, prefix="listing-other/").ceph.store_blob(b"", "a")
+    return ceph
+
+
+class TestGetShards:
+    """Test computation of shard boundaries."""
+
+    def test_shards(self) -> None:
+        """Test shards cover the whole keyspace, boundary characters are deduplicated and sorted."""
+        assert get_shards("p/", "mam") == [(None, "p/a"), ("p/a", "p/m"), ("p/m", None)]
+
+
+class TestShardedListing:
+    """Test listing of keys in shards."""
+
+    @pytest.mark.parametrize("workers", [1, 2, 16])
+    def test_shard_boundaries(self, ceph: CephStore, workers: int) -> None:
+        """Test each key is listed exactly once, in the shard with the boundary range (lower, upper] it falls in."""
+        listed = {}
+        for shard, keys in iter_sharded_listing(ceph, workers=workers, shard_characters=_SHARD_CHARACTERS):
+            listed.setdefault(shard, [])
+            if keys is not None:
+                listed[shard].extend(keys)
+
+        assert listed == {
+            (None, "listing/a"): ["!first", "a"],
+            ("listing/a", "listing/m"): ["a-", "a/b", "aa", "b", "l", "lz", "m"],
+            ("listing/m", None): ["m0", "n", "z", "zz", "~last"],
+        }
+
+    @pytest.mark.parametrize("workers", [0, 4])
+    def test_document_listing(self, ceph: CephStore, workers: int) -> None:
+        """Test sequential and concurrent listings agree."""
+        listing = iter_document_listing(ceph, workers=workers, shard_characters=_SHARD_CHARACTERS)
+        assert sorted(listing) == sorted(_KEYS)
+
+    def test_consumer_stops(self, ceph: CephStore) -> None:
+        """Test the listing can be abandoned before all the shards are listed."""
+        listing = iter_sharded_listing(ceph, workers=1)
+        assert next(listing) is not None
+        listing.close()
+
+
+class TestCachedListing:
+    """Test listing cached in a manifest."""
+
+    def test_manifest(self, ceph: CephStore) -> None:
+        """Test shards are listed again only once their listing in the manifest is too old."""
+        listing = get_cached_document_listing(ceph, 3600, shard_characters=_SHARD_CHARACTERS)
+        assert sorted(listing) == sorted(_KEYS)
+
+        ceph.store_blob(b"", "new")
+        assert "new" not in get_cached_document_listing(ceph, 3600, shard_characters=_SHARD_CHARACTERS)
+        assert "new" in get_cached_document_listing(ceph, 0, shard_characters=_SHARD_CHARACTERS)
+
+        # The manifest is stored in a sibling prefix, it is never listed itself.
+        assert "manifest.json" not in " ".join(iter_document_listing(ceph, workers=0))
+
+    def test_shard_characters_changed(self, ceph: CephStore) -> None:
+        """Test the manifest is dropped if shard boundaries change."""
+        get_cached_document_listing(ceph, 3600, shard_characters=_SHARD_CHARACTERS)
+        ceph.store_blob(b"", "new")
+        assert "new" in get_cached_document_listing(ceph, 3600, shard_characters="n")
+
+    def test_drop(self, ceph: CephStore) -> None:
+        """Test dropping the manifest lists all the shards again."""
+        get_cached_document_listing(ceph, 3600, shard_characters=_SHARD_CHARACTERS)
+        ceph.store_blob(b"", "new")
+        drop_cached_document_listing(ceph)
+        assert "new" in get_cached_document_listing(ceph, 3600, shard_characters=_SHARD_CHARACTERS)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the inverted index over error lines of Travis CI logs."""
+
+import typing
+
+import pytest
+
+from thoth.worker.log_index import LogIndex
+from thoth.worker.log_index import extract_segment
+from thoth.worker.log_index import merge_segments
+
+
+def _job(job_id: int, log: str) -> dict:
+    """Create a harvested job with the given log."""
+    return {"organization": "thoth-station", "repo": "worker", "build": job_id // 10, "job": job_id, "log": log}
+
+
+_FIRST_SEGMENT = [
+    _job(11, "Collecting flask\nModuleNotFoundError: No module named 'flask'\nDone in 12s"),
+    _job(12, "ERROR: No matching distribution found for tensorflow==2.1.0\n"),
+    _job(23, "\u001b[31mImportError: No module named yaml\u001b[0m\n"),
+]
+_SECOND_SEGMENT = [
+    _job(34, "Traceback (most recent call last):\nModuleNotFoundError: No module named 'numpy'\n"),
+    _job(45, "Build succeeded\nno module named flask is only a warning here\n"),
+]
+
+
+def _merge(segments: typing.List[list], blobs: dict, shards: int = 4) -> dict:
+    """Merge the given segments into blobs kept in the given dictionary, each segment in a new generation."""
+    manifest = None
+    for jobs in segments:
+        manifest = merge_segments([extract_segment(jobs)], manifest, blobs.__getitem__, blobs.__setitem__, shards)
+
+    return manifest
+
+
+class TestMergeSegments:
+    """Test merging segments into generations of the index."""
+
+    def test_first_generation(self) -> None:
+        """Test the first generation is created from segments."""
+        blobs = {}
+        manifest = _merge([_FIRST_SEGMENT], blobs)
+
+        assert manifest["generation"] == 0
+        assert manifest["shards"] == 4
+        assert manifest["jobs"] == 3
+        assert manifest["segments"] == 1
+        # Postings and job error lines of each shard.
+        assert len(blobs) == 2 * 4
+
+    def test_next_generation(self) -> None:
+        """Test the next generation keeps previous postings and jobs, number of shards is kept."""
+        blobs = {}
+        manifest = _merge([_FIRST_SEGMENT, _SECOND_SEGMENT], blobs)
+
+        assert manifest["generation"] == 1
+        assert manifest["shards"] == 4
+        assert manifest["jobs"] == 5
+        assert manifest["segments"] == 2
+        index = LogIndex(manifest, blobs.__getitem__)
+        assert index.search_term("modulenotfounderror") == [11, 34]
+
+    def test_shards_kept(self) -> None:
+        """Test number of shards of the previous generation is kept."""
+        blobs = {}
+        manifest = merge_segments([extract_segment(_FIRST_SEGMENT)], None, blobs.__getitem__, blobs.__setitem__, 2)
+        manifest = merge_segments([], manifest, blobs.__getitem__, blobs.__setitem__, 8)
+
+        assert manifest["generation"] == 1
+        assert manifest["shards"] == 2
+        assert manifest["jobs"] == 3
+
+
+class TestLogIndex:
+    """Test term and phrase lookups."""
+
+    @pytest.fixture
+    def index(self) -> LogIndex:
+        """Create an index of two generations."""
+        blobs = {}
+        return LogIndex(_merge([_FIRST_SEGMENT, _SECOND_SEGMENT], blobs), blobs.__getitem__)
+
+    def test_search_term(self, index: LogIndex) -> None:
+        """Test terms are normalized before lookup."""
+        assert index.search_term("ModuleNotFoundError") == [11, 34]
+        assert index.search_term("tensorflow") == [12]
+        assert index.search_term("missing") == []
+
+    def test_search_phrase(self, index: LogIndex) -> None:
+        """Test candidates are verified against error lines, not only their tokens."""
+        result = index.search_phrase("No module named")
+        assert [job["job"] for job in result] == [11, 23, 34]
+        assert result[0]["lines"] == ["modulenotfounderror no module named flask"]
+        assert result[0]["repo"] == "worker"
+        # Job 45 states all the tokens but not in an error line.
+        assert [job["job"] for job in index.search_phrase("named flask")] == [11]
+
+    def test_search_phrase_order(self, index: LogIndex) -> None:
+        """Test tokens need to be present in the given order."""
+        assert index.search_phrase("named no module") == []
+
+    def test_search_phrase_numbers(self, index: LogIndex) -> None:
+        """Test numbers in phrases are normalized the same way as in logs."""
+        result = index.search_phrase("tensorflow==2.2.0")
+        assert [job["job"] for job in result] == [12]
+
+    def test_search_phrase_limit(self, index: LogIndex) -> None:
+        """Test number of reported jobs is limited."""
+        assert [job["job"] for job in index.search_phrase("no module named", limit=2)] == [11, 23]
+
+    def test_search_phrase_no_token(self, index: LogIndex) -> None:
+        """Test phrases with no indexed token are reported."""
+        with pytest.raises(ValueError):
+            index.search_phrase("0 1 a")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of prioritization of projects in fan-out flows."""
+
+import io
+
+from thoth.worker.priority import HIGH_PRIORITY
+from thoth.worker.priority import get_scores
+from thoth.worker.priority import load_scores
+from thoth.worker.priority import prioritize
+from thoth.worker.priority import score_dependents
+from thoth.worker.priority import score_recency
+from thoth.worker.priority import store_scores
+
+_ITEMS = [{"package_name": name} for name in ("Unscored", "flask", "Django", "other", "requests")]
+
+
+class TestScores:
+    """Test computation and storing of scores."""
+
+    def test_dependents(self) -> None:
+        """Test dependencies are counted once per dependent project, names are normalized."""
+        documents = [
+            {"info": {"name": "Flask", "requires_dist": ["Werkzeug>=0.15", "Jinja2 (>=2.10.1)", "werkzeug[watchdog]"]}},
+            {"info": {"name": "Django", "requires_dist": ["pytz", "sqlparse; extra == 'x'", "django-foo"]}},
+            {"info": {"name": "self", "requires_dist": ["Self"]}},
+            {"info": {"name": "empty", "requires_dist": None}},
+        ]
+        assert score_dependents(documents) == {"werkzeug": 1, "jinja2": 1, "pytz": 1, "sqlparse": 1, "django-foo": 1}
+
+    def test_recency(self) -> None:
+        """Test the latest upload of any release is used."""
+        documents = [
+            {
+                "info": {"name": "Flask"},
+                "releases": {
+                    "1.0": [{"upload_time": "2018-04-26T20:15:12"}],
+                    "1.1": [{"upload_time": "2019-07-04T20:12:54"}, {"upload_time": None}],
+                },
+            },
+            {"info": {"name": "no-releases"}, "releases": {}},
+        ]
+        assert score_recency(documents) == {"flask": 1562271174.0}
+
+    def test_load(self) -> None:
+        """Test scores are loaded from CSV, a header and malformed lines are skipped."""
+        csv_file = io.StringIO("project,downloads\nFlask,10\nbroken\nDjango,x\nrequests,2.5\n")
+        assert load_scores(csv_file) == {"flask": 10.0, "requests": 2.5}
+
+    def test_store(self, redis_connection) -> None:
+        """Test stored scores replace the previous ones."""
+        store_scores("downloads", {"flask": 1.0, "django": 2.0})
+        store_scores("downloads", {"requests": 3.0})
+        assert get_scores("downloads") == {"requests": 3.0}
+
+        store_scores("downloads", {})
+        assert get_scores("downloads") == {}
+
+
+class TestPrioritize:
+    """Test ordering of fan-out items."""
+
+    def test_prioritize(self, redis_connection) -> None:
+        """Test scored items go first, top-ranked ones with high priority, unscored ones keep listing order."""
+        store_scores("downloads", {"requests": 3.0, "django": 2.0, "flask": 2.0})
+        items = prioritize({"priority_score": "downloads", "priority_high": 2}, _ITEMS)
+        assert items == [
+            {"package_name": "requests", "priority": HIGH_PRIORITY},
+            {"package_name": "flask", "priority": HIGH_PRIORITY},
+            {"package_name": "Django"},
+            {"package_name": "Unscored"},
+            {"package_name": "other"},
+        ]
+
+    def test_disabled(self, redis_connection) -> None:
+        """Test items are kept in listing order if prioritization is off or no scores are computed."""
+        store_scores("downloads", {"requests": 3.0})
+        assert prioritize({"priority_score": ""}, _ITEMS) == _ITEMS
+        assert prioritize({"priority_score": "unknown"}, _ITEMS) == _ITEMS
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the stored project2vec model and inputs of its vectors used in incremental runs."""
+
+import pytest
+
+from thoth.worker.exceptions import NotFoundException
+from thoth.worker.storages import Project2VecModelStore
+from thoth.worker.tasks.project2vec import Project2VecTask
+
+
+@pytest.fixture
+def model_store(ceph_adapter, redis_connection, monkeypatch) -> Project2VecModelStore:
+    """Model store mirroring hashes of inputs in small chunks."""
+    monkeypatch.setattr(Project2VecModelStore, "_INPUTS_HASHES_CHUNK_SIZE", 2)
+    return ceph_adapter(Project2VecModelStore)
+
+
+class TestInputsHash:
+    """Test hashes of inputs identifying unchanged vectors."""
+
+    def test_deterministic(self) -> None:
+        """Test the hash depends on vocabulary version and documents only."""
+        get_inputs_hash = Project2VecTask.get_inputs_hash
+        version = Project2VecTask.get_vocabulary_version(["flask", "web"])
+        assert get_inputs_hash(version, ["a", None]) == get_inputs_hash(version, ["a", ""])
+        assert get_inputs_hash(version, ["a"]) != get_inputs_hash(version, ["a", ""])
+        assert get_inputs_hash(version, ["ab", ""]) != get_inputs_hash(version, ["a", "b"])
+        other_version = Project2VecTask.get_vocabulary_version(["flask"])
+        assert get_inputs_hash(version, ["a"]) != get_inputs_hash(other_version, ["a"])
+
+
+class TestProject2VecModelStore:
+    """Test storing the model together with hashes of its inputs."""
+
+    def test_store(self, model_store: Project2VecModelStore) -> None:
+        """Test the model and hashes of inputs are stored, hashes are mirrored to Redis."""
+        inputs = {"vocabulary_version": "v1", "projects": {"django": "h1", "flask": "h2", "numpy": "h3"}}
+        model = (["django", "flask", "numpy"], [[0, 1], [1, 1], [0, 0]], inputs)
+        model_store.store(None, "flow", "Project2VecCreationTask", None, model)
+
+        assert model_store.retrieve_model() == (["django", "flask", "numpy"], [[0, 1], [1, 1], [0, 0]])
+        assert model_store.retrieve_inputs()["projects"] == {"django": "h1", "flask": "h2", "numpy": "h3"}
+        assert model_store.retrieve_inputs_hash("flask") == "h2"
+        assert model_store.retrieve_inputs_hash("scipy") is None
+
+    def test_hashes_replaced(self, model_store: Project2VecModelStore, redis_connection) -> None:
+        """Test hashes of projects not present in the new model are not kept."""
+        inputs = {"vocabulary_version": "v1", "projects": {"django": "h1", "flask": "h2", "numpy": "h3"}}
+        model = (["django", "flask", "numpy"], [[0], [1], [0]], inputs)
+        model_store.store(None, "flow", "Project2VecCreationTask", None, model)
+        inputs = {"vocabulary_version": "v1", "projects": {"flask": "h4"}}
+        model_store.store(None, "flow", "Project2VecCreationTask", None, (["flask"], [[1]], inputs))
+
+        assert model_store.retrieve_inputs_hash("flask") == "h4"
+        assert model_store.retrieve_inputs_hash("django") is None
+        assert not redis_connection.exists("thoth:project2vec:inputs:tmp")
+
+        model_store.store(None, "flow", "Project2VecCreationTask", None, ([], []))
+        assert model_store.retrieve_inputs_hash("flask") is None
+
+    def test_not_stored(self, model_store: Project2VecModelStore) -> None:
+        """Test missing model is reported."""
+        with pytest.raises(NotFoundException):
+            model_store.retrieve_model()
+        with pytest.raises(NotFoundException):
+            model_store.retrieve_inputs()
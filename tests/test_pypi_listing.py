@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of chunked listings of PyPI projects and streaming subflows spawned from them."""
+
+import pytest
+
+from thoth.storages.exceptions import NotFoundError
+
+from thoth.worker import progress
+from thoth.worker.foreach.pypi import iter_pypi_projects
+from thoth.worker.priority import store_scores
+from thoth.worker.progress import get_progress
+from thoth.worker.storages import PyPIListingStore
+
+
+class _StoragePool:
+    """Storage pool as passed to foreach functions."""
+
+    def __init__(self, listing_store: PyPIListingStore, manifest: dict):
+        """Initialize the storage pool with the listing produced by PyPIListingTask."""
+        self.listing_store = listing_store
+        self.manifest = manifest
+
+    def get_connected_storage(self, storage_name: str) -> PyPIListingStore:
+        """Get the listing store."""
+        assert storage_name == "PyPIListingStore"
+        return self.listing_store
+
+    def get(self, task_name: str) -> dict:
+        """Get the manifest of the listing as the result of PyPIListingTask."""
+        assert task_name == "PyPIListingTask"
+        return self.manifest
+
+
+@pytest.fixture
+def listing_store(ceph_adapter, monkeypatch) -> PyPIListingStore:
+    """A listing store with small chunks."""
+    monkeypatch.setattr(PyPIListingStore, "_CHUNK_SIZE", 2)
+    return ceph_adapter(PyPIListingStore)
+
+
+def _chunk_exists(listing_store: PyPIListingStore, listing_id: str) -> bool:
+    """Check whether the first chunk of the given listing is stored."""
+    try:
+        listing_store._retrieve_document(listing_store._get_chunk_id(listing_id, 0))
+    except NotFoundError:
+        return False
+    return True
+
+
+class TestPyPIListingStore:
+    """Test storing listings in chunks."""
+
+    def test_store_listing(self, listing_store: PyPIListingStore) -> None:
+        """Test names are read back chunk by chunk in listing order."""
+        names = ["flask", "django", "numpy", "scipy", "requests"]
+        manifest = listing_store.store_listing("first", iter(names))
+        assert manifest == {"listing_id": "first", "chunks": 3, "projects": 5}
+        assert list(listing_store.iter_listing(manifest)) == names
+
+    def test_previous_listing_kept(self, listing_store: PyPIListingStore) -> None:
+        """Test the previous listing is kept for a generation, older listings are deleted."""
+        first = listing_store.store_listing("first", iter(["flask", "django", "numpy"]))
+        listing_store.store_listing("second", iter(["flask"]))
+        # Flows spawned from the first listing can still read it.
+        assert list(listing_store.iter_listing(first)) == ["flask", "django", "numpy"]
+
+        listing_store.store_listing("third", iter(["django"]))
+        assert not _chunk_exists(listing_store, "first")
+        assert _chunk_exists(listing_store, "second")
+        assert _chunk_exists(listing_store, "third")
+
+    def test_same_listing_stored_again(self, listing_store: PyPIListingStore) -> None:
+        """Test storing the same listing again (a retried task) does not delete it nor the previous one."""
+        listing_store.store_listing("first", iter(["flask"]))
+        listing_store.store_listing("second", iter(["django"]))
+        listing_store.store_listing("second", iter(["django"]))
+        assert _chunk_exists(listing_store, "first")
+        assert _chunk_exists(listing_store, "second")
+
+
+class TestIterPyPIProjects:
+    """Test spawning subflows from the stored listing."""
+
+    def test_prioritized(self, listing_store: PyPIListingStore, redis_connection) -> None:
+        """Test projects with a score go first, the top-ranked with high priority, others follow in listing order."""
+        manifest = listing_store.store_listing("listing", iter(["a", "b", "c", "d", "e"]))
+        store_scores("test", {"d": 2.0, "b": 1.0, "c": 3.0})
+        node_args = {"run_id": "run", "priority_score": "test", "priority_high": 1}
+
+        items = list(iter_pypi_projects(_StoragePool(listing_store, manifest), node_args))
+        assert [item["package_name"] for item in items] == ["c", "d", "b", "a", "e"]
+        assert [item.get("priority") for item in items] == ["high", None, None, None, None]
+        assert all(item["run_id"] == "run" and item["fan_out"] == "iter_pypi_projects" for item in items)
+
+        progress = get_progress("run")
+        assert progress["spawned"] == 5
+        assert progress["high_priority"]["spawned"] == 1
+
+    def test_streamed(self, listing_store: PyPIListingStore, redis_connection, monkeypatch) -> None:
+        """Test chunks of the listing are read as subflows are spawned, recorded in batches."""
+        monkeypatch.setattr(progress, "_BATCH_SIZE", 2)
+        manifest = listing_store.store_listing("listing", iter(["a", "b", "c", "d", "e"]))
+        retrieved = []
+        retrieve_document = listing_store._retrieve_document
+
+        def _retrieve_document(object_key):
+            retrieved.append(object_key)
+            return retrieve_document(object_key)
+
+        monkeypatch.setattr(listing_store, "_retrieve_document", _retrieve_document)
+        items = iter_pypi_projects(_StoragePool(listing_store, manifest), {"run_id": "run", "priority_score": ""})
+        assert not retrieved
+        assert next(items)["package_name"] == "a"
+        assert len(retrieved) == 1
+        assert [item["package_name"] for item in items] == ["b", "c", "d", "e"]
+        assert len(retrieved) == 3
+        assert progress.get_progress("run")["spawned"] == 5
+
+    def test_resume(self, listing_store: PyPIListingStore, redis_connection) -> None:
+        """Test projects processed before the run was interrupted are skipped and counted as completed."""
+        manifest = listing_store.store_listing("listing", iter(["a", "b", "c"]))
+        redis_connection.sadd("thoth:checkpoint:run", "b")
+        node_args = {"run_id": "run", "resume": True, "priority_score": ""}
+
+        items = list(iter_pypi_projects(_StoragePool(listing_store, manifest), node_args))
+        assert [item["package_name"] for item in items] == ["a", "c"]
+
+        progress = get_progress("run")
+        assert progress["spawned"] == 3
+        assert progress["completed"] == 1
+        assert progress["resumed"] == 1
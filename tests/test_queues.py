@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of queue statistics used for autoscaling."""
+
+import json
+
+import fakeredis
+import pytest
+from celery.signals import before_task_publish
+
+from thoth.worker.queues import QueueMonitor
+from thoth.worker.queues import get_published_at
+from thoth.worker.queues import RedisBroker
+from thoth.worker.queues import record_processed
+from thoth.worker.queues import recommend_replicas
+
+
+class _Clock:
+    """A clock advanced explicitly by tests."""
+
+    def __init__(self):
+        """Start at zero."""
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """Get the current time."""
+        return self.now
+
+
+class TestRedisBroker:
+    """Test reading queue statistics from the Redis broker."""
+
+    def test_get_depths(self) -> None:
+        """Test messages of all priorities are counted."""
+        connection = fakeredis.FakeRedis()
+        connection.lpush("q1", b"m1", b"m2")
+        connection.lpush("q1\x06\x163", b"m3")
+        connection.lpush("q1\x06\x169", b"m4", b"m5")
+        connection.lpush("other", b"m6")
+
+        assert RedisBroker(connection).get_depths(["q1", "q2"]) == {"q1": 5, "q2": 0}
+
+    def test_get_depths_no_queues(self) -> None:
+        """Test no queues are queried if no queues are given."""
+        assert RedisBroker(fakeredis.FakeRedis()).get_depths([]) == {}
+
+    def test_get_oldest(self) -> None:
+        """Test the oldest message is the rightmost one as messages are pushed left."""
+        connection = fakeredis.FakeRedis()
+        connection.lpush("q1", b"first", b"second")
+        connection.lpush("q1\x06\x163", b"priority")
+
+        assert RedisBroker(connection).get_oldest("q1") == b"first"
+
+    def test_get_oldest_priority(self) -> None:
+        """Test messages with non-default priority are considered if the default list is empty."""
+        connection = fakeredis.FakeRedis()
+        connection.lpush("q1\x06\x166", b"first", b"second")
+        connection.lpush("q1\x06\x169", b"last")
+
+        assert RedisBroker(connection).get_oldest("q1") == b"first"
+
+    def test_get_oldest_empty(self) -> None:
+        """Test None is returned for an empty queue."""
+        assert RedisBroker(fakeredis.FakeRedis()).get_oldest("q1") is None
+
+    def test_from_url_unsupported(self) -> None:
+        """Test only Redis brokers are supported."""
+        with pytest.raises(ValueError):
+            RedisBroker.from_url("amqp://localhost:5672")
+
+
+class TestRecommendReplicas:
+    """Test recommendation of number of replicas."""
+
+    def test_keep_up_and_drain(self) -> None:
+        """Test replicas keep up with the enqueue rate and drain the backlog in the target time."""
+        # One replica for the enqueue rate, two for draining 1200 messages in 600 seconds.
+        assert recommend_replicas(1200, 1.0, 1.0, target_seconds=600, min_replicas=1, max_replicas=20) == 3
+
+    def test_exact(self) -> None:
+        """Test no extra replica is recommended due to rounding errors."""
+        assert recommend_replicas(0, 0.3, 0.1, target_seconds=600, min_replicas=1, max_replicas=20) == 3
+
+    def test_min_replicas(self) -> None:
+        """Test the lower bound is respected for idle queues."""
+        assert recommend_replicas(0, 0.0, 1.0, target_seconds=600, min_replicas=2, max_replicas=20) == 2
+
+    def test_max_replicas(self) -> None:
+        """Test the upper bound is respected for large backlogs."""
+        assert recommend_replicas(10 ** 6, 100.0, 1.0, target_seconds=600, min_replicas=1, max_replicas=20) == 20
+
+    def test_negative_enqueue_rate(self) -> None:
+        """Test a negative enqueue rate does not reduce replicas needed to drain the backlog."""
+        assert recommend_replicas(600, -5.0, 1.0, target_seconds=600, min_replicas=0, max_replicas=20) == 1
+
+
+def _message(published_at=None) -> bytes:
+    """Create a message as stored by kombu Redis transport."""
+    headers = {"task": "selinon.SelinonTaskEnvelope", "id": "task-id"}
+    if published_at is not None:
+        headers["thoth_published_at"] = published_at
+    return json.dumps({"body": "", "headers": headers, "properties": {}}).encode()
+
+
+class TestPublishedAt:
+    """Test time of publishing stated in message headers."""
+
+    def test_header_set(self) -> None:
+        """Test the time of publishing is stated in headers of messages published by workers."""
+        headers = {"task": "selinon.SelinonTaskEnvelope"}
+        before_task_publish.send(sender="selinon.SelinonTaskEnvelope", body=(), headers=headers)
+        assert get_published_at(json.dumps({"headers": headers}).encode()) == headers["thoth_published_at"]
+
+    @pytest.mark.parametrize("message", [_message(), b"not a message", b"[]", json.dumps({"headers": None}).encode()])
+    def test_not_stated(self, message: bytes) -> None:
+        """Test messages not stating time of publishing."""
+        assert get_published_at(message) is None
+
+
+class TestQueueMonitor:
+    """Test sampling of queue statistics."""
+
+    def test_sample(self) -> None:
+        """Test rates, ages and recommendations are computed from consecutive samples."""
+        broker_connection = fakeredis.FakeRedis()
+        bookkeeping = fakeredis.FakeRedis()
+        clock = _Clock()
+        monitor = QueueMonitor(RedisBroker(broker_connection), {"worker": ["q1"]}, bookkeeping, clock)
+        broker_connection.lpush("q1", *[f"m{idx}".encode() for idx in range(10)])
+
+        report = monitor.sample()
+        assert report["queues"]["q1"] == {
+            "depth": 10,
+            "enqueue_rate": None,
+            "dequeue_rate": None,
+            "oldest_age": 0.0,
+            "replica_rate": None,
+        }
+        assert report["groups"]["worker"]["replica_rate"] == 1.0
+
+        # 4 messages processed in 2 seconds each, 6 new messages enqueued.
+        for _ in range(4):
+            broker_connection.rpop("q1")
+            record_processed(bookkeeping, "q1", 2.0)
+        broker_connection.lpush("q1", *[f"n{idx}".encode() for idx in range(6)])
+        clock.now = 10.0
+
+        report = monitor.sample()
+        queue_stats = report["queues"]["q1"]
+        assert queue_stats["depth"] == 12
+        assert queue_stats["dequeue_rate"] == pytest.approx(0.4)
+        assert queue_stats["enqueue_rate"] == pytest.approx(0.6)
+        assert queue_stats["replica_rate"] == pytest.approx(0.5)
+        # The oldest message was consumed, a new one is the oldest since this sample.
+        assert queue_stats["oldest_age"] == 0.0
+
+        group_stats = report["groups"]["worker"]
+        assert group_stats["depth"] == 12
+        assert group_stats["replica_rate"] == pytest.approx(0.5)
+        assert group_stats["recommended_replicas"] == recommend_replicas(12, 0.6, 0.5)
+
+        clock.now = 15.0
+        report = monitor.sample()
+        assert report["queues"]["q1"]["oldest_age"] == 5.0
+        assert report["queues"]["q1"]["enqueue_rate"] == 0.0
+        assert report["queues"]["q1"]["dequeue_rate"] == 0.0
+
+    def test_sample_published_at(self) -> None:
+        """Test age of the oldest message is computed from the time it was published."""
+        broker_connection = fakeredis.FakeRedis()
+        clock = _Clock()
+        clock.now = 100.0
+        monitor = QueueMonitor(RedisBroker(broker_connection), {"worker": ["q1"]}, fakeredis.FakeRedis(), clock)
+        broker_connection.lpush("q1", _message(published_at=40.0), _message(published_at=90.0))
+
+        assert monitor.sample()["queues"]["q1"]["oldest_age"] == 60.0
+
+        broker_connection.rpop("q1")
+        clock.now = 110.0
+        assert monitor.sample()["queues"]["q1"]["oldest_age"] == 20.0
+
+    def test_sample_empty(self) -> None:
+        """Test sampling empty queues with no processed messages."""
+        monitor = QueueMonitor(RedisBroker(fakeredis.FakeRedis()), {"worker": ["q1"]}, fakeredis.FakeRedis(), _Clock())
+
+        report = monitor.sample()
+        assert report["queues"]["q1"]["depth"] == 0
+        assert report["queues"]["q1"]["oldest_age"] is None
+        assert report["groups"]["worker"]["oldest_age"] is None
+        assert report["groups"]["worker"]["recommended_replicas"] == recommend_replicas(0, 0.0, 1.0)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the retry policy for transient failures."""
+
+import email.utils
+import time
+import typing
+
+import botocore.exceptions
+import pytest
+import requests
+from selinon import FatalTaskError
+
+from thoth.worker import retry
+from thoth.worker.retry import call_with_retry
+from thoth.worker.retry import get_retry_after
+from thoth.worker.retry import is_retryable
+from thoth.worker.retry import run_with_retry_budget
+
+
+def _http_error(status_code: int, **headers) -> requests.exceptions.HTTPError:
+    """Create an HTTP error with a response of the given status code and headers."""
+    response = requests.models.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    return requests.exceptions.HTTPError(response=response)
+
+
+def _client_error(code: str, status_code: int = 400) -> botocore.exceptions.ClientError:
+    """Create a Ceph error with the given error code."""
+    return botocore.exceptions.ClientError(
+        {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status_code}}, "GetObject"
+    )
+
+
+def _raising(exc: Exception) -> typing.Callable[[], None]:
+    """Create an operation always failing with the given error."""
+
+    def func() -> None:
+        raise exc
+
+    return func
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list:
+    """Record delays instead of sleeping."""
+    recorded = []
+    monkeypatch.setattr(retry.time, "sleep", recorded.append)
+    return recorded
+
+
+class TestIsRetryable:
+    """Test classification of errors."""
+
+    @pytest.mark.parametrize(
+        "exc,expected",
+        [
+            (_http_error(503), True),
+            (_http_error(429), True),
+            (_http_error(403, **{"X-RateLimit-Remaining": "0"}), True),
+            (_http_error(403), False),
+            (_http_error(404), False),
+            (requests.exceptions.ConnectionError(), True),
+            (requests.exceptions.ReadTimeout(), True),
+            (_client_error("SlowDown", 503), True),
+            (_client_error("InternalError", 500), True),
+            (_client_error("NoSuchKey", 404), False),
+            (FatalTaskError("fatal"), False),
+            (ValueError("bug"), False),
+        ],
+    )
+    def test_is_retryable(self, exc: Exception, expected: bool) -> None:
+        """Test transient errors are retryable, anything else is fatal."""
+        assert is_retryable(exc) is expected
+
+
+class TestGetRetryAfter:
+    """Test time to wait requested by the server."""
+
+    def test_seconds(self) -> None:
+        """Test Retry-After stated in seconds."""
+        assert get_retry_after(_http_error(503, **{"Retry-After": "7"})) == 7.0
+
+    def test_date(self) -> None:
+        """Test Retry-After stated as a date."""
+        retry_after = email.utils.formatdate(time.time() + 60, usegmt=True)
+        assert 50 < get_retry_after(_http_error(503, **{"Retry-After": retry_after})) <= 60
+
+    def test_malformed(self) -> None:
+        """Test malformed Retry-After is ignored."""
+        assert get_retry_after(_http_error(503, **{"Retry-After": "soon"})) is None
+
+    def test_rate_limit_reset(self) -> None:
+        """Test GitHub rate limit reset is honored."""
+        headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) + 30)}
+        assert 25 < get_retry_after(_http_error(403, **headers)) <= 30
+
+    def test_no_response(self) -> None:
+        """Test errors without a response."""
+        assert get_retry_after(requests.exceptions.ConnectionError()) is None
+
+
+class TestCallWithRetry:
+    """Test retrying of operations."""
+
+    def test_recovered(self, sleeps: list) -> None:
+        """Test the operation is retried until it succeeds."""
+        errors = [_http_error(503), requests.exceptions.ConnectionError()]
+
+        def func() -> str:
+            if errors:
+                raise errors.pop(0)
+            return "result"
+
+        assert call_with_retry("test", func) == "result"
+        assert len(sleeps) == 2
+
+    def test_fatal(self, sleeps: list) -> None:
+        """Test fatal errors are not retried."""
+        with pytest.raises(FatalTaskError):
+            call_with_retry("test", _raising(FatalTaskError("fatal")))
+        assert sleeps == []
+
+    def test_attempts_exhausted(self, sleeps: list, monkeypatch) -> None:
+        """Test the error is propagated once all attempts fail."""
+        monkeypatch.setattr(retry, "_ATTEMPTS", 3)
+        with pytest.raises(requests.exceptions.HTTPError):
+            call_with_retry("test", _raising(_http_error(503)))
+        assert len(sleeps) == 2
+
+    def test_budget_exhausted(self, sleeps: list, monkeypatch) -> None:
+        """Test time spent waiting in a task run is bounded by the budget."""
+        monkeypatch.setattr(retry, "_BUDGET", 15.0)
+        error = _http_error(503, **{"Retry-After": "10"})
+        with pytest.raises(requests.exceptions.HTTPError):
+            run_with_retry_budget(lambda: call_with_retry("test", _raising(error)))
+        assert len(sleeps) == 1
+        assert sleeps[0] >= 10
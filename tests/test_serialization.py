@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of serialization formats."""
+
+import json
+
+import pytest
+
+from thoth.worker.serialization import SERIALIZERS
+from thoth.worker.serialization import deserialize
+from thoth.worker.serialization import get_serializer
+from thoth.worker.serialization import serialize
+
+_DOCUMENT = {
+    "info": {"name": "flask", "keywords": "web wsgi", "downloads": -1, "yanked": False},
+    "releases": {"1.0": [{"size": 2 ** 40, "digests": {"sha256": "0" * 64}}]},
+    "unicode": "příliš žluťoučký kůň",
+    "empty": None,
+}
+
+
+class TestSerialization:
+    """Test serialization and deserialization of documents."""
+
+    @pytest.mark.parametrize("name", sorted(SERIALIZERS))
+    def test_round_trip(self, name: str) -> None:
+        """Test data serialized in any available format are deserialized."""
+        serializer = get_serializer(name)
+        assert deserialize(serialize(_DOCUMENT, serializer)) == _DOCUMENT
+        assert deserialize(serialize(_DOCUMENT, serializer, pretty=True)) == _DOCUMENT
+
+    def test_json_no_marker(self) -> None:
+        """Test JSON carries no marker so it stays readable by any JSON consumer."""
+        assert json.loads(serialize(_DOCUMENT, get_serializer("json"))) == _DOCUMENT
+
+    def test_json_pretty(self) -> None:
+        """Test pretty JSON is serialized the same way as Ceph adapters in thoth-storages do."""
+        blob = serialize({"b": 1, "a": [1]}, get_serializer("json"), pretty=True)
+        assert blob == b'{\n  "a": [\n    1\n  ],\n  "b": 1\n}'
+
+    def test_msgpack_marker(self) -> None:
+        """Test formats other than JSON are prefixed by a marker."""
+        pytest.importorskip("msgpack")
+        blob = serialize(_DOCUMENT, get_serializer("msgpack"))
+        assert blob.startswith(b"\x00thoth:msgpack\x00")
+
+    @pytest.mark.parametrize("value", [float("nan"), float("inf"), float("-inf"), 2 ** 64, -(2 ** 70), 10 ** 30])
+    def test_json_standard_library(self, value: float) -> None:
+        """Test values orjson cannot read exactly are read as written by the standard library."""
+        result = deserialize(json.dumps({"value": value}).encode())["value"]
+        if value != value:
+            assert result != result
+        else:
+            assert result == value
+            assert type(result) is type(value)
+
+    def test_unknown_format(self) -> None:
+        """Test data in an unknown format are reported."""
+        with pytest.raises(ValueError):
+            deserialize(b"\x00thoth:unknown\x00data")
+
+    def test_unknown_serializer(self) -> None:
+        """Test JSON is used if the configured format is not available."""
+        assert get_serializer("unknown").name == "json"
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of similar-project queries over the project2vec model."""
+
+import numpy as np
+import pytest
+
+from thoth.worker.exceptions import NotFoundException
+from thoth.worker.similarity import SimilarityIndex
+from thoth.worker.similarity import iter_tsv_vectors
+from thoth.worker.similarity import write_index
+
+_KEYWORDS = ["api", "http", "orm", "web"]
+# Vectors as stored in vectors.tsv of the project2vec model.
+_VECTORS = {
+    "bottle": "0\t1\t0\t1\n",
+    "django": "0\t1\t1\t1\n",
+    "flask": "0\t1\t0\t1\n",
+    "requests": "1\t1\t0\t0\n",
+    "sqlalchemy": "0\t0\t1\t0\n",
+    "unrelated": "0\t0\t0\t0\n",
+}
+
+
+@pytest.fixture
+def index(tmp_path) -> SimilarityIndex:
+    """Index of the model built from vectors above."""
+    rows = list(iter_tsv_vectors(_VECTORS.values()))
+    indptr = np.concatenate([[0], np.cumsum([len(row) for row in rows])])
+    write_index(str(tmp_path), sorted(_VECTORS), _KEYWORDS, indptr, np.concatenate(rows))
+    return SimilarityIndex(str(tmp_path))
+
+
+class TestSimilarityIndex:
+    """Test queries over the similarity index."""
+
+    def test_iter_tsv_vectors(self) -> None:
+        """Test indexes of keywords set are parsed."""
+        assert [row.tolist() for row in iter_tsv_vectors(["1\t0\t1", "0\t0\t0\n"])] == [[0, 2], []]
+
+    def test_keywords(self, index: SimilarityIndex) -> None:
+        """Test keywords of projects and projects of keywords are looked up."""
+        assert index.get_project_keywords("django") == ["http", "orm", "web"]
+        assert index.get_keyword_projects("http") == ["bottle", "django", "flask", "requests"]
+        assert index.get_keyword_projects("api") == ["requests"]
+
+    def test_jaccard(self, index: SimilarityIndex) -> None:
+        """Test only projects sharing a keyword are reported, the best ones first."""
+        assert index.get_similar_projects("django") == [
+            ("bottle", 2 / 3),
+            ("flask", 2 / 3),
+            ("sqlalchemy", 1 / 3),
+            ("requests", 0.25),
+        ]
+        assert index.get_similar_projects("flask", top_k=2) == [("bottle", 1.0), ("django", 2 / 3)]
+
+    def test_cosine(self, index: SimilarityIndex) -> None:
+        """Test cosine similarity."""
+        assert index.get_similar_projects("sqlalchemy", metric="cosine") == [("django", pytest.approx(1 / 3 ** 0.5))]
+
+    def test_ties(self, index: SimilarityIndex) -> None:
+        """Test ties are broken by project name."""
+        assert index.get_similar_projects("requests", top_k=1) == [("bottle", 1 / 3)]
+
+    def test_no_keywords(self, index: SimilarityIndex) -> None:
+        """Test projects without keywords have no similar projects."""
+        assert index.get_similar_projects("unrelated") == []
+
+    def test_not_found(self, index: SimilarityIndex) -> None:
+        """Test unknown projects and keywords."""
+        with pytest.raises(NotFoundException):
+            index.get_similar_projects("unknown")
+
+        with pytest.raises(NotFoundException):
+            index.get_keyword_projects("unknown")
+
+    def test_unknown_metric(self, index: SimilarityIndex) -> None:
+        """Test unknown metrics are rejected."""
+        with pytest.raises(ValueError):
+            index.get_similar_projects("flask", metric="euclidean")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of parsing the PyPI simple index."""
+
+import json
+
+import pytest
+
+from thoth.worker.simple_index import iter_json_names
+
+_NAMES = ["flask", "django", "příliš-žluťoučký", "a" * 100, "numpy"]
+_INDEX = json.dumps(
+    {
+        "meta": {"api-version": "1.0", "_last-serial": 1},
+        "projects": [{"name": name, "_last-serial": idx} for idx, name in enumerate(_NAMES)],
+    },
+    ensure_ascii=False,
+    indent=1,
+).encode()
+
+
+def _split(blob: bytes, size: int) -> list:
+    """Split the given blob into chunks of the given size."""
+    return [blob[idx:idx + size] for idx in range(0, len(blob), size)]
+
+
+class TestIterJsonNames:
+    """Test incremental parsing of the JSON form of the simple index."""
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, len(_INDEX)])
+    def test_chunks(self, chunk_size: int) -> None:
+        """Test names are parsed regardless of chunk boundaries, including boundaries inside UTF-8 characters."""
+        assert list(iter_json_names(_split(_INDEX, chunk_size))) == _NAMES
+
+    def test_streamed(self) -> None:
+        """Test names are yielded as soon as their entries are downloaded."""
+        fed = []
+
+        def chunks():
+            for chunk in _split(_INDEX, 16):
+                fed.append(chunk)
+                yield chunk
+
+        names = iter_json_names(chunks())
+        assert next(names) == "flask"
+        assert len(fed) < len(_INDEX) // 16
+
+    def test_compact(self) -> None:
+        """Test the index serialized with no whitespace."""
+        blob = b'{"meta":{"api-version":"1.0"},"projects":[{"name":"a"},{"name":"b"}]}'
+        assert list(iter_json_names([blob])) == ["a", "b"]
+
+    def test_empty(self) -> None:
+        """Test an index with no projects."""
+        assert list(iter_json_names([b'{"meta": {}, "projects": []}'])) == []
+
+    def test_no_projects(self) -> None:
+        """Test an index with no projects array is reported."""
+        with pytest.raises(ValueError):
+            list(iter_json_names([b'{"meta": {"api-version": "1.0"}}']))
+
+    def test_truncated(self) -> None:
+        """Test a truncated index is reported."""
+        with pytest.raises(ValueError):
+            list(iter_json_names([_INDEX[: len(_INDEX) // 2]]))
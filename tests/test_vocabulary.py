@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of construction of the project2vec vocabulary."""
+
+import pytest
+
+from thoth.worker.vocabulary import build_vocabulary
+from thoth.worker.vocabulary import get_vocabulary_configuration
+
+_KEYWORDS = {"flask": 10, "web": 8, "the": 7, "http": 5, "rare": 1}
+_DOCUMENT_FREQUENCY = {"flask": 4, "web": 9, "the": 6, "http": 3, "rare": 1}
+
+
+def _configuration(**kwargs) -> dict:
+    """Get configuration with nothing pruned, overridden by the given arguments."""
+    configuration = {
+        "min_df": 1,
+        "max_df": 1.0,
+        "top_k": 0,
+        "stop_words": False,
+        "extra_stop_words": [],
+        "stackoverflow": False,
+    }
+    configuration.update(kwargs)
+    return configuration
+
+
+class TestGetVocabularyConfiguration:
+    """Test configuration taken from the environment."""
+
+    def test_default(self, monkeypatch) -> None:
+        """Test nothing is pruned based on document frequency by default."""
+        monkeypatch.delenv("THOTH_WORKER_VOCABULARY_MIN_DF", raising=False)
+        monkeypatch.delenv("THOTH_WORKER_VOCABULARY_MAX_DF", raising=False)
+        configuration = get_vocabulary_configuration()
+        assert configuration["min_df"] == 1
+        assert configuration["max_df"] == 1.0
+
+    @pytest.mark.parametrize(
+        "value,expected", [("3", 3), ("0", 0), ("50%", 0.5), ("100%", 1.0), ("2.5%", 0.025), (" 1 ", 1)]
+    )
+    def test_document_frequency(self, monkeypatch, value: str, expected) -> None:
+        """Test numbers of projects and percentages are distinguished explicitly."""
+        monkeypatch.setenv("THOTH_WORKER_VOCABULARY_MAX_DF", value)
+        max_df = get_vocabulary_configuration()["max_df"]
+        assert max_df == pytest.approx(expected)
+        assert isinstance(max_df, float) == value.strip().endswith("%")
+
+    @pytest.mark.parametrize("value", ["1.0", "0.5", "half", "%"])
+    def test_document_frequency_invalid(self, monkeypatch, value: str) -> None:
+        """Test ambiguous or malformed document frequencies are rejected."""
+        monkeypatch.setenv("THOTH_WORKER_VOCABULARY_MIN_DF", value)
+        with pytest.raises(ValueError, match="percentage"):
+            get_vocabulary_configuration()
+
+
+class TestBuildVocabulary:
+    """Test pruning of aggregated keywords."""
+
+    def test_nothing_pruned(self) -> None:
+        """Test all the keywords are kept sorted."""
+        vocabulary, pruned = build_vocabulary(_KEYWORDS, _configuration(), _DOCUMENT_FREQUENCY, 10)
+        assert vocabulary == sorted(_KEYWORDS)
+        assert not any(pruned.values())
+
+    def test_document_frequency(self) -> None:
+        """Test absolute and relative document frequency limits."""
+        vocabulary, pruned = build_vocabulary(
+            _KEYWORDS, _configuration(min_df=2, max_df=0.8), _DOCUMENT_FREQUENCY, 10
+        )
+        assert vocabulary == ["flask", "http", "the"]
+        assert pruned["min_df"] == 1
+        assert pruned["max_df"] == 1
+
+    def test_stop_words(self) -> None:
+        """Test English and extra stop words are removed."""
+        vocabulary, pruned = build_vocabulary(
+            _KEYWORDS, _configuration(stop_words=True, extra_stop_words=["web"]), _DOCUMENT_FREQUENCY, 10
+        )
+        assert vocabulary == ["flask", "http", "rare"]
+        assert pruned["stop_words"] == 2
+
+    def test_stackoverflow(self) -> None:
+        """Test only StackOverflow tags are kept if requested."""
+        vocabulary, pruned = build_vocabulary(
+            _KEYWORDS, _configuration(stackoverflow=True), _DOCUMENT_FREQUENCY, 10, ["flask", "http"]
+        )
+        assert vocabulary == ["flask", "http"]
+        assert pruned["stackoverflow"] == 3
+
+    def test_top_k(self) -> None:
+        """Test only the most frequent keywords are kept."""
+        vocabulary, pruned = build_vocabulary(_KEYWORDS, _configuration(top_k=2), _DOCUMENT_FREQUENCY, 10)
+        assert vocabulary == ["flask", "web"]
+        assert pruned["top_k"] == 3
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of write-behind of Ceph writes."""
+
+import threading
+import time
+
+import pytest
+
+from thoth.worker import write_behind
+from thoth.worker.storages import ReadmeStore
+from thoth.worker.write_behind import WriteBehindError
+from thoth.worker.write_behind import is_write_behind_active
+from thoth.worker.write_behind import submit_write
+from thoth.worker.write_behind import write_behind_scope
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch) -> None:
+    """Turn write-behind on, each test gets its own queue and flushing threads."""
+    monkeypatch.setattr(write_behind, "_ENABLED", True)
+    monkeypatch.setattr(write_behind, "_WRITE_BEHIND", write_behind._WriteBehind())
+
+
+def _slow_write(written: list, item: str, delay: float = 0.05):
+    """Create a write appending the given item once the delay passed."""
+
+    def write():
+        time.sleep(delay)
+        written.append(item)
+
+    return write
+
+
+class TestWriteBehindScope:
+    """Test durability barriers of write-behind scopes."""
+
+    def test_barrier(self) -> None:
+        """Test writes are done in background and finished once the outermost scope is left."""
+        written = []
+        with write_behind_scope():
+            assert is_write_behind_active()
+            with write_behind_scope():
+                for idx in range(20):
+                    submit_write("test", _slow_write(written, str(idx)))
+            # Leaving a nested scope is not a barrier.
+            assert len(written) < 20
+
+        assert not is_write_behind_active()
+        assert sorted(written, key=int) == [str(idx) for idx in range(20)]
+
+    def test_error(self) -> None:
+        """Test failed writes are raised on the barrier, other writes are finished."""
+        written = []
+
+        def fail():
+            raise ValueError("write failed")
+
+        with pytest.raises(WriteBehindError, match="1 write"):
+            with write_behind_scope():
+                submit_write("test", fail)
+                submit_write("test", _slow_write(written, "done"))
+
+        assert written == ["done"]
+        # Errors are reported once.
+        with write_behind_scope():
+            pass
+
+    def test_exception_in_scope(self) -> None:
+        """Test an exception raised in the scope supersedes errors of writes, writes are finished before it."""
+        written = []
+
+        def fail():
+            raise ValueError("write failed")
+
+        with pytest.raises(KeyError):
+            with write_behind_scope():
+                submit_write("test", fail)
+                submit_write("test", _slow_write(written, "done"))
+                raise KeyError("task failed")
+
+        assert written == ["done"]
+
+    def test_threads(self) -> None:
+        """Test the barrier waits only for writes submitted by the thread leaving the scope."""
+        release = threading.Event()
+        submitted = threading.Event()
+
+        def blocked_write():
+            release.wait(10)
+
+        def other_thread():
+            with write_behind_scope():
+                submit_write("test", blocked_write)
+                submitted.set()
+
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        assert submitted.wait(10)
+
+        written = []
+        with write_behind_scope():
+            submit_write("test", _slow_write(written, "done", delay=0))
+        assert written == ["done"]
+
+        release.set()
+        thread.join(10)
+        assert not thread.is_alive()
+
+    def test_disabled(self, monkeypatch) -> None:
+        """Test writes are synchronous if write-behind is off."""
+        monkeypatch.setattr(write_behind, "_ENABLED", False)
+        with write_behind_scope():
+            assert not is_write_behind_active()
+
+    def test_store(self, ceph_adapter) -> None:
+        """Test documents written behind by a storage adapter are durable once its store method returns."""
+        readme_store = ceph_adapter(ReadmeStore)
+        readme_store.store({"package_name": "flask"}, "flow", "RetrieveProjectReadmeTask", None, {"content": "Flask"})
+        assert readme_store.retrieve_project_readme("flask")["result"] == {"content": "Flask"}
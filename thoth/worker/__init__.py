@@ -24,7 +24,11 @@ __author__ = "Fridolin Pokorny"
 from thoth.common import init_logging
 
 from .utils import get_config_files
+from .utils import get_redis_connection
+from .utils import get_worker_queues
 from .utils import init
+from .utils import set_config
+from .utils import set_config_without_tasks
 
 
 # Init logging so we get errors reported.
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Broker-less bulk rebuild of keywords and project2vec model on a single node.
+
+All the inputs are already present on Ceph, documents are streamed with concurrent prefetch, the per-project logic
+of PyPIProjectKeywordsTask and Project2VecTask is run on a process pool and results are reduced in-process and
+written using the same storage adapters the corresponding flows use:
+
+  thoth-worker-bulk keywords
+  thoth-worker-bulk keywords --verify
+  thoth-worker-bulk project2vec
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import typing
+import uuid
+
+from selinon import StoragePool
+
+from .utils import iter_prefetched
+from .utils import set_config_without_tasks
+
+_LOGGER = logging.getLogger(__name__)
+
+# Number of items processed after which progress is reported.
+_REPORT_EVERY = 10000
+# Keywords used for vector computation in pool workers.
+_KEYWORDS: typing.List[str] = []
+_VOCABULARY_VERSION: typing.Optional[str] = None
+
+
+def _retrieve_project2vec_documents(package_name: str) -> typing.Tuple[str, typing.List[str]]:
+    """Retrieve documents used for project2vec vector computation."""
+    from .tasks.project2vec import Project2VecTask
+
+    return package_name, list(Project2VecTask.get_documents(package_name))
+
+
+def _init_project2vec_worker(keywords: typing.List[str], vocabulary_version: str) -> None:
+    """Initialize a pool worker computing project2vec vectors."""
+    global _KEYWORDS, _VOCABULARY_VERSION
+    _KEYWORDS = keywords
+    _VOCABULARY_VERSION = vocabulary_version
+
+
+def _compute_project2vec_vector(
+    item: typing.Tuple[str, typing.List[str]]
+) -> typing.Tuple[str, typing.List[int], str]:
+    """Compute project2vec vector and hash of its inputs in a pool worker."""
+    from .tasks.project2vec import Project2VecTask
+
+    package_name, documents = item
+    return (
+        package_name,
+        Project2VecTask.compute_vector(_KEYWORDS, documents),
+        Project2VecTask.get_inputs_hash(_VOCABULARY_VERSION, documents),
+    )
+
+
+def _project_keywords_projection(document: dict) -> dict:
+    """Keep only parts of project info used for keywords computation so less data is sent to pool workers."""
+    return {"info": {"keywords": document.get("info", {}).get("keywords")}}
+
+
+def _get_project_keywords(item: typing.Tuple[str, dict]) -> typing.Tuple[str, dict]:
+    """Compute keywords for a project in a pool worker."""
+    from .tasks.keywords import PyPIProjectKeywordsTask
+
+    package_name, document = item
+    return package_name, PyPIProjectKeywordsTask.get_project_keywords(document)
+
+
+def rebuild_keywords(processes: int, prefetch: int, store: bool = True) -> dict:
+    """Rebuild aggregated keywords and contributions of projects as computed by the keywords flow."""
+    from .tasks.keywords import KeywordsAggregationTask
+
+    project_info_store = StoragePool.get_connected_storage("ProjectInfoStore")
+    _LOGGER.info("Computing keywords for projects")
+
+    result = {}
+    contributions = []
+    start = time.monotonic()
+    # Create the pool before any prefetching thread is started.
+    with multiprocessing.Pool(processes) as pool:
+        documents = project_info_store.iter_project_info_documents(
+            prefetch=prefetch, ordered=False, projection=_project_keywords_projection, with_ids=True, projected=True
+        )
+        for idx, contribution in enumerate(pool.imap_unordered(_get_project_keywords, documents, chunksize=256), 1):
+            KeywordsAggregationTask.add_keywords(result, contribution[1])
+            contributions.append(contribution)
+            if idx % _REPORT_EVERY == 0:
+                _LOGGER.info("Processed %d projects in %.2fs", idx, time.monotonic() - start)
+
+    if not store:
+        return result
+
+    # Contributions are applied once aggregated keywords are stored so that incremental runs never subtract
+    # contributions not part of the stored aggregated keywords.
+    generation = uuid.uuid4().hex
+    StoragePool.get_connected_storage("KeywordsContributionStore").store_pending(generation, dict(contributions))
+    StoragePool.get_connected_storage("AggregatedKeywordsStore").store(
+        None, "keywords", "KeywordsAggregationTask", generation, result
+    )
+    _LOGGER.info("Aggregated %d keywords in %.2fs", len(result), time.monotonic() - start)
+    return result
+
+
+def verify_keywords(processes: int, prefetch: int) -> typing.Dict[str, typing.Tuple[int, int]]:
+    """Compare stored aggregated keywords with a full recount, return keywords with differing counts."""
+    expected = rebuild_keywords(processes, prefetch, store=False)
+    stored = StoragePool.get_connected_storage("AggregatedKeywordsStore").retrieve_keywords()["result"]
+
+    differences = {
+        keyword: (stored.get(keyword, 0), expected.get(keyword, 0))
+        for keyword in set(expected).union(stored)
+        if stored.get(keyword, 0) != expected.get(keyword, 0)
+    }
+    for keyword, (stored_count, expected_count) in sorted(differences.items()):
+        _LOGGER.warning("Keyword %r stored with count %d, full recount gives %d", keyword, stored_count, expected_count)
+
+    _LOGGER.info("Verified %d keywords, %d differ from a full recount", len(expected), len(differences))
+    return differences
+
+
+def rebuild_project2vec(
+    processes: int, prefetch: int
+) -> typing.Tuple[typing.List[str], typing.List[typing.List[int]], dict]:
+    """Rebuild project2vec model as computed by the project2vec flow."""
+    from .tasks.project2vec import Project2VecTask
+
+    keywords = Project2VecTask.get_keywords()
+    vocabulary_version = Project2VecTask.get_vocabulary_version(keywords)
+    listing = StoragePool.get_connected_storage("ProjectInfoStore").get_project_listing()
+    _LOGGER.info("Computing project2vec vectors of size %d for %d projects", len(keywords), len(listing))
+
+    projects = []
+    start = time.monotonic()
+    with multiprocessing.Pool(
+        processes, initializer=_init_project2vec_worker, initargs=(keywords, vocabulary_version)
+    ) as pool:
+        # Documents are retrieved by prefetching threads, storage adapters read using the thread safe boto3 client.
+        documents = iter_prefetched(_retrieve_project2vec_documents, listing, workers=prefetch, ordered=False)
+        for idx, project in enumerate(pool.imap_unordered(_compute_project2vec_vector, documents, chunksize=64), 1):
+            projects.append(project)
+            if idx % _REPORT_EVERY == 0:
+                _LOGGER.info("Processed %d projects in %.2fs", idx, time.monotonic() - start)
+
+    # Sort by project names, the same way as Project2VecCreationTask does.
+    project_names = []
+    vector_space = []
+    inputs = {"vocabulary_version": vocabulary_version, "projects": {}}
+    for project in sorted(projects):
+        project_names.append(project[0])
+        vector_space.append(project[1])
+        inputs["projects"][project[0]] = project[2]
+
+    StoragePool.get_connected_storage("Project2VecModelStore").store(
+        None, "project2vec", "Project2VecCreationTask", None, (project_names, vector_space, inputs)
+    )
+    _LOGGER.info("Stored project2vec model for %d projects in %.2fs", len(project_names), time.monotonic() - start)
+    return project_names, vector_space, inputs
+
+
+def main() -> None:
+    """Run bulk rebuild."""
+    parser = argparse.ArgumentParser(description="Broker-less bulk rebuild of keywords and project2vec model.")
+    parser.add_argument("what", choices=("keywords", "project2vec"), help="What should be rebuilt.")
+    parser.add_argument(
+        "--processes", type=int, default=os.cpu_count() or 1, help="Number of processes computing results."
+    )
+    parser.add_argument("--prefetch", type=int, default=32, help="Number of concurrent document downloads.")
+    parser.add_argument(
+        "--verify", action="store_true", help="Only verify stored keywords match a full recount (keywords only)."
+    )
+    args = parser.parse_args()
+
+    set_config_without_tasks()
+
+    if args.what == "keywords" and args.verify:
+        sys.exit(1 if verify_keywords(args.processes, args.prefetch) else 0)
+    elif args.what == "keywords":
+        rebuild_keywords(args.processes, args.prefetch)
+    else:
+        rebuild_project2vec(args.processes, args.prefetch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Checkpoints of long fan-out flows so that they can be resumed after a crash.
+
+Projects processed by checkpointed tasks are recorded in a Redis set keyed by run id (see thoth.worker.progress)
+once the task finishes successfully. If a flow is run again with node arguments stating the same run id and
+"resume": true, foreach functions skip projects that were already processed in the run.
+"""
+
+import logging
+import typing
+
+from selinon.trace import Trace
+
+from .utils import get_redis_connection
+
+_LOGGER = logging.getLogger(__name__)
+
+_CHECKPOINT_KEY = "thoth:checkpoint:{run_id}"
+# Keep checkpoints for a month, the same as progress information.
+_EXPIRATION = 30 * 24 * 3600
+# Tasks done once per project in fan-out flows, including their high-priority variants.
+_CHECKPOINTED_TASKS = frozenset(
+    task_name + suffix
+    for task_name in ("ProjectInfoTask", "RetrieveProjectReadmeTask", "RetrieveGitHubInfoTask")
+    for suffix in ("", "HighPriority")
+)
+
+# Run id and project name of checkpointed tasks started in this process keyed by task id.
+_TASK_CHECKPOINTS: typing.Dict[str, typing.Tuple[str, str]] = {}
+
+
+def trace_checkpoint(event: int, msg_dict: dict) -> None:
+    """A Selinon trace function recording projects processed by checkpointed tasks."""
+    try:
+        if event == Trace.TASK_START and msg_dict.get("task_name") in _CHECKPOINTED_TASKS:
+            node_args = msg_dict.get("node_args") or {}
+            if node_args.get("run_id") and node_args.get("package_name"):
+                _TASK_CHECKPOINTS[msg_dict["task_id"]] = (node_args["run_id"], node_args["package_name"])
+        elif event == Trace.TASK_END:
+            checkpoint = _TASK_CHECKPOINTS.pop(msg_dict.get("task_id"), None)
+            if checkpoint:
+                run_id, package_name = checkpoint
+                checkpoint_key = _CHECKPOINT_KEY.format(run_id=run_id)
+                pipe = get_redis_connection().pipeline()
+                pipe.sadd(checkpoint_key, package_name)
+                pipe.expire(checkpoint_key, _EXPIRATION)
+                pipe.execute()
+        elif event == Trace.TASK_FAILURE:
+            _TASK_CHECKPOINTS.pop(msg_dict.get("task_id"), None)
+    except Exception as exc:
+        _LOGGER.warning("Failed to record checkpoint for event %r: %s", event, str(exc))
+
+
+def get_completed(run_id: str) -> typing.Set[str]:
+    """Get projects already processed in the given run."""
+    return {member.decode() for member in get_redis_connection().smembers(_CHECKPOINT_KEY.format(run_id=run_id))}
+
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Deduplication of identical task invocations running at the same time or shortly after each other.
+
+Invocations are identified by task class and node arguments (bookkeeping arguments such as run id or priority
+and arguments derived from other ones such as GitHub owner and repo are ignored) so that invocations of the same
+task configured under different names (e.g. high-priority variants) are deduplicated as well.
+
+The first invocation takes a lease in Redis. Concurrent duplicates do not block workers - they are retried by
+Selinon after a countdown and return a "deduplicated" result once the first invocation finished instead of running
+the task. Ceph storage adapters do not store such results so the result stored by the first invocation is kept,
+Redis storage adapters copy the result stored by the first invocation. Once the first invocation finishes
+successfully (its result is stored), the invocation is marked done for the freshness window and duplicates started
+in the window are skipped entirely. If the freshness window is turned off, duplicates are only prevented from
+running concurrently.
+
+Configuration is taken from environment variables:
+
+ * THOTH_WORKER_DEDUP_TASKS - comma separated task class names to deduplicate
+ * THOTH_WORKER_DEDUP_LEASE - seconds a lease is held if the worker running the task dies (default 600)
+ * THOTH_WORKER_DEDUP_FRESHNESS - seconds completed work is not repeated, 0 turns skipping off (default 3600)
+ * THOTH_WORKER_DEDUP_RETRY_COUNTDOWN - seconds after which a duplicate of a running task is retried (default 10)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import typing
+
+from selinon.trace import Trace
+
+from .utils import get_redis_connection
+
+_LOGGER = logging.getLogger(__name__)
+
+_DEDUP_TASKS = frozenset(
+    task_name.strip()
+    for task_name in os.getenv(
+        "THOTH_WORKER_DEDUP_TASKS", "ProjectInfoTask,RetrieveProjectReadmeTask,RetrieveGitHubInfoTask"
+    ).split(",")
+    if task_name.strip()
+)
+_LEASE = int(os.getenv("THOTH_WORKER_DEDUP_LEASE", 600))
+_FRESHNESS = int(os.getenv("THOTH_WORKER_DEDUP_FRESHNESS", 3600))
+_RETRY_COUNTDOWN = int(os.getenv("THOTH_WORKER_DEDUP_RETRY_COUNTDOWN", 10))
+
+_LOCK_KEY = "thoth:dedup:{key}:lock"
+_DONE_KEY = "thoth:dedup:{key}:done"
+# Node arguments not affecting results of tasks, GitHub owner and repo are derived from package name.
+_IGNORED_NODE_ARGS = frozenset(
+    (
+        "run_id",
+        "fan_out",
+        "resume",
+        "profile",
+        "incremental",
+        "priority",
+        "priority_score",
+        "priority_high",
+        "owner",
+        "repo",
+    )
+)
+_DEDUPLICATED_KEY = "@deduplicated"
+
+# Release the lock only if it is still held by the given owner.
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Keys of leases held by tasks running in this process keyed by task id.
+_TASK_LEASES: typing.Dict[str, str] = {}
+
+
+def get_invocation_key(task_name: str, node_args: typing.Any) -> str:
+    """Get key identifying invocation of the given task with the given node arguments."""
+    if isinstance(node_args, dict):
+        node_args = {key: value for key, value in node_args.items() if key not in _IGNORED_NODE_ARGS}
+
+    digest = hashlib.sha256(json.dumps(node_args, sort_keys=True).encode()).hexdigest()
+    return f"{task_name}:{digest}"
+
+
+def is_deduplicated(result: typing.Any) -> bool:
+    """Check whether the given task result states the task run was deduplicated."""
+    return isinstance(result, dict) and _DEDUPLICATED_KEY in result
+
+
+def get_deduplicated_task_id(result: dict) -> str:
+    """Get id of the task whose result is reused by the deduplicated task run."""
+    return result[_DEDUPLICATED_KEY]
+
+
+def run_deduplicated(task, run: typing.Callable, node_args: typing.Any) -> typing.Any:
+    """Run the given task unless an identical invocation is running or finished recently."""
+    task_class_name = task.__class__.__name__
+    if task_class_name not in _DEDUP_TASKS:
+        return run(task, node_args)
+
+    key = get_invocation_key(task_class_name, node_args)
+    lock_key = _LOCK_KEY.format(key=key)
+    done_key = _DONE_KEY.format(key=key)
+    connection = get_redis_connection()
+
+    done = connection.get(done_key)
+    if done is not None:
+        _LOGGER.info("Skipping task %r (%s), finished recently by %s", task.task_name, task.task_id, done.decode())
+        return {_DEDUPLICATED_KEY: done.decode()}
+
+    if not connection.set(lock_key, task.task_id, nx=True, ex=_LEASE):
+        owner = connection.get(lock_key)
+        _LOGGER.info(
+            "Task %r (%s) is a duplicate of a running task %s, retrying in %d seconds",
+            task.task_name,
+            task.task_id,
+            owner.decode() if owner else None,
+            _RETRY_COUNTDOWN,
+        )
+        # Once retried, the invocation either finished (marked done) or failed and the lease can be taken. If
+        # skipping is turned off, nothing is marked done and the duplicate is run once the lease is taken.
+        task.retry(countdown=_RETRY_COUNTDOWN)
+
+    # The lease is released once the result is stored (see trace_dedup).
+    _TASK_LEASES[task.task_id] = key
+    try:
+        return run(task, node_args)
+    except Exception:
+        _TASK_LEASES.pop(task.task_id, None)
+        _release(connection, key, task.task_id, done=False)
+        raise
+
+
+def _release(connection, key: str, task_id: str, done: bool) -> None:
+    """Release lease of the given invocation, mark it done if it finished successfully."""
+    if done and _FRESHNESS:
+        connection.set(_DONE_KEY.format(key=key), task_id, ex=_FRESHNESS)
+    connection.eval(_RELEASE_SCRIPT, 1, _LOCK_KEY.format(key=key), task_id)
+
+
+def trace_dedup(event: int, msg_dict: dict) -> None:
+    """A Selinon trace function releasing leases of deduplicated tasks once their results are stored."""
+    if event not in (Trace.TASK_END, Trace.TASK_FAILURE):
+        return
+
+    key = _TASK_LEASES.pop(msg_dict.get("task_id"), None)
+    if key is None:
+        return
+
+    try:
+        _release(get_redis_connection(), key, msg_dict["task_id"], done=event == Trace.TASK_END)
+    except Exception as exc:
+        # The lease expires eventually.
+        _LOGGER.warning("Failed to release lease of task %r: %s", msg_dict.get("task_name"), str(exc))
@@ -4,3 +4,5 @@ from .travis import iter_travis_builds_count
 from .pypi import iter_sync_documents
 from .pypi import iter_pypi_projects
 from .pypi import iter_pypi_projects_ceph
+from .pypi import iter_keywords_projects
+from .pypi import iter_github_projects
@@ -20,35 +20,94 @@
 
 import logging
 
+from thoth.worker.github_index import get_github_repos
+from thoth.worker.incremental import take_dirty_snapshot
+from thoth.worker.priority import iter_prioritized
+from thoth.worker.priority import prioritize
+from thoth.worker.progress import iter_fan_out
+from thoth.worker.progress import track_fan_out
+
 _LOGGER = logging.getLogger(__name__)
 
 
 def iter_sync_documents(storage_pool, node_args):
     """Iterate over documents to be synced."""
     try:
-        return storage_pool.get("SyncListingTask")
+        return track_fan_out(node_args, storage_pool.get("SyncListingTask"), "iter_sync_documents")
     except Exception as exc:
         _LOGGER.exception(str(exc))
         return []
 
 
+def _log_failures(items):
+    """Iterate over the given items lazily, log and stop on failures as foreach functions do when not streaming."""
+    try:
+        yield from items
+    except Exception as exc:
+        _LOGGER.exception(str(exc))
+
+
 def iter_pypi_projects(storage_pool, node_args):
-    """Iterate over PyPI projects as stated on PyPI simple API index."""
+    """Iterate over PyPI projects as stated on PyPI simple API index, in priority order.
+
+    The listing is streamed chunk by chunk, names of all the projects are never held in memory at once.
+    """
     try:
-        return storage_pool.get("PyPIListingTask")
+        listing_store = storage_pool.get_connected_storage("PyPIListingStore")
+        manifest = storage_pool.get("PyPIListingTask")
     except Exception as exc:
         _LOGGER.exception(str(exc))
         return []
 
+    def iter_items():
+        return ({"package_name": package_name} for package_name in listing_store.iter_listing(manifest))
+
+    return _log_failures(iter_fan_out(node_args, iter_prioritized(node_args, iter_items), "iter_pypi_projects"))
+
 
 def iter_pypi_projects_ceph(storage_pool, node_args):
-    """Iterate over documents of project information as stored on Ceph."""
+    """Iterate over documents of project information as stored on Ceph, in priority order."""
     try:
         storage = storage_pool.get_connected_storage("ProjectInfoStore")
-        return [
-            {"package_name": package_name}
-            for package_name in storage.get_project_listing()
+        return track_fan_out(
+            node_args,
+            prioritize(node_args, [{"package_name": package_name} for package_name in storage.get_project_listing()]),
+            "iter_pypi_projects_ceph",
+        )
+    except Exception as exc:
+        _LOGGER.exception(str(exc))
+        return []
+
+
+def iter_github_projects(storage_pool, node_args):
+    """Iterate over projects hosted on GitHub as stated in the index of GitHub repositories, in priority order."""
+    try:
+        repos = get_github_repos()
+        if repos is None:
+            _LOGGER.warning("The GitHub repository index was not built, iterating over all projects")
+            return iter_pypi_projects_ceph(storage_pool, node_args)
+
+        items = [
+            {"package_name": package_name, "owner": owner, "repo": repo}
+            for package_name, (owner, repo) in sorted(repos.items())
         ]
+        return track_fan_out(node_args, prioritize(node_args, items), "iter_github_projects")
+    except Exception as exc:
+        _LOGGER.exception(str(exc))
+        return []
+
+
+def iter_keywords_projects(storage_pool, node_args):
+    """Iterate over projects changed since the last incremental keywords run, over all projects if not incremental."""
+    if not (node_args or {}).get("incremental"):
+        return iter_pypi_projects_ceph(storage_pool, node_args)
+
+    try:
+        return track_fan_out(
+            node_args,
+            [{"package_name": package_name} for package_name in take_dirty_snapshot("keywords")],
+            "iter_keywords_projects",
+        )
     except Exception as exc:
         _LOGGER.exception(str(exc))
         return []
@@ -2,6 +2,8 @@ import logging
 
 from selinon import StoragePool
 
+from thoth.worker.progress import track_fan_out
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -10,11 +12,7 @@ def iter_travis_repos(storage_pool: StoragePool, node_args: dict) -> list:
     try:
         repos = storage_pool.get('TravisActiveRepos')
 
-        new_node_args = []
-        for repo in repos:
-            new_node_args.append(dict(repo=repo, **node_args))
-
-        return new_node_args
+        return track_fan_out(node_args, [{"repo": repo} for repo in repos], "iter_travis_repos")
     except Exception as exc:
         _LOGGER.exception(str(exc))
         return []
@@ -25,11 +23,7 @@ def iter_travis_builds(storage_pool: StoragePool, node_args: dict) -> list:
     try:
         builds = storage_pool.get('TravisRepoBuilds')
 
-        new_node_args = []
-        for build in builds:
-            new_node_args.append(dict(**build, **node_args))
-
-        return new_node_args
+        return track_fan_out(node_args, builds, "iter_travis_builds")
     except Exception as exc:
         _LOGGER.exception(str(exc))
         return []
@@ -40,11 +34,9 @@ def iter_travis_builds_count(storage_pool: StoragePool, node_args: dict) -> list
     try:
         builds_count = storage_pool.get('TravisRepoBuildsCount')['count']
 
-        new_node_args = []
-        for offset in range(builds_count):
-            new_node_args.append(dict(**node_args, offset=offset))
-
-        return new_node_args
+        return track_fan_out(
+            node_args, [{"offset": offset} for offset in range(builds_count)], "iter_travis_builds_count"
+        )
     except Exception as exc:
         _LOGGER.exception(str(exc))
         return []
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Index of GitHub repositories of projects, used to fan out GitHub flows only to projects hosted on GitHub.
+
+The index maps project name to GitHub owner and repository parsed from the home page stated in project
+information. It is kept in a Redis hash, built once from projections of project information stored on Ceph and
+updated each time ProjectInfoTask stores project information:
+
+  thoth-worker-github-index build
+  thoth-worker-github-index show --limit 20
+
+Until the index is built, foreach functions using it fall back to all the projects with project information.
+Projects updated while the index is built are indexed again on their next update.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import sys
+import typing
+from urllib.parse import urlparse
+
+from selinon import StoragePool
+
+from .utils import get_redis_connection
+from .utils import set_config_without_tasks
+
+_LOGGER = logging.getLogger(__name__)
+
+_INDEX_KEY = "thoth:github:index"
+_BUILT_KEY = "thoth:github:index:built"
+
+
+def parse_github_repo(home_page: typing.Optional[str]) -> typing.Optional[typing.Tuple[str, str]]:
+    """Parse GitHub owner and repository from the given home page, None if the home page is not on GitHub."""
+    if not home_page:
+        return None
+
+    url = urlparse(home_page)
+    if url.netloc != "github.com":
+        return None
+
+    # The path starts with a slash.
+    path_parts = url.path.split("/")
+    if len(path_parts) < 3 or not path_parts[1] or not path_parts[2]:
+        return None
+
+    return path_parts[1], path_parts[2]
+
+
+def update_github_repo(package_name: str, projection: dict) -> None:
+    """Update the index based on projection of freshly stored project information of the given project."""
+    repo = parse_github_repo(projection.get("info", {}).get("home_page"))
+    connection = get_redis_connection()
+    if repo is None:
+        connection.hdel(_INDEX_KEY, package_name)
+    else:
+        connection.hset(_INDEX_KEY, package_name, "/".join(repo))
+
+
+def build_github_index(prefetch: int = 32) -> int:
+    """Build the index from projections of project information stored on Ceph, the index is atomically replaced."""
+    tmp_key = f"{_INDEX_KEY}:tmp"
+    connection = get_redis_connection()
+    connection.delete(tmp_key)
+
+    documents = StoragePool.get_connected_storage("ProjectInfoStore").iter_project_info_documents(
+        prefetch=prefetch, ordered=False, with_ids=True, projected=True
+    )
+    batch = {}
+    indexed = 0
+    for document_id, projection in documents:
+        repo = parse_github_repo(projection.get("info", {}).get("home_page"))
+        if repo is None:
+            continue
+
+        batch[document_id.split("/")[-1]] = "/".join(repo)
+        if len(batch) >= 10000:
+            connection.hset(tmp_key, mapping=batch)
+            indexed += len(batch)
+            batch = {}
+
+    if batch:
+        connection.hset(tmp_key, mapping=batch)
+        indexed += len(batch)
+
+    pipe = connection.pipeline()
+    if indexed:
+        pipe.rename(tmp_key, _INDEX_KEY)
+    else:
+        pipe.delete(_INDEX_KEY)
+    pipe.set(_BUILT_KEY, datetime.datetime.utcnow().isoformat())
+    pipe.execute()
+
+    _LOGGER.info("GitHub repository index built with %d projects", indexed)
+    return indexed
+
+
+def get_github_repos() -> typing.Optional[typing.Dict[str, typing.Tuple[str, str]]]:
+    """Get GitHub owner and repository of indexed projects keyed by project name, None if the index was not built."""
+    connection = get_redis_connection()
+    if not connection.exists(_BUILT_KEY):
+        return None
+
+    repos = {}
+    for package_name, value in connection.hscan_iter(_INDEX_KEY, count=10000):
+        owner, repo = value.decode().split("/", 1)
+        repos[package_name.decode()] = (owner, repo)
+
+    return repos
+
+
+def main() -> None:
+    """Build or show the index of GitHub repositories."""
+    parser = argparse.ArgumentParser(description="Index of GitHub repositories of projects.")
+    subparsers = parser.add_subparsers(dest="command")
+    build_parser = subparsers.add_parser("build", help="Build the index from stored project information.")
+    build_parser.add_argument("--prefetch", type=int, default=32, help="Number of concurrent document downloads.")
+    show_parser = subparsers.add_parser("show", help="Show indexed projects.")
+    show_parser.add_argument("--limit", type=int, default=20, help="Number of projects shown.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        set_config_without_tasks()
+        json.dump({"projects": build_github_index(args.prefetch)}, sys.stdout, indent=2)
+    elif args.command == "show":
+        repos = get_github_repos()
+        if repos is None:
+            _LOGGER.error("The GitHub repository index was not built yet")
+            sys.exit(1)
+
+        json.dump(
+            {
+                "built": get_redis_connection().get(_BUILT_KEY).decode(),
+                "projects": len(repos),
+                "repos": {package_name: "/".join(repos[package_name]) for package_name in sorted(repos)[:args.limit]},
+            },
+            sys.stdout,
+            indent=2,
+        )
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
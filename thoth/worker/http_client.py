@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""HTTP client used by tasks for outbound requests, transient failures are retried (see retry module)."""
+
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from .metrics import observe_http_request
+from .retry import call_with_retry
+from .retry import is_retryable_response
+
+# A shared session so connections to the same host are reused across task runs.
+_SESSION = requests.Session()
+
+
+def _get(url: str, host: str, **kwargs) -> requests.models.Response:
+    """Issue HTTP GET on the given URL, record request latency and response status code."""
+    start = time.monotonic()
+    try:
+        response = _SESSION.get(url, **kwargs)
+    except requests.exceptions.RequestException:
+        observe_http_request(host, None, time.monotonic() - start)
+        raise
+
+    observe_http_request(host, response.status_code, time.monotonic() - start)
+    return response
+
+
+def get(url: str, **kwargs) -> requests.models.Response:
+    """Issue HTTP GET on the given URL, retry on connection errors and retryable status codes.
+
+    Once retries are exhausted, the last response is returned so callers check status code as usual.
+    """
+    host = urlparse(url).netloc
+
+    def get_checked() -> requests.models.Response:
+        response = _get(url, host, **kwargs)
+        if is_retryable_response(response):
+            raise requests.exceptions.HTTPError(f"{response.status_code} response for {url}", response=response)
+        return response
+
+    try:
+        return call_with_retry(f"http:{host}", get_checked)
+    except requests.exceptions.HTTPError as exc:
+        return exc.response
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Bookkeeping of projects changed since the last incremental run.
+
+Projects are marked dirty in a Redis set once their information is updated. An incremental run takes a snapshot
+of the dirty set (projects marked dirty during the run are kept for the next run) and drops the snapshot once
+results were successfully aggregated. If a run fails, the snapshot is merged into the snapshot of the next run.
+Only one incremental run of the same kind is expected to run at a time.
+"""
+
+import logging
+import typing
+
+from .utils import get_redis_connection
+
+_LOGGER = logging.getLogger(__name__)
+
+_DIRTY_KEY = "thoth:incremental:{kind}:dirty"
+_SNAPSHOT_KEY = "thoth:incremental:{kind}:processing"
+
+# Kinds of incremental runs driven by updates of project information.
+PROJECT_INFO_DEPENDENT = ("keywords",)
+
+
+def mark_dirty(package_name: str, kinds: typing.Iterable[str] = PROJECT_INFO_DEPENDENT) -> None:
+    """Mark the given project as changed for incremental runs of the given kinds."""
+    pipe = get_redis_connection().pipeline()
+    for kind in kinds:
+        pipe.sadd(_DIRTY_KEY.format(kind=kind), package_name)
+    pipe.execute()
+
+
+def take_dirty_snapshot(kind: str) -> typing.List[str]:
+    """Take a snapshot of projects changed since the last successful incremental run."""
+    connection = get_redis_connection()
+    dirty_key = _DIRTY_KEY.format(kind=kind)
+    snapshot_key = _SNAPSHOT_KEY.format(kind=kind)
+
+    pipe = connection.pipeline()
+    # Merge into a snapshot possibly left by a failed run, the dirty set is emptied atomically.
+    pipe.sunionstore(snapshot_key, snapshot_key, dirty_key)
+    pipe.delete(dirty_key)
+    pipe.smembers(snapshot_key)
+    _, _, members = pipe.execute()
+
+    _LOGGER.info("Incremental %r run will process %d changed projects", kind, len(members))
+    return sorted(member.decode() for member in members)
+
+
+def drop_dirty_snapshot(kind: str) -> None:
+    """Drop snapshot once results of the incremental run were aggregated."""
+    get_redis_connection().delete(_SNAPSHOT_KEY.format(kind=kind))
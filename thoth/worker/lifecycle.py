@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Lifecycle of temporary task results kept in Redis storages.
+
+Temporary results expire based on ttl configured for each storage (see ExpiringRedis). Reducers register
+results of tasks they consumed, these results are deleted once the whole flow finishes successfully (a Selinon
+trace function reacting on the end of the flow the reducer was run in, only top-level flows and flows running a
+reducer are looked up). Memory reclaimed is reported using:
+
+  python3 -m thoth.worker.lifecycle
+"""
+
+import json
+import logging
+import sys
+import typing
+
+from selinon import Config
+from selinon import StoragePool
+from selinon.trace import Trace
+
+from .metrics import observe_redis_reclaimed
+from .utils import get_redis_connection
+
+_LOGGER = logging.getLogger(__name__)
+
+_CONSUMED_KEY = "thoth:lifecycle:{dispatcher_id}"
+_CONSUMED_TASKS_KEY = "thoth:lifecycle:{dispatcher_id}:{task_name}"
+_REPORT_KEY = "thoth:lifecycle:report"
+# Registrations of flows that never finish are dropped after a week.
+_EXPIRATION = 7 * 24 * 3600
+# Reducers registering results they consumed (see WorkerTaskBase.register_consumed_results).
+_CONSUMING_TASKS = frozenset(("KeywordsAggregationTask", "Project2VecCreationTask"))
+
+
+def register_consumed(dispatcher_id: str, task_name: str, task_ids: typing.List[str]) -> None:
+    """Register results of the given tasks consumed in the flow, they are deleted when the flow finishes."""
+    if not task_ids:
+        return
+
+    consumed_key = _CONSUMED_KEY.format(dispatcher_id=dispatcher_id)
+    consumed_tasks_key = _CONSUMED_TASKS_KEY.format(dispatcher_id=dispatcher_id, task_name=task_name)
+
+    pipe = get_redis_connection().pipeline()
+    pipe.sadd(consumed_key, task_name)
+    pipe.sadd(consumed_tasks_key, *task_ids)
+    pipe.expire(consumed_key, _EXPIRATION)
+    pipe.expire(consumed_tasks_key, _EXPIRATION)
+    pipe.execute()
+
+
+def cleanup_consumed(dispatcher_id: str) -> typing.Dict[str, typing.Dict[str, int]]:
+    """Delete results consumed in the given flow, return number of keys and bytes reclaimed per storage."""
+    connection = get_redis_connection()
+    consumed_key = _CONSUMED_KEY.format(dispatcher_id=dispatcher_id)
+
+    report = {}
+    for task_name in sorted(member.decode() for member in connection.smembers(consumed_key)):
+        consumed_tasks_key = _CONSUMED_TASKS_KEY.format(dispatcher_id=dispatcher_id, task_name=task_name)
+        task_ids = [member.decode() for member in connection.smembers(consumed_tasks_key)]
+        storage_name = Config.task2storage_mapping[task_name]
+        storage = StoragePool.get_connected_storage(storage_name)
+
+        keys, reclaimed = storage.delete_results(task_ids)
+        observe_redis_reclaimed(storage_name, keys, reclaimed)
+        storage_report = report.setdefault(storage_name, {"keys": 0, "bytes": 0})
+        storage_report["keys"] += keys
+        storage_report["bytes"] += reclaimed
+
+        pipe = connection.pipeline()
+        pipe.hincrby(_REPORT_KEY, f"{storage_name}:keys", keys)
+        pipe.hincrby(_REPORT_KEY, f"{storage_name}:bytes", reclaimed)
+        pipe.delete(consumed_tasks_key)
+        pipe.execute()
+
+    connection.delete(consumed_key)
+    return report
+
+
+def _has_consumed(msg_dict: dict) -> bool:
+    """Check whether the finished flow could register consumed results, other subflows are not looked up in Redis."""
+    if not msg_dict.get("parent"):
+        # A top-level flow, registrations of reducers not known here are cleaned up as well.
+        return True
+
+    finished_nodes = (msg_dict.get("state") or {}).get("finished_nodes") or {}
+    return not _CONSUMING_TASKS.isdisjoint(finished_nodes)
+
+
+def trace_lifecycle(event: int, msg_dict: dict) -> None:
+    """A Selinon trace function deleting consumed temporary results once the flow finishes."""
+    if event != Trace.FLOW_END or not _has_consumed(msg_dict):
+        return
+
+    try:
+        report = cleanup_consumed(msg_dict["dispatcher_id"])
+        if report:
+            _LOGGER.info("Deleted consumed results of flow %r: %s", msg_dict.get("flow_name"), report)
+    except Exception as exc:
+        # Results expire eventually, cleanup is not critical for running flows.
+        _LOGGER.warning("Failed to delete consumed results of flow %r: %s", msg_dict.get("flow_name"), str(exc))
+
+
+def get_report() -> dict:
+    """Report keys and memory reclaimed so far together with the current memory usage of Redis."""
+    connection = get_redis_connection()
+    reclaimed = {}
+    for field, value in connection.hgetall(_REPORT_KEY).items():
+        storage_name, _, metric = field.decode().rpartition(":")
+        reclaimed.setdefault(storage_name, {})[metric] = int(value)
+
+    memory = connection.info("memory")
+    return {
+        "reclaimed": reclaimed,
+        "used_memory": memory.get("used_memory"),
+        "used_memory_peak": memory.get("used_memory_peak"),
+    }
+
+
+def main() -> None:
+    """Report memory reclaimed by deleting consumed temporary results."""
+    json.dump(get_report(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Parallel sharded listing of objects stored on Ceph.
+
+The keyspace under a prefix is split into shards based on leading characters of keys - shard boundaries are keys
+made of the prefix and a leading character, each shard covers keys in range (lower boundary, upper boundary]. As
+S3 lists keys in lexicographical order, each shard is listed by its own paginated ListObjectsV2 starting after the
+lower boundary and stopping once the upper boundary is passed. Shards together cover the whole keyspace so no key
+is missed, even if it starts with a character not used as a boundary.
+
+Listings of shards can be cached in a manifest stored next to the listed prefix (in a sibling ".listing" prefix so
+the manifest is not part of the listing). Only shards with a manifest older than the configured age are listed
+again, the manifest is therefore refreshed incrementally.
+"""
+
+import json
+import logging
+import os
+import queue
+import string
+import threading
+import time
+import typing
+
+from thoth.storages.ceph import CephStore
+
+_LOGGER = logging.getLogger(__name__)
+
+# Leading characters used as shard boundaries - characters allowed in Python package names.
+DEFAULT_SHARD_CHARACTERS = "".join(sorted(string.ascii_letters + string.digits + "-._"))
+# Listings of shards in the manifest older than this number of seconds are refreshed, unset turns the manifest off.
+_MANIFEST_MAX_AGE = os.getenv("THOTH_WORKER_LISTING_MANIFEST_MAX_AGE")
+
+_Shard = typing.Tuple[typing.Optional[str], typing.Optional[str]]
+
+
+def get_shards(prefix: str, shard_characters: str = DEFAULT_SHARD_CHARACTERS) -> typing.List[_Shard]:
+    """Get shards as (lower, upper] key ranges covering the whole keyspace under prefix, None means unbounded."""
+    boundaries = [None] + [prefix + character for character in sorted(set(shard_characters))] + [None]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _iter_shard_pages(ceph: CephStore, shard: _Shard) -> typing.Generator[typing.List[str], None, None]:
+    """List keys in the given shard page by page, keys are relative to the prefix of the Ceph adapter."""
+    lower, upper = shard
+    # The low level client is thread safe, unlike boto3 resources.
+    paginator = ceph._s3.meta.client.get_paginator("list_objects_v2")
+    kwargs = {"Bucket": ceph.bucket, "Prefix": ceph.prefix}
+    if lower is not None:
+        kwargs["StartAfter"] = lower
+
+    for page in paginator.paginate(**kwargs):
+        keys = []
+        for obj in page.get("Contents", []):
+            if upper is not None and obj["Key"] > upper:
+                # Stop paginating, the rest of the keyspace is listed by other shards.
+                yield keys
+                return
+            keys.append(obj["Key"][len(ceph.prefix):])
+
+        yield keys
+
+
+def _list_shard(ceph: CephStore, shard: _Shard, output: queue.Queue, stop: threading.Event) -> None:
+    """List the given shard in a listing thread, pages are streamed into the output queue."""
+
+    def put(item: tuple) -> bool:
+        while not stop.is_set():
+            try:
+                output.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        for keys in _iter_shard_pages(ceph, shard):
+            if not put((shard, keys, False)):
+                # The consumer is gone.
+                return
+    except Exception as exc:
+        put((shard, exc, True))
+    else:
+        put((shard, None, True))
+
+
+def iter_sharded_listing(
+    ceph: CephStore,
+    workers: int = 16,
+    shard_characters: str = DEFAULT_SHARD_CHARACTERS,
+    shards: typing.Optional[typing.List[_Shard]] = None,
+) -> typing.Generator[typing.Tuple[_Shard, typing.Optional[typing.List[str]]], None, None]:
+    """List shards concurrently, yield pages of keys as they arrive and (shard, None) once a shard is listed."""
+    shards_iter = iter(shards if shards is not None else get_shards(ceph.prefix, shard_characters))
+    # Bound number of pages buffered so memory stays constant when the consumer is slow.
+    output = queue.Queue(maxsize=4 * workers)
+    stop = threading.Event()
+    running = 0
+
+    def start_next() -> bool:
+        shard = next(shards_iter, None)
+        if shard is None:
+            return False
+        threading.Thread(target=_list_shard, args=(ceph, shard, output, stop), daemon=True).start()
+        return True
+
+    try:
+        while running < workers and start_next():
+            running += 1
+
+        while running:
+            shard, keys, done = output.get()
+            if not done:
+                yield shard, keys
+                continue
+
+            running -= 1
+            if isinstance(keys, Exception):
+                raise keys
+
+            if start_next():
+                running += 1
+
+            yield shard, None
+    finally:
+        # Let listing threads finish if the consumer stopped early or listing failed.
+        stop.set()
+
+
+def iter_document_listing_pages(
+    ceph: CephStore, workers: int = 16, shard_characters: str = DEFAULT_SHARD_CHARACTERS
+) -> typing.Generator[typing.List[str], None, None]:
+    """List keys under the prefix of the given Ceph adapter page by page, concurrently unless workers is 0.
+
+    Keys of concurrent listings are not yielded in any particular order.
+    """
+    if workers <= 0:
+        yield from _iter_shard_pages(ceph, (None, None))
+        return
+
+    if _MANIFEST_MAX_AGE is not None:
+        yield get_cached_document_listing(ceph, float(_MANIFEST_MAX_AGE), workers, shard_characters)
+        return
+
+    for _, keys in iter_sharded_listing(ceph, workers=workers, shard_characters=shard_characters):
+        if keys:
+            yield keys
+
+
+def iter_document_listing(
+    ceph: CephStore, workers: int = 16, shard_characters: str = DEFAULT_SHARD_CHARACTERS
+) -> typing.Generator[str, None, None]:
+    """List keys under the prefix of the given Ceph adapter concurrently, stream keys as they are listed.
+
+    Keys are not yielded in any particular order.
+    """
+    for keys in iter_document_listing_pages(ceph, workers=workers, shard_characters=shard_characters):
+        yield from keys
+
+
+def _get_manifest_key(ceph: CephStore) -> str:
+    """Get key of the listing manifest, the manifest is kept in a sibling prefix so it is not listed itself."""
+    return ceph.prefix.rstrip("/") + ".listing/manifest.json"
+
+
+def get_cached_document_listing(
+    ceph: CephStore,
+    max_age: float,
+    workers: int = 16,
+    shard_characters: str = DEFAULT_SHARD_CHARACTERS,
+) -> typing.List[str]:
+    """Get listing using a cached manifest, shards listed more than max_age seconds ago are listed again."""
+    client = ceph._s3.meta.client
+    manifest_key = _get_manifest_key(ceph)
+
+    try:
+        manifest = json.loads(client.get_object(Bucket=ceph.bucket, Key=manifest_key)["Body"].read().decode())
+    except client.exceptions.NoSuchKey:
+        manifest = {}
+
+    cached_shards = manifest.get("shards", {})
+    if manifest.get("shard_characters") != shard_characters:
+        # Shard boundaries changed, the whole manifest is stale.
+        cached_shards = {}
+
+    now = time.time()
+    shards = get_shards(ceph.prefix, shard_characters)
+    stale_shards = [
+        shard for shard in shards if now - cached_shards.get(str(shard[1]), {}).get("listed_at", 0.0) > max_age
+    ]
+
+    _LOGGER.debug("Refreshing %d out of %d shards in listing manifest %r", len(stale_shards), len(shards), manifest_key)
+    refreshed = {}
+    for shard, keys in iter_sharded_listing(ceph, workers=workers, shards=stale_shards):
+        shard_keys = refreshed.setdefault(str(shard[1]), [])
+        if keys is None:
+            cached_shards[str(shard[1])] = {"listed_at": now, "keys": shard_keys}
+        else:
+            shard_keys.extend(keys)
+
+    if stale_shards:
+        manifest = {"shard_characters": shard_characters, "shards": cached_shards}
+        client.put_object(Bucket=ceph.bucket, Key=manifest_key, Body=json.dumps(manifest).encode())
+
+    result = []
+    for shard in shards:
+        result.extend(cached_shards[str(shard[1])]["keys"])
+
+    return result
+
+
+def drop_cached_document_listing(ceph: CephStore) -> None:
+    """Remove the listing manifest so the next listing lists all the shards."""
+    ceph._s3.meta.client.delete_object(Bucket=ceph.bucket, Key=_get_manifest_key(ceph))
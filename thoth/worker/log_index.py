@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Inverted index over error lines of harvested Travis CI logs.
+
+Error lines are extracted from logs of each build by TravisLogIndexTask and normalized (escape sequences removed,
+lower-cased, numbers replaced) into a segment stored on Ceph. Segments are periodically merged into a new
+generation of the index - postings (token to job ids, delta-encoded) sharded by token and error lines of jobs
+sharded by job id, each shard compressed. Term lookups read a single postings shard, phrase lookups intersect
+postings of phrase tokens and verify candidates against their error lines, no log is scanned:
+
+  thoth-worker-log-index merge
+  thoth-worker-log-index term modulenotfounderror
+  thoth-worker-log-index phrase "no module named"
+
+Number of shards of the first generation is configured using THOTH_WORKER_LOG_INDEX_SHARDS (default 64), later
+generations keep the number of shards. Number of decoded shards of each kind kept in memory by a loaded index is
+configured using THOTH_WORKER_LOG_INDEX_CACHE_SIZE (default 64).
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import typing
+import zlib
+
+from selinon import StoragePool
+
+from .utils import set_config_without_tasks
+
+_LOGGER = logging.getLogger(__name__)
+
+_SHARDS = int(os.getenv("THOTH_WORKER_LOG_INDEX_SHARDS", 64))
+# Maximum number of distinct error lines kept for a job.
+_MAX_JOB_LINES = 1000
+# Number of decoded shards of each kind cached by a loaded index.
+_SHARD_CACHE_SIZE = int(os.getenv("THOTH_WORKER_LOG_INDEX_CACHE_SIZE", 64))
+
+_ESCAPE_SEQUENCE_RE = re.compile("\u001b\\[.*?[@-~]")
+# Errors and exceptions can be suffixes of class names (e.g. ModuleNotFoundError), other words are matched whole.
+_ERROR_RE = re.compile(
+    r"(error|exception)s?\b|\b(traceback|fatal|failed|failure|segmentation fault|killed|abort(ed)?)\b", re.IGNORECASE
+)
+_HEX_RE = re.compile(r"\b0x[0-9a-f]+\b")
+# Only standalone numbers (line numbers, versions, durations), not digits that are part of identifiers.
+_NUMBER_RE = re.compile(r"\b\d+\b")
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+def clean_log(log: str) -> str:
+    """Clean log from non-ASCII characters and escape sequences."""
+    return _ESCAPE_SEQUENCE_RE.sub("", log).encode("ascii", "ignore").decode()
+
+
+def normalize_line(line: str) -> str:
+    """Normalize a log line so that the same error reported in different jobs is represented the same way."""
+    line = _NUMBER_RE.sub("0", _HEX_RE.sub("0x0", line.lower()))
+    return " ".join(_TOKEN_RE.findall(line))
+
+
+def get_tokens(normalized_line: str) -> typing.Set[str]:
+    """Get tokens of a normalized line that are indexed, numbers and single characters are not."""
+    return {token for token in normalized_line.split() if len(token) > 1 and token != "0x0" and not token.isdigit()}
+
+
+def extract_error_lines(log: str) -> typing.List[str]:
+    """Extract normalized error lines from the given log, each line is reported once."""
+    lines = {}
+    for line in clean_log(log).splitlines():
+        if _ERROR_RE.search(line):
+            normalized_line = normalize_line(line)
+            if normalized_line:
+                lines[normalized_line] = None
+                if len(lines) == _MAX_JOB_LINES:
+                    break
+
+    return list(lines)
+
+
+def extract_segment(jobs: typing.List[dict]) -> dict:
+    """Create an index segment from logs of jobs as produced by TravisLogTxt."""
+    segment_jobs = {}
+    postings: typing.Dict[str, typing.List[int]] = {}
+    for job in jobs:
+        lines = extract_error_lines(job["log"])
+        segment_jobs[str(job["job"])] = {
+            "organization": job["organization"],
+            "repo": job["repo"],
+            "build": job["build"],
+            "lines": lines,
+        }
+
+        tokens = set()
+        for line in lines:
+            tokens.update(get_tokens(line))
+        for token in tokens:
+            postings.setdefault(token, []).append(job["job"])
+
+    return {"jobs": segment_jobs, "postings": postings}
+
+
+def get_token_shard(token: str, shards: int) -> int:
+    """Get shard holding postings of the given token."""
+    return zlib.crc32(token.encode()) % shards
+
+
+def get_job_shard(job_id: int, shards: int) -> int:
+    """Get shard holding error lines of the given job."""
+    return job_id % shards
+
+
+def get_shard_key(generation: int, kind: str, shard: int) -> str:
+    """Get object key of the given shard."""
+    return f"shards/{generation}/{kind}-{shard:03d}"
+
+
+def encode_postings(postings: typing.Dict[str, typing.Iterable[int]]) -> bytes:
+    """Encode postings shard, job ids are sorted and delta-encoded before compression."""
+    encoded = {}
+    for token, job_ids in postings.items():
+        previous = 0
+        deltas = []
+        for job_id in sorted(set(job_ids)):
+            deltas.append(job_id - previous)
+            previous = job_id
+        encoded[token] = deltas
+
+    return zlib.compress(json.dumps(encoded, separators=(",", ":")).encode())
+
+
+def decode_postings(blob: bytes) -> typing.Dict[str, typing.List[int]]:
+    """Decode postings shard."""
+    postings = json.loads(zlib.decompress(blob).decode())
+    for token, deltas in postings.items():
+        job_id = 0
+        job_ids = []
+        for delta in deltas:
+            job_id += delta
+            job_ids.append(job_id)
+        postings[token] = job_ids
+
+    return postings
+
+
+def encode_jobs(jobs: typing.Dict[str, dict]) -> bytes:
+    """Encode shard of job error lines."""
+    return zlib.compress(json.dumps(jobs, separators=(",", ":")).encode())
+
+
+def decode_jobs(blob: bytes) -> typing.Dict[str, dict]:
+    """Decode shard of job error lines."""
+    return json.loads(zlib.decompress(blob).decode())
+
+
+def merge_segments(
+    segments: typing.Iterable[dict],
+    manifest: typing.Optional[dict],
+    load_blob: typing.Callable[[str], bytes],
+    store_blob: typing.Callable[[str, bytes], None],
+    shards: int = _SHARDS,
+) -> dict:
+    """Merge segments into a new generation of the index, return manifest of the new generation.
+
+    Shards of the previous generation (as stated in the manifest) are loaded one at a time, only additions coming
+    from segments are kept in memory.
+    """
+    shards = manifest["shards"] if manifest else shards
+    generation = manifest["generation"] + 1 if manifest else 0
+
+    postings_additions: typing.List[typing.Dict[str, typing.List[int]]] = [{} for _ in range(shards)]
+    jobs_additions: typing.List[typing.Dict[str, dict]] = [{} for _ in range(shards)]
+    merged_segments = 0
+    for segment in segments:
+        merged_segments += 1
+        for token, job_ids in segment["postings"].items():
+            postings_additions[get_token_shard(token, shards)].setdefault(token, []).extend(job_ids)
+        for job_id, job in segment["jobs"].items():
+            jobs_additions[get_job_shard(int(job_id), shards)][job_id] = job
+
+    tokens = jobs = 0
+    for shard in range(shards):
+        postings = {}
+        shard_jobs = {}
+        if manifest:
+            postings = decode_postings(load_blob(get_shard_key(manifest["generation"], "postings", shard)))
+            shard_jobs = decode_jobs(load_blob(get_shard_key(manifest["generation"], "jobs", shard)))
+
+        for token, job_ids in postings_additions[shard].items():
+            postings.setdefault(token, []).extend(job_ids)
+        store_blob(get_shard_key(generation, "postings", shard), encode_postings(postings))
+        tokens += len(postings)
+        postings_additions[shard] = None
+
+        shard_jobs.update(jobs_additions[shard])
+        store_blob(get_shard_key(generation, "jobs", shard), encode_jobs(shard_jobs))
+        jobs += len(shard_jobs)
+        jobs_additions[shard] = None
+
+    return {
+        "generation": generation,
+        "shards": shards,
+        "tokens": tokens,
+        "jobs": jobs,
+        "segments": (manifest["segments"] if manifest else 0) + merged_segments,
+    }
+
+
+class LogIndex:
+    """Term and phrase lookups over a generation of the index, shards are loaded lazily."""
+
+    def __init__(self, manifest: dict, load_blob: typing.Callable[[str], bytes]):
+        """Use the generation stated in the given manifest, shards are retrieved using load_blob."""
+        self.manifest = manifest
+        self._load_blob = load_blob
+        self._get_postings_shard = functools.lru_cache(maxsize=_SHARD_CACHE_SIZE)(self._load_postings_shard)
+        self._get_jobs_shard = functools.lru_cache(maxsize=_SHARD_CACHE_SIZE)(self._load_jobs_shard)
+
+    def _load_postings_shard(self, shard: int) -> typing.Dict[str, typing.List[int]]:
+        """Load the given postings shard."""
+        return decode_postings(self._load_blob(get_shard_key(self.manifest["generation"], "postings", shard)))
+
+    def _load_jobs_shard(self, shard: int) -> typing.Dict[str, dict]:
+        """Load the given shard of job error lines."""
+        return decode_jobs(self._load_blob(get_shard_key(self.manifest["generation"], "jobs", shard)))
+
+    def search_term(self, term: str) -> typing.List[int]:
+        """Get sorted ids of jobs with the given term present in their error lines."""
+        token = normalize_line(term)
+        return self._get_postings_shard(get_token_shard(token, self.manifest["shards"])).get(token, [])
+
+    def get_job(self, job_id: int) -> typing.Optional[dict]:
+        """Get build information and error lines of the given job."""
+        return self._get_jobs_shard(get_job_shard(job_id, self.manifest["shards"])).get(str(job_id))
+
+    def search_phrase(self, phrase: str, limit: typing.Optional[int] = None) -> typing.List[dict]:
+        """Get jobs with the given phrase present in one of their error lines, together with the matching lines."""
+        normalized_phrase = normalize_line(phrase)
+        tokens = get_tokens(normalized_phrase)
+        if not tokens:
+            raise ValueError(f"Phrase {phrase!r} has no indexed token")
+
+        # Intersect starting with the shortest posting list.
+        postings = sorted((self.search_term(token) for token in tokens), key=len)
+        candidates = set(postings[0])
+        for job_ids in postings[1:]:
+            candidates.intersection_update(job_ids)
+            if not candidates:
+                return []
+
+        # Candidates are verified shard by shard so that each shard is decoded once.
+        shard_candidates: typing.Dict[int, typing.List[int]] = {}
+        for job_id in candidates:
+            shard_candidates.setdefault(get_job_shard(job_id, self.manifest["shards"]), []).append(job_id)
+
+        result = []
+        padded_phrase = f" {normalized_phrase} "
+        for shard, job_ids in shard_candidates.items():
+            shard_jobs = self._get_jobs_shard(shard)
+            for job_id in job_ids:
+                job = shard_jobs.get(str(job_id)) or {}
+                lines = [line for line in job.get("lines", []) if padded_phrase in f" {line} "]
+                if lines:
+                    result.append(dict(job, job=job_id, lines=lines))
+
+        result.sort(key=lambda job: job["job"])
+        return result[:limit] if limit is not None else result
+
+
+def merge(store=None) -> dict:
+    """Merge segments stored on Ceph into a new generation of the index."""
+    store = store or StoragePool.get_connected_storage("TravisLogIndexStore")
+    manifest = store.retrieve_manifest()
+    segment_ids = list(store.iter_segment_ids())
+    _LOGGER.info("Merging %d segments into the index", len(segment_ids))
+
+    new_manifest = merge_segments(
+        (store.retrieve_segment(segment_id) for segment_id in segment_ids),
+        manifest,
+        store.retrieve_shard,
+        store.store_shard,
+    )
+    store.store_manifest(new_manifest)
+
+    # Segments merged are deleted only once the new generation is in place. The previous generation is kept for
+    # readers that loaded it before the switch.
+    for segment_id in segment_ids:
+        store.delete_segment(segment_id)
+    if manifest and manifest["generation"] > 0:
+        store.delete_generation(manifest["generation"] - 1, manifest["shards"])
+
+    return new_manifest
+
+
+def load_index(store=None) -> LogIndex:
+    """Load the latest generation of the index stored on Ceph."""
+    store = store or StoragePool.get_connected_storage("TravisLogIndexStore")
+    manifest = store.retrieve_manifest()
+    if manifest is None:
+        raise ValueError("No Travis CI log index was built yet, merge segments first")
+
+    return LogIndex(manifest, store.retrieve_shard)
+
+
+def main() -> None:
+    """Merge or query the Travis CI log index."""
+    parser = argparse.ArgumentParser(description="Inverted index over error lines of Travis CI logs.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("merge", help="Merge segments into a new generation of the index.")
+    term_parser = subparsers.add_parser("term", help="Find jobs with the given term in their error lines.")
+    term_parser.add_argument("term", help="Term to look up.")
+    phrase_parser = subparsers.add_parser("phrase", help="Find jobs with the given phrase in their error lines.")
+    phrase_parser.add_argument("phrase", help="Phrase to look up.")
+    phrase_parser.add_argument("--limit", type=int, default=None, help="Maximum number of jobs reported.")
+    args = parser.parse_args()
+
+    set_config_without_tasks()
+
+    if args.command == "merge":
+        json.dump(merge(), sys.stdout, indent=2)
+    elif args.command == "term":
+        index = load_index()
+        jobs = [dict(index.get_job(job_id) or {}, job=job_id) for job_id in index.search_term(args.term)]
+        json.dump(jobs, sys.stdout, indent=2)
+    elif args.command == "phrase":
+        json.dump(load_index().search_phrase(args.phrase, args.limit), sys.stdout, indent=2)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
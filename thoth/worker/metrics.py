@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Prometheus metrics exposed by thoth-worker.
+
+Metrics are fed by Selinon trace events (see global trace configuration in nodes.yaml), by storage adapters, by
+HTTP calls done in tasks and by their retries. Celery runs tasks in forked processes, metrics are therefore collected
+using Prometheus client's multiprocess mode if PROMETHEUS_MULTIPROC_DIR is set (app.py does so when metrics are
+enabled).
+"""
+
+import os
+import time
+import logging
+import typing
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+from prometheus_client import REGISTRY
+from prometheus_client import generate_latest
+from prometheus_client import start_http_server
+from selinon.trace import Trace
+
+_LOGGER = logging.getLogger(__name__)
+
+task_duration_seconds = Histogram(
+    "thoth_worker_task_duration_seconds",
+    "Time spent in a task run.",
+    ["task_name", "state"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, float("inf")),
+)
+task_failures_total = Counter("thoth_worker_task_failures_total", "Number of failed task runs.", ["task_name"])
+flow_failures_total = Counter("thoth_worker_flow_failures_total", "Number of failed flows.", ["flow_name"])
+storage_bytes_read_total = Counter(
+    "thoth_worker_storage_bytes_read_total", "Bytes read by a storage adapter.", ["adapter"]
+)
+storage_bytes_written_total = Counter(
+    "thoth_worker_storage_bytes_written_total", "Bytes written by a storage adapter.", ["adapter"]
+)
+ceph_operation_duration_seconds = Histogram(
+    "thoth_worker_ceph_operation_duration_seconds",
+    "Latency of Ceph operations done by storage adapters.",
+    ["adapter", "operation"],
+)
+redis_reclaimed_keys_total = Counter(
+    "thoth_worker_redis_reclaimed_keys_total", "Temporary results deleted from Redis storages.", ["storage"]
+)
+redis_reclaimed_bytes_total = Counter(
+    "thoth_worker_redis_reclaimed_bytes_total", "Redis memory reclaimed by deleting temporary results.", ["storage"]
+)
+http_request_duration_seconds = Histogram(
+    "thoth_worker_http_request_duration_seconds", "Latency of outbound HTTP requests.", ["host"]
+)
+http_responses_total = Counter(
+    "thoth_worker_http_responses_total",
+    "Outbound HTTP responses per host and status code ('error' if no response was received).",
+    ["host", "status_code"],
+)
+retries_total = Counter(
+    "thoth_worker_retries_total",
+    "Retries of operations failed transiently by outcome - retried, recovered, exhausted or fatal.",
+    ["operation", "outcome"],
+)
+retry_delay_seconds_total = Counter(
+    "thoth_worker_retry_delay_seconds_total", "Time spent waiting before retrying operations.", ["operation"]
+)
+write_behind_queue_depth = Gauge(
+    "thoth_worker_write_behind_queue_depth", "Ceph writes waiting to be flushed.", multiprocess_mode="livesum"
+)
+write_behind_flush_duration_seconds = Histogram(
+    "thoth_worker_write_behind_flush_duration_seconds",
+    "Time from submitting a Ceph write behind until it is flushed.",
+    ["adapter"],
+)
+write_behind_barrier_duration_seconds = Histogram(
+    "thoth_worker_write_behind_barrier_duration_seconds", "Time spent waiting for writes behind on barriers."
+)
+
+# Task start times keyed by task id, task start and task end are always traced in the same process.
+_TASK_STARTS: typing.Dict[str, float] = {}
+
+
+def trace_metrics(event: int, msg_dict: dict) -> None:
+    """A Selinon trace function feeding task and flow metrics."""
+    if event == Trace.TASK_START:
+        _TASK_STARTS[msg_dict["task_id"]] = time.monotonic()
+    elif event in (Trace.TASK_END, Trace.TASK_FAILURE):
+        start = _TASK_STARTS.pop(msg_dict.get("task_id"), None)
+        state = "success" if event == Trace.TASK_END else "failure"
+        if start is not None:
+            task_duration_seconds.labels(msg_dict["task_name"], state).observe(time.monotonic() - start)
+        if event == Trace.TASK_FAILURE:
+            task_failures_total.labels(msg_dict["task_name"]).inc()
+    elif event == Trace.FLOW_FAILURE:
+        flow_failures_total.labels(msg_dict["flow_name"]).inc()
+
+
+@contextmanager
+def observe_ceph_operation(adapter: str, operation: str) -> typing.Generator[None, None, None]:
+    """Measure latency of a Ceph operation done by the given storage adapter."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        ceph_operation_duration_seconds.labels(adapter, operation).observe(time.monotonic() - start)
+
+
+def observe_ceph_pages(
+    adapter: str, operation: str, pages: typing.Iterable[typing.List[str]]
+) -> typing.Generator[typing.List[str], None, None]:
+    """Measure latency of each page of a paged Ceph operation, time the consumer spends on pages is not measured."""
+    pages = iter(pages)
+    while True:
+        start = time.monotonic()
+        page = next(pages, None)
+        if page is None:
+            return
+
+        ceph_operation_duration_seconds.labels(adapter, operation).observe(time.monotonic() - start)
+        yield page
+
+
+def observe_storage_read(adapter: str, size: int) -> None:
+    """Record bytes read by a storage adapter."""
+    storage_bytes_read_total.labels(adapter).inc(size)
+
+
+def observe_storage_write(adapter: str, size: int) -> None:
+    """Record bytes written by a storage adapter."""
+    storage_bytes_written_total.labels(adapter).inc(size)
+
+
+def observe_redis_reclaimed(storage: str, keys: int, size: int) -> None:
+    """Record temporary results deleted from a Redis storage."""
+    redis_reclaimed_keys_total.labels(storage).inc(keys)
+    redis_reclaimed_bytes_total.labels(storage).inc(size)
+
+
+def observe_http_request(host: str, status_code: typing.Optional[int], duration: float) -> None:
+    """Record an outbound HTTP request, status code is None if no response was received."""
+    http_request_duration_seconds.labels(host).observe(duration)
+    http_responses_total.labels(host, str(status_code) if status_code is not None else "error").inc()
+
+
+def observe_retry(operation: str, outcome: str, delay: float = 0.0) -> None:
+    """Record an outcome of a retried operation and time spent waiting before the retry."""
+    retries_total.labels(operation, outcome).inc()
+    if delay:
+        retry_delay_seconds_total.labels(operation).inc(delay)
+
+
+def observe_write_behind_depth(depth: int) -> None:
+    """Record number of Ceph writes waiting to be flushed."""
+    write_behind_queue_depth.set(depth)
+
+
+def observe_write_behind_flush(adapter: str, duration: float) -> None:
+    """Record time a Ceph write done behind by the given adapter took until flushed."""
+    write_behind_flush_duration_seconds.labels(adapter).observe(duration)
+
+
+def observe_write_behind_barrier(duration: float) -> None:
+    """Record time spent waiting for writes behind on a barrier."""
+    write_behind_barrier_duration_seconds.observe(duration)
+
+
+def _get_registry() -> CollectorRegistry:
+    """Get registry to expose, aggregate metrics from all the worker processes in multiprocess mode."""
+    if not (os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")):
+        return REGISTRY
+
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def start_metrics_server(port: int) -> None:
+    """Expose metrics on the given port so they can be scraped by Prometheus."""
+    _LOGGER.info("Exposing worker metrics on port %d", port)
+    start_http_server(port, registry=_get_registry())
+
+
+def render_metrics() -> str:
+    """Render metrics in Prometheus text format - useful for inspecting metrics without Prometheus."""
+    return generate_latest(_get_registry()).decode()
+
+
+if __name__ == "__main__":
+    print(render_metrics(), end="")
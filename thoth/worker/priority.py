@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Priority of projects processed in fan-out flows.
+
+Projects are ranked by a score kept in a Redis sorted set. Scores are computed from stored project information
+(number of dependent projects, time of the latest release) or loaded from a CSV file (e.g. download counts):
+
+  thoth-worker-priority compute dependents
+  thoth-worker-priority compute recency
+  thoth-worker-priority load downloads downloads.csv
+  thoth-worker-priority show dependents --limit 20
+
+Foreach functions of fan-out flows emit projects in priority order, projects without any score go last in listing
+order. The top-ranked projects are marked with "priority": "high" in node arguments and are processed by
+dedicated high-priority tasks listening on their own queues. Configuration is taken from environment variables
+(can be overridden by node arguments "priority_score" and "priority_high" of the flow):
+
+ * THOTH_WORKER_PRIORITY_SCORE - score used, an empty string turns prioritization off (default dependents)
+ * THOTH_WORKER_PRIORITY_HIGH - number of top-ranked projects processed with high priority (default 1000)
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import logging
+import os
+import re
+import sys
+import typing
+
+from selinon import StoragePool
+
+from .utils import get_redis_connection
+from .utils import set_config_without_tasks
+
+_LOGGER = logging.getLogger(__name__)
+
+_SCORE = os.getenv("THOTH_WORKER_PRIORITY_SCORE", "dependents")
+_HIGH = int(os.getenv("THOTH_WORKER_PRIORITY_HIGH", 1000))
+_SCORE_KEY = "thoth:priority:{score}"
+_REQUIREMENT_NAME_RE = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+HIGH_PRIORITY = "high"
+
+
+def normalize_package_name(package_name: str) -> str:
+    """Normalize package name as done on PyPI simple API (PEP 503)."""
+    return re.sub(r"[-_.]+", "-", package_name).lower()
+
+
+def score_dependents(documents: typing.Iterable[dict]) -> typing.Dict[str, float]:
+    """Score projects by number of projects depending on them in their latest release."""
+    scores: typing.Dict[str, float] = {}
+    for document in documents:
+        info = document.get("info") or {}
+        dependent = normalize_package_name(info.get("name") or "")
+        dependencies = set()
+        for requirement in info.get("requires_dist") or []:
+            match = _REQUIREMENT_NAME_RE.match(requirement)
+            if match:
+                dependencies.add(normalize_package_name(match.group(1)))
+
+        dependencies.discard(dependent)
+        for dependency in dependencies:
+            scores[dependency] = scores.get(dependency, 0) + 1
+
+    return scores
+
+
+def score_recency(documents: typing.Iterable[dict]) -> typing.Dict[str, float]:
+    """Score projects by time of their latest upload, recently changed projects go first."""
+    scores = {}
+    for document in documents:
+        package_name = (document.get("info") or {}).get("name")
+        upload_times = [
+            artifact["upload_time"]
+            for artifacts in (document.get("releases") or {}).values()
+            for artifact in artifacts
+            if artifact.get("upload_time")
+        ]
+        if package_name and upload_times:
+            # Times are stated in UTC in ISO 8601 format, comparable as strings.
+            latest = datetime.datetime.strptime(max(upload_times)[:19], "%Y-%m-%dT%H:%M:%S")
+            scores[normalize_package_name(package_name)] = latest.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+    return scores
+
+
+# Scores computed from stored project information, more can be registered here.
+SCORE_FUNCTIONS: typing.Dict[str, typing.Callable[[typing.Iterable[dict]], typing.Dict[str, float]]] = {
+    "dependents": score_dependents,
+    "recency": score_recency,
+}
+
+
+def store_scores(score: str, scores: typing.Dict[str, float]) -> None:
+    """Store scores of projects, the previous scores are atomically replaced."""
+    score_key = _SCORE_KEY.format(score=score)
+    tmp_key = f"{score_key}:tmp"
+    connection = get_redis_connection()
+    connection.delete(tmp_key)
+
+    items = list(scores.items())
+    for idx in range(0, len(items), 10000):
+        connection.zadd(tmp_key, dict(items[idx:idx + 10000]))
+
+    if items:
+        connection.rename(tmp_key, score_key)
+    else:
+        connection.delete(score_key)
+
+
+def get_scores(score: str) -> typing.Dict[str, float]:
+    """Get scores of projects keyed by normalized project name."""
+    scores = get_redis_connection().zrange(_SCORE_KEY.format(score=score), 0, -1, withscores=True)
+    return {package_name.decode(): value for package_name, value in scores}
+
+
+def compute_scores(score: str, prefetch: int = 32) -> typing.Dict[str, float]:
+    """Compute the given score from project information stored on Ceph."""
+    documents = StoragePool.get_connected_storage("ProjectInfoStore").iter_project_info_documents(
+        prefetch=prefetch,
+        ordered=False,
+        projection=lambda document: {"info": document.get("info"), "releases": document.get("releases")},
+    )
+    return SCORE_FUNCTIONS[score](documents)
+
+
+def load_scores(csv_file: typing.TextIO) -> typing.Dict[str, float]:
+    """Load scores from a CSV file with project name and score on each line."""
+    scores = {}
+    for row in csv.reader(csv_file):
+        try:
+            scores[normalize_package_name(row[0])] = float(row[1])
+        except (IndexError, ValueError):
+            # A header or malformed line.
+            _LOGGER.debug("Skipping line %r", row)
+
+    return scores
+
+
+def iter_prioritized(
+    node_args: typing.Optional[dict], iter_items: typing.Callable[[], typing.Iterable[dict]]
+) -> typing.Generator[dict, None, None]:
+    """Iterate over items of a fan-out sorted by score of projects, mark the top-ranked ones as high priority.
+
+    Items are iterated twice so that only items with a score are kept in memory, items without any score are
+    streamed in the second pass.
+    """
+    node_args = node_args or {}
+    score = node_args.get("priority_score", _SCORE)
+    high = node_args.get("priority_high", _HIGH)
+    if not score:
+        yield from iter_items()
+        return
+
+    try:
+        scores = get_scores(score)
+    except Exception as exc:
+        # Items are processed in listing order, prioritization is not critical.
+        _LOGGER.warning("Failed to retrieve %r scores, items are not prioritized: %s", score, str(exc))
+        yield from iter_items()
+        return
+
+    if not scores:
+        _LOGGER.warning("No %r scores computed, items are not prioritized", score)
+        yield from iter_items()
+        return
+
+    ranked = []
+    for item in iter_items():
+        value = scores.get(normalize_package_name(item["package_name"]))
+        if value is not None:
+            ranked.append((value, item))
+
+    # Stable, ties keep listing order.
+    ranked.sort(key=lambda ranked_item: -ranked_item[0])
+    for idx, (_, item) in enumerate(ranked):
+        yield dict(item, priority=HIGH_PRIORITY) if idx < high else item
+
+    unranked = 0
+    for item in iter_items():
+        if normalize_package_name(item["package_name"]) not in scores:
+            unranked += 1
+            yield item
+
+    _LOGGER.info(
+        "Prioritized %d items by %r score, %d with high priority, %d without score",
+        len(ranked) + unranked,
+        score,
+        min(high, len(ranked)),
+        unranked,
+    )
+
+
+def prioritize(node_args: typing.Optional[dict], items: typing.List[dict]) -> typing.List[dict]:
+    """Sort items of a fan-out by score of projects, mark the top-ranked ones as high priority."""
+    return list(iter_prioritized(node_args, lambda: items))
+
+
+def main() -> None:
+    """Compute, load or show scores of projects."""
+    parser = argparse.ArgumentParser(description="Priority of projects processed in fan-out flows.")
+    subparsers = parser.add_subparsers(dest="command")
+    compute_parser = subparsers.add_parser("compute", help="Compute scores from stored project information.")
+    compute_parser.add_argument("score", choices=sorted(SCORE_FUNCTIONS), help="Score to compute.")
+    compute_parser.add_argument("--prefetch", type=int, default=32, help="Number of concurrent document downloads.")
+    load_parser = subparsers.add_parser("load", help="Load scores from a CSV file (project name, score).")
+    load_parser.add_argument("score", help="Name of the score loaded, e.g. downloads.")
+    load_parser.add_argument("csv_file", type=argparse.FileType("r"), help="CSV file to load scores from.")
+    show_parser = subparsers.add_parser("show", help="Show the top-ranked projects.")
+    show_parser.add_argument("score", nargs="?", default=_SCORE, help="Score to show.")
+    show_parser.add_argument("--limit", type=int, default=20, help="Number of projects shown.")
+    args = parser.parse_args()
+
+    if args.command == "compute":
+        set_config_without_tasks()
+        scores = compute_scores(args.score, args.prefetch)
+        store_scores(args.score, scores)
+        json.dump({"score": args.score, "projects": len(scores)}, sys.stdout, indent=2)
+    elif args.command == "load":
+        scores = load_scores(args.csv_file)
+        store_scores(args.score, scores)
+        json.dump({"score": args.score, "projects": len(scores)}, sys.stdout, indent=2)
+    elif args.command == "show":
+        scores = get_scores(args.score)
+        json.dump(sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:args.limit], sys.stdout, indent=2)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Opt-in profiling of task runs, profiles are stored on Ceph (see ProfilingStore).
+
+Profiling is turned on for a task run if any of the following holds:
+
+ * the task name is listed in THOTH_WORKER_PROFILE_TASKS (comma separated)
+ * the task run was randomly sampled based on THOTH_WORKER_PROFILE_SAMPLING_RATE (0.0 - 1.0)
+ * node arguments of the task state "profile": true
+
+The profiler used is configured by THOTH_WORKER_PROFILER - "cprofile" (default) or "sampling", a low overhead
+statistical profiler capturing stacks each THOTH_WORKER_PROFILE_SAMPLING_INTERVAL seconds.
+"""
+
+import cProfile
+import io
+import logging
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import typing
+
+from selinon import StoragePool
+
+_LOGGER = logging.getLogger(__name__)
+
+_PROFILE_TASKS = frozenset(
+    task_name.strip() for task_name in os.getenv("THOTH_WORKER_PROFILE_TASKS", "").split(",") if task_name.strip()
+)
+_PROFILE_SAMPLING_RATE = float(os.getenv("THOTH_WORKER_PROFILE_SAMPLING_RATE", 0.0))
+_PROFILER = os.getenv("THOTH_WORKER_PROFILER", "cprofile")
+_PROFILE_SAMPLING_INTERVAL = float(os.getenv("THOTH_WORKER_PROFILE_SAMPLING_INTERVAL", 0.005))
+# Number of entries reported in profile summaries.
+_TOP_ENTRIES = 30
+
+
+def should_profile(task_name: str, node_args: typing.Any) -> bool:
+    """Check whether the given task run should be profiled."""
+    if task_name in _PROFILE_TASKS:
+        return True
+
+    if isinstance(node_args, dict) and node_args.get("profile"):
+        return True
+
+    return _PROFILE_SAMPLING_RATE > 0.0 and random.random() < _PROFILE_SAMPLING_RATE
+
+
+class _SamplingProfiler:
+    """A statistical profiler capturing stacks of the profiled thread in a background thread."""
+
+    def __init__(self, interval: float):
+        """Initialize profiler for the current thread."""
+        self.interval = interval
+        self.stacks: typing.Dict[str, int] = {}
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        """Periodically capture stack of the profiled thread."""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+
+            if stack:
+                # Folded format as consumed by flamegraph tools - outermost frame first.
+                folded = ";".join(reversed(stack))
+                self.stacks[folded] = self.stacks.get(folded, 0) + 1
+
+    def enable(self) -> None:
+        """Start sampling."""
+        self._sampler.start()
+
+    def disable(self) -> None:
+        """Stop sampling."""
+        self._stop.set()
+        self._sampler.join()
+
+    def dump(self) -> bytes:
+        """Dump captured stacks in folded format."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items()).encode()
+
+    def summary(self) -> str:
+        """Get the most frequent stacks captured."""
+        top = sorted(self.stacks.items(), key=lambda item: item[1], reverse=True)[:_TOP_ENTRIES]
+        return "".join(f"{count}\t{stack}\n" for stack, count in top)
+
+
+def _cprofile_summary(profiler: cProfile.Profile) -> str:
+    """Get the most expensive functions based on cumulative time."""
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(_TOP_ENTRIES)
+    return stream.getvalue()
+
+
+def run_profiled(task, run: typing.Callable, node_args: typing.Any) -> typing.Any:
+    """Run the given task, profile it if requested."""
+    if not should_profile(task.task_name, node_args):
+        return run(task, node_args)
+
+    if _PROFILER == "sampling":
+        profiler = _SamplingProfiler(_PROFILE_SAMPLING_INTERVAL)
+    else:
+        profiler = cProfile.Profile()
+
+    tracemalloc_started = not tracemalloc.is_tracing()
+    if tracemalloc_started:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, "reset_peak"):
+        # Available in Python 3.9+, report peak of this task run only.
+        tracemalloc.reset_peak()
+
+    start = time.monotonic()
+    exception = None
+    profiler.enable()
+    try:
+        return run(task, node_args)
+    except Exception as exc:
+        exception = exc
+        raise
+    finally:
+        profiler.disable()
+        duration = time.monotonic() - start
+        _, memory_peak = tracemalloc.get_traced_memory()
+        top_allocations = [str(stat) for stat in tracemalloc.take_snapshot().statistics("lineno")[:_TOP_ENTRIES]]
+        if tracemalloc_started:
+            tracemalloc.stop()
+
+        if isinstance(profiler, cProfile.Profile):
+            profiler.create_stats()
+            profile_blob = marshal.dumps(profiler.stats)
+            summary = _cprofile_summary(profiler)
+        else:
+            profile_blob = profiler.dump()
+            summary = profiler.summary()
+
+        document = {
+            "task_name": task.task_name,
+            "task_id": task.task_id,
+            "flow_name": task.flow_name,
+            "node_args": node_args,
+            "profiler": _PROFILER,
+            "duration": duration,
+            "tracemalloc_peak": memory_peak,
+            "top_allocations": top_allocations,
+            "summary": summary,
+            "exception": repr(exception) if exception else None,
+        }
+
+        try:
+            profiling_store = StoragePool.get_connected_storage("ProfilingStore")
+            profiling_store.store_profile(task.task_name, task.task_id, document, profile_blob)
+        except Exception as exc:
+            # Never fail the task because of profiling.
+            _LOGGER.exception("Failed to store profile for task %r (%s): %s", task.task_name, task.task_id, str(exc))
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Progress and throughput tracking of large fan-out flows.
+
+Each fan-out done in foreach functions is assigned a run id (taken from node arguments if present) that is
+propagated to node arguments of spawned subflows together with name of the foreach function ("fan_out"). Foreach
+functions record number of subflows spawned, Selinon trace events of subflows ending (or failing without being
+retried) record completed and failed subflows - each spawned subflow is counted once regardless of number of tasks
+in it or fan-outs nested in it. Subflows spawned with high priority (see
+thoth.worker.priority) are tracked separately to report time to useful data - time until all the high-priority
+subflows finished.
+
+Progress can be queried using:
+
+  python3 -m thoth.worker.progress [run_id]
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import sys
+import time
+import typing
+import uuid
+
+from selinon.trace import Trace
+
+from .checkpoint import get_completed
+from .priority import HIGH_PRIORITY
+from .utils import get_redis_connection
+
+_LOGGER = logging.getLogger(__name__)
+
+_RUNS_KEY = "thoth:progress:runs"
+_RUN_KEY = "thoth:progress:{run_id}"
+_RATE_KEY = "thoth:progress:{run_id}:rate"
+# Keep progress information for a month.
+_EXPIRATION = 30 * 24 * 3600
+# Window (in minutes) used to compute the current processing rate.
+_RATE_WINDOW = 5
+# Number of items of a fan-out recorded at once.
+_BATCH_SIZE = 10000
+
+
+def get_run_id(node_args: typing.Optional[dict]) -> str:
+    """Get run id of the flow invocation, assign a new one if none was provided in node arguments."""
+    return (node_args or {}).get("run_id") or uuid.uuid4().hex
+
+
+def _record_spawned(
+    run_id: str, source: str, spawned: int, high: int, skipped: typing.Optional[int], first: bool
+) -> None:
+    """Record a batch of subflows spawned in the given run, skipped items were already processed in a resumed run."""
+    now = time.time()
+    connection = get_redis_connection()
+    run_key = _RUN_KEY.format(run_id=run_id)
+    pipe = connection.pipeline()
+    pipe.zadd(_RUNS_KEY, {run_id: now}, nx=True)
+    pipe.hsetnx(run_key, "started_at", now)
+    pipe.hsetnx(run_key, "source", source)
+    if skipped is not None and first:
+        # Subflows in flight when the run was interrupted are lost, count only the checkpointed ones. Only the
+        # remaining high-priority subflows are tracked in the resumed run.
+        for field in ("spawned", "completed", "failed", "spawned:high", "completed:high", "failed:high"):
+            pipe.hset(run_key, field, 0)
+        pipe.hdel(run_key, "useful_data_at")
+        pipe.hincrby(run_key, "resumed", 1)
+    if skipped:
+        pipe.hincrby(run_key, "completed", skipped)
+    pipe.hincrby(run_key, "spawned", spawned + (skipped or 0))
+    pipe.hincrby(run_key, "spawned:high", high)
+    pipe.hset(run_key, "updated_at", now)
+    pipe.expire(run_key, _EXPIRATION)
+    pipe.execute()
+
+
+def iter_fan_out(
+    node_args: typing.Optional[dict], items: typing.Iterable[dict], source: str
+) -> typing.Generator[dict, None, None]:
+    """Extend node arguments of subflows spawned with run id and record number of subflows spawned.
+
+    Items are consumed lazily and recorded in batches before they are spawned. If node arguments state
+    "resume": true, items already processed in the run (see thoth.worker.checkpoint) are skipped.
+    """
+    node_args = node_args or {}
+    run_id = get_run_id(node_args)
+    completed = get_completed(run_id) if node_args.get("resume") else None
+    total_skipped = 0
+    first = True
+    items = iter(items)
+    while True:
+        batch = []
+        skipped = 0 if completed is not None else None
+        for item in itertools.islice(items, _BATCH_SIZE):
+            if completed is not None and item.get("package_name") in completed:
+                skipped += 1
+            else:
+                batch.append(dict(node_args, **item, run_id=run_id, fan_out=source))
+
+        if not first and not batch and not skipped:
+            break
+
+        try:
+            high = sum(1 for item in batch if item.get("priority") == HIGH_PRIORITY)
+            _record_spawned(run_id, source, len(batch), high, skipped, first)
+        except Exception as exc:
+            # Progress tracking is not critical for running flows.
+            _LOGGER.warning("Failed to record fan-out progress for run %r: %s", run_id, str(exc))
+
+        first = False
+        total_skipped += skipped or 0
+        yield from batch
+
+    if completed is not None:
+        _LOGGER.info("Resumed run %r - %d items were already processed", run_id, total_skipped)
+
+
+def track_fan_out(node_args: typing.Optional[dict], items: typing.Iterable[dict], source: str) -> typing.List[dict]:
+    """Extend node arguments of subflows spawned with run id and record number of subflows spawned, see iter_fan_out."""
+    return list(iter_fan_out(node_args, items, source))
+
+
+def _record_done(run_id: str, flow_name: str, failed: bool, priority: typing.Optional[str] = None) -> None:
+    """Record a finished subflow in the given run."""
+    now = time.time()
+    state = "failed" if failed else "completed"
+    run_key = _RUN_KEY.format(run_id=run_id)
+    rate_key = _RATE_KEY.format(run_id=run_id)
+
+    pipe = get_redis_connection().pipeline()
+    pipe.hincrby(run_key, state, 1)
+    pipe.hincrby(run_key, f"{state}:{flow_name}", 1)
+    pipe.hset(run_key, "updated_at", now)
+    pipe.hincrby(rate_key, int(now // 60), 1)
+    pipe.expire(rate_key, _EXPIRATION)
+    pipe.hsetnx(run_key, "first_done_at", now)
+    if priority == HIGH_PRIORITY:
+        pipe.hincrby(run_key, f"{state}:high", 1)
+        pipe.hmget(run_key, ["spawned:high", "completed:high", "failed:high"])
+    results = pipe.execute()
+
+    if priority == HIGH_PRIORITY:
+        spawned, completed, failed = (int(value or 0) for value in results[-1])
+        if completed + failed >= spawned:
+            get_redis_connection().hsetnx(run_key, "useful_data_at", now)
+
+
+def trace_progress(event: int, msg_dict: dict) -> None:
+    """A Selinon trace function recording finished subflows of tracked runs."""
+    if event not in (Trace.FLOW_END, Trace.FLOW_FAILURE) or msg_dict.get("will_retry"):
+        return
+
+    node_args = msg_dict.get("node_args")
+    if not isinstance(node_args, dict) or not node_args.get("run_id") or not node_args.get("fan_out"):
+        # Not spawned by a tracked fan-out, e.g. the flow starting the run.
+        return
+
+    try:
+        failed = event == Trace.FLOW_FAILURE
+        _record_done(node_args["run_id"], msg_dict["flow_name"], failed=failed, priority=node_args.get("priority"))
+    except Exception as exc:
+        _LOGGER.warning("Failed to record progress for event %r: %s", event, str(exc))
+
+
+def get_progress(run_id: str) -> dict:
+    """Get progress of the given run, including throughput and estimated time to finish."""
+    connection = get_redis_connection()
+    record = {
+        key.decode(): value.decode()
+        for key, value in connection.hgetall(_RUN_KEY.format(run_id=run_id)).items()
+    }
+    if not record:
+        raise KeyError(f"No progress information found for run {run_id!r}")
+
+    spawned = int(record.pop("spawned", 0))
+    completed = int(record.pop("completed", 0))
+    failed = int(record.pop("failed", 0))
+    started_at = float(record.pop("started_at"))
+    updated_at = float(record.pop("updated_at", started_at))
+    first_done_at = record.pop("first_done_at", None)
+    useful_data_at = record.pop("useful_data_at", None)
+    high = {state: int(record.pop(f"{state}:high", 0)) for state in ("spawned", "completed", "failed")}
+    now = time.time()
+
+    current_minute = int(now // 60)
+    rate_counts = connection.hmget(
+        _RATE_KEY.format(run_id=run_id),
+        [current_minute - i for i in range(1, _RATE_WINDOW + 1)],
+    )
+    # The current minute is not finished yet, do not include it.
+    current_rate = sum(int(count or 0) for count in rate_counts) / (_RATE_WINDOW * 60)
+
+    elapsed = max(updated_at - started_at, 1e-9)
+    average_rate = (completed + failed) / elapsed
+    remaining = max(spawned - completed - failed, 0)
+    rate = current_rate or average_rate
+
+    if not remaining:
+        eta = 0.0
+    elif rate:
+        eta = remaining / rate
+    else:
+        eta = None
+
+    return {
+        "run_id": run_id,
+        "source": record.pop("source", None),
+        "resumed": int(record.pop("resumed", 0)),
+        "spawned": spawned,
+        "completed": completed,
+        "failed": failed,
+        "remaining": remaining,
+        "started_at": started_at,
+        "updated_at": updated_at,
+        "average_rate": average_rate,
+        "current_rate": current_rate,
+        "eta": eta,
+        "time_to_first_result": float(first_done_at) - started_at if first_done_at else None,
+        "high_priority": high,
+        # Time until all the high-priority subflows finished.
+        "time_to_useful_data": float(useful_data_at) - started_at if useful_data_at else None,
+        "per_flow": record,
+    }
+
+
+def list_runs(limit: int = 20) -> typing.List[str]:
+    """List most recent runs tracked."""
+    return [run_id.decode() for run_id in get_redis_connection().zrevrange(_RUNS_KEY, 0, limit - 1)]
+
+
+def main() -> None:
+    """Report progress of tracked runs."""
+    parser = argparse.ArgumentParser(description="Report progress of fan-out flows.")
+    parser.add_argument("run_id", nargs="*", help="Run ids to report, the most recent runs if omitted.")
+    parser.add_argument("--limit", type=int, default=10, help="Number of the most recent runs to report.")
+    args = parser.parse_args()
+
+    report = []
+    for run_id in args.run_id or list_runs(args.limit):
+        try:
+            report.append(get_progress(run_id))
+        except KeyError as exc:
+            _LOGGER.warning(str(exc))
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Queue backlog and processing rate exporter used for autoscaling of worker deployments.
+
+Depth of Selinon task and dispatcher queues and age of the oldest message are read from the Redis broker. The age
+is computed from the time the message was published, stated in its headers by workers (messages published by other
+clients are aged from the first sample they were seen as the oldest one). Workers record messages processed per
+queue and time spent processing them (a Selinon trace function), enqueue rate is derived from change of depth and
+dequeue rate. A recommended number of replicas is computed for each group of
+queues served by a deployment - enough replicas to keep up with the enqueue rate and to drain the backlog within
+the target time:
+
+  thoth-worker-queues report
+  thoth-worker-queues serve --port 8001 --interval 15
+
+Configuration is taken from environment variables:
+
+ * THOTH_WORKER_QUEUE_GROUPS - queues served by each deployment, e.g. "pypi=download_project_info_task;p2v=..."
+   (default a "dispatcher" group with dispatcher queues and a "worker" group with all the task queues)
+ * THOTH_WORKER_AUTOSCALE_TARGET_SECONDS - time in which the backlog should be drained (default 600)
+ * THOTH_WORKER_AUTOSCALE_MIN_REPLICAS, THOTH_WORKER_AUTOSCALE_MAX_REPLICAS - bounds of recommendations (1, 20)
+ * THOTH_WORKER_AUTOSCALE_REPLICA_RATE - messages processed per second by a replica if not measured yet (default 1)
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+import time
+import typing
+
+from celery.signals import before_task_publish
+from selinon import Config
+from selinon.trace import Trace
+
+from .utils import get_redis_connection
+from .utils import set_config_without_tasks
+
+_LOGGER = logging.getLogger(__name__)
+
+_TARGET_SECONDS = float(os.getenv("THOTH_WORKER_AUTOSCALE_TARGET_SECONDS", 600))
+_MIN_REPLICAS = int(os.getenv("THOTH_WORKER_AUTOSCALE_MIN_REPLICAS", 1))
+_MAX_REPLICAS = int(os.getenv("THOTH_WORKER_AUTOSCALE_MAX_REPLICAS", 20))
+_REPLICA_RATE = float(os.getenv("THOTH_WORKER_AUTOSCALE_REPLICA_RATE", 1.0))
+
+_PROCESSED_KEY = "thoth:queues:processed"
+_BUSY_KEY = "thoth:queues:busy"
+# Header of published messages stating time they were published.
+_PUBLISHED_AT_HEADER = "thoth_published_at"
+
+# Start times of tasks and dispatcher runs in this process keyed by task id.
+_TASK_STARTS: typing.Dict[str, typing.Tuple[str, float]] = {}
+
+
+def record_processed(connection, queue: str, duration: float) -> None:
+    """Record a message processed from the given queue and time spent processing it."""
+    pipe = connection.pipeline()
+    pipe.hincrby(_PROCESSED_KEY, queue, 1)
+    pipe.hincrbyfloat(_BUSY_KEY, queue, duration)
+    pipe.execute()
+
+
+@before_task_publish.connect
+def _record_published_at(headers: typing.Optional[dict] = None, **kwargs) -> None:
+    """State time of publishing in headers of messages sent by this process, used to compute age of messages."""
+    if headers is not None:
+        headers[_PUBLISHED_AT_HEADER] = time.time()
+
+
+def get_published_at(message: bytes) -> typing.Optional[float]:
+    """Get time the given message (as stored by kombu Redis transport) was published, if stated in its headers."""
+    try:
+        published_at = json.loads(message).get("headers", {}).get(_PUBLISHED_AT_HEADER)
+    except (AttributeError, ValueError):
+        return None
+
+    return float(published_at) if isinstance(published_at, (int, float)) else None
+
+
+def trace_queues(event: int, msg_dict: dict) -> None:
+    """A Selinon trace function recording messages processed per queue."""
+    try:
+        if event == Trace.TASK_START:
+            queue = Config.task_queues.get(msg_dict.get("task_name"))
+            if queue:
+                _TASK_STARTS[msg_dict["task_id"]] = (queue, time.monotonic())
+        elif event in (Trace.TASK_END, Trace.TASK_FAILURE, Trace.TASK_RETRY):
+            task_start = _TASK_STARTS.pop(msg_dict.get("task_id"), None)
+            if task_start:
+                queue, start = task_start
+                record_processed(get_redis_connection(), queue, time.monotonic() - start)
+        elif event == Trace.DISPATCHER_WAKEUP:
+            # Each dispatcher run consumes one message, time spent in dispatcher runs is not measured.
+            queue = Config.dispatcher_queues.get(msg_dict.get("flow_name"))
+            if queue:
+                get_redis_connection().hincrby(_PROCESSED_KEY, queue, 1)
+    except Exception as exc:
+        _LOGGER.warning("Failed to record processed message for event %r: %s", event, str(exc))
+
+
+class RedisBroker:
+    """Queue statistics read from a Redis broker as used by Celery (kombu Redis transport)."""
+
+    # Kombu keeps messages with non-default priority in separate lists, messages are pushed left and popped right.
+    _PRIORITY_SEPARATOR = "\x06\x16"
+    _PRIORITY_STEPS = (3, 6, 9)
+
+    def __init__(self, connection):
+        """Use the given Redis connection (or any client implementing llen and lindex)."""
+        self.connection = connection
+
+    @classmethod
+    def from_url(cls, broker_url: str) -> "RedisBroker":
+        """Connect to the broker with the given URL."""
+        if not broker_url.startswith(("redis://", "rediss://", "unix://")):
+            raise ValueError(f"Only Redis broker is supported, got {broker_url.split(':', 1)[0]!r}")
+
+        import redis
+
+        return cls(redis.Redis.from_url(broker_url))
+
+    def _get_keys(self, queue: str) -> typing.List[str]:
+        """Get keys of lists holding messages of the given queue."""
+        return [queue] + [f"{queue}{self._PRIORITY_SEPARATOR}{step}" for step in self._PRIORITY_STEPS]
+
+    def get_depths(self, queues: typing.Iterable[str]) -> typing.Dict[str, int]:
+        """Get number of messages waiting in each of the given queues."""
+        queues = list(queues)
+        pipe = self.connection.pipeline()
+        for queue in queues:
+            for key in self._get_keys(queue):
+                pipe.llen(key)
+        lengths = pipe.execute()
+
+        keys_per_queue = len(self._PRIORITY_STEPS) + 1
+        return {
+            queue: sum(lengths[idx * keys_per_queue:(idx + 1) * keys_per_queue]) for idx, queue in enumerate(queues)
+        }
+
+    def get_oldest(self, queue: str) -> typing.Optional[bytes]:
+        """Get the oldest message waiting in the given queue, the default priority is consumed first."""
+        for key in self._get_keys(queue):
+            message = self.connection.lindex(key, -1)
+            if message is not None:
+                return message
+
+        return None
+
+
+def get_queue_groups() -> typing.Dict[str, typing.List[str]]:
+    """Get queues of each group as configured, queues not assigned to any group fall into the worker group."""
+    task_queues = set(Config.task_queues.values())
+    dispatcher_queues = set(Config.dispatcher_queues.values())
+
+    groups: typing.Dict[str, typing.List[str]] = {}
+    for group_spec in os.getenv("THOTH_WORKER_QUEUE_GROUPS", "").split(";"):
+        if not group_spec.strip():
+            continue
+        name, _, queues = group_spec.partition("=")
+        groups[name.strip()] = sorted({queue.strip() for queue in queues.split(",") if queue.strip()})
+
+    assigned = {queue for queues in groups.values() for queue in queues}
+    if dispatcher_queues - assigned:
+        groups.setdefault("dispatcher", []).extend(sorted(dispatcher_queues - assigned))
+    if task_queues - dispatcher_queues - assigned:
+        groups.setdefault("worker", []).extend(sorted(task_queues - dispatcher_queues - assigned))
+
+    return groups
+
+
+def recommend_replicas(
+    depth: int,
+    enqueue_rate: float,
+    replica_rate: float,
+    target_seconds: float = _TARGET_SECONDS,
+    min_replicas: int = _MIN_REPLICAS,
+    max_replicas: int = _MAX_REPLICAS,
+) -> int:
+    """Recommend number of replicas keeping up with the enqueue rate and draining the backlog in target time."""
+    needed = (max(enqueue_rate, 0.0) + depth / target_seconds) / replica_rate
+    return max(min_replicas, min(max_replicas, math.ceil(needed - 1e-9)))
+
+
+class QueueMonitor:
+    """Sample queue statistics, rates are computed from the previous sample."""
+
+    def __init__(
+        self,
+        broker: RedisBroker,
+        groups: typing.Dict[str, typing.List[str]],
+        bookkeeping=None,
+        clock: typing.Callable[[], float] = time.time,
+    ):
+        """Monitor queues of the given groups, processed messages are read from the bookkeeping Redis."""
+        self.broker = broker
+        self.groups = groups
+        self.bookkeeping = bookkeeping or get_redis_connection()
+        self.clock = clock
+        self._previous: typing.Optional[typing.Tuple[float, typing.Dict[str, int], typing.Dict[str, int]]] = None
+        # Identity of the oldest message in each queue without publish time in headers and time it was first seen.
+        self._oldest: typing.Dict[str, typing.Tuple[str, float]] = {}
+
+    def _get_processed(self) -> typing.Tuple[typing.Dict[str, int], typing.Dict[str, float]]:
+        """Get number of messages processed and time spent processing them per queue."""
+        pipe = self.bookkeeping.pipeline()
+        pipe.hgetall(_PROCESSED_KEY)
+        pipe.hgetall(_BUSY_KEY)
+        processed, busy = pipe.execute()
+        return (
+            {queue.decode(): int(value) for queue, value in processed.items()},
+            {queue.decode(): float(value) for queue, value in busy.items()},
+        )
+
+    def _get_oldest_age(self, queue: str, now: float) -> typing.Optional[float]:
+        """Get age of the oldest message, measured from the time it was published if stated in its headers.
+
+        Otherwise, the age is measured from the first sample the message was seen as the oldest one.
+        """
+        message = self.broker.get_oldest(queue)
+        if message is None:
+            self._oldest.pop(queue, None)
+            return None
+
+        published_at = get_published_at(message)
+        if published_at is not None:
+            self._oldest.pop(queue, None)
+            return max(now - published_at, 0.0)
+
+        identity = hashlib.sha1(message).hexdigest()
+        if self._oldest.get(queue, (None,))[0] != identity:
+            self._oldest[queue] = (identity, now)
+        return now - self._oldest[queue][1]
+
+    def sample(self) -> dict:
+        """Sample queues, report statistics per queue and group together with recommended replicas."""
+        now = self.clock()
+        queues = sorted({queue for queues in self.groups.values() for queue in queues})
+        depths = self.broker.get_depths(queues)
+        processed, busy = self._get_processed()
+
+        report_queues = {}
+        for queue in queues:
+            dequeue_rate = enqueue_rate = None
+            if self._previous:
+                previous_time, previous_depths, previous_processed = self._previous
+                elapsed = max(now - previous_time, 1e-9)
+                dequeued = processed.get(queue, 0) - previous_processed.get(queue, 0)
+                dequeue_rate = max(dequeued, 0) / elapsed
+                enqueue_rate = max(depths[queue] - previous_depths.get(queue, 0) + dequeued, 0) / elapsed
+
+            report_queues[queue] = {
+                "depth": depths[queue],
+                "enqueue_rate": enqueue_rate,
+                "dequeue_rate": dequeue_rate,
+                "oldest_age": self._get_oldest_age(queue, now),
+                # Messages processed per second by a single replica (concurrency 1) while busy.
+                "replica_rate": processed[queue] / busy[queue] if busy.get(queue) and processed.get(queue) else None,
+            }
+
+        self._previous = (now, depths, processed)
+
+        report_groups = {}
+        for group, group_queues in sorted(self.groups.items()):
+            stats = [report_queues[queue] for queue in group_queues]
+            depth = sum(queue_stats["depth"] for queue_stats in stats)
+            enqueue_rate = sum(queue_stats["enqueue_rate"] or 0.0 for queue_stats in stats)
+            # Time one replica needs to process a message, weighted by messages waiting or arriving.
+            seconds_per_message = [
+                (queue_stats["depth"] + (queue_stats["enqueue_rate"] or 0.0), 1 / queue_stats["replica_rate"])
+                for queue_stats in stats
+                if queue_stats["replica_rate"]
+            ]
+            weight = sum(item[0] for item in seconds_per_message)
+            if weight:
+                replica_rate = weight / sum(item[0] * item[1] for item in seconds_per_message)
+            else:
+                replica_rate = _REPLICA_RATE
+
+            ages = [queue_stats["oldest_age"] for queue_stats in stats if queue_stats["oldest_age"] is not None]
+            report_groups[group] = {
+                "queues": group_queues,
+                "depth": depth,
+                "enqueue_rate": enqueue_rate,
+                "dequeue_rate": sum(queue_stats["dequeue_rate"] or 0.0 for queue_stats in stats),
+                "oldest_age": max(ages) if ages else None,
+                "replica_rate": replica_rate,
+                "recommended_replicas": recommend_replicas(depth, enqueue_rate, replica_rate),
+            }
+
+        return {"timestamp": now, "queues": report_queues, "groups": report_groups}
+
+
+def serve(monitor: QueueMonitor, port: int, interval: float) -> None:
+    """Sample queues periodically and expose statistics as Prometheus metrics."""
+    from prometheus_client import CollectorRegistry
+    from prometheus_client import Gauge
+    from prometheus_client import start_http_server
+
+    registry = CollectorRegistry()
+    queue_gauges = {
+        name: Gauge(f"thoth_worker_queue_{name}", description, ["queue"], registry=registry)
+        for name, description in (
+            ("depth", "Messages waiting in the queue."),
+            ("enqueue_rate", "Messages enqueued per second."),
+            ("dequeue_rate", "Messages dequeued per second."),
+            ("oldest_age", "Age of the oldest message waiting in the queue, in seconds."),
+        )
+    }
+    group_gauges = {
+        name: Gauge(f"thoth_worker_queue_group_{name}", description, ["group"], registry=registry)
+        for name, description in (
+            ("depth", "Messages waiting in queues of the group."),
+            ("enqueue_rate", "Messages enqueued per second to queues of the group."),
+            ("oldest_age", "Age of the oldest message waiting in queues of the group, in seconds."),
+            ("recommended_replicas", "Recommended number of replicas serving queues of the group."),
+        )
+    }
+
+    _LOGGER.info("Exposing queue metrics on port %d", port)
+    start_http_server(port, registry=registry)
+    while True:
+        try:
+            report = monitor.sample()
+        except Exception as exc:
+            _LOGGER.exception("Failed to sample queues: %s", str(exc))
+        else:
+            for gauges, label_values in ((queue_gauges, report["queues"]), (group_gauges, report["groups"])):
+                for label_value, stats in label_values.items():
+                    for name, gauge in gauges.items():
+                        # Rates are not known on the first sample, ages if the queue is empty.
+                        gauge.labels(label_value).set(stats[name] if stats[name] is not None else float("nan"))
+
+        time.sleep(interval)
+
+
+def main() -> None:
+    """Report queue statistics or expose them as Prometheus metrics."""
+    parser = argparse.ArgumentParser(description="Queue backlog and processing rate exporter.")
+    subparsers = parser.add_subparsers(dest="command")
+    report_parser = subparsers.add_parser("report", help="Report queue statistics, rates are sampled over interval.")
+    report_parser.add_argument("--interval", type=float, default=10.0, help="Seconds between the two samples.")
+    serve_parser = subparsers.add_parser("serve", help="Expose queue statistics as Prometheus metrics.")
+    serve_parser.add_argument("--port", type=int, default=8001, help="Port to expose metrics on.")
+    serve_parser.add_argument("--interval", type=float, default=15.0, help="Seconds between samples.")
+    args = parser.parse_args()
+
+    if args.command not in ("report", "serve"):
+        parser.print_help()
+        sys.exit(1)
+
+    set_config_without_tasks()
+    monitor = QueueMonitor(RedisBroker.from_url(os.environ["BROKER_URL"]), get_queue_groups())
+
+    if args.command == "serve":
+        serve(monitor, args.port, args.interval)
+        return
+
+    monitor.sample()
+    time.sleep(args.interval)
+    json.dump(monitor.sample(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Retry policy for transient failures of HTTP requests and Ceph operations done in tasks.
+
+Errors are classified as retryable (connection errors, timeouts, HTTP 408, 429 and 5xx, GitHub rate limiting, Ceph
+throttling) or fatal (anything else, including FatalTaskError). Retryable operations are retried in the task with
+exponential backoff and full jitter, Retry-After (or GitHub rate limit reset) is honored. Time spent waiting is
+bounded by a budget per task run so a task does not block a worker for long - once exhausted, the error is
+propagated and handled by Selinon as before. Configuration is taken from environment variables:
+
+ * THOTH_WORKER_RETRY_ATTEMPTS - maximum number of attempts of an operation (default 5)
+ * THOTH_WORKER_RETRY_BASE_DELAY - delay before the first retry, doubled on each attempt (default 0.5 seconds)
+ * THOTH_WORKER_RETRY_MAX_DELAY - maximum delay between two attempts (default 30 seconds)
+ * THOTH_WORKER_RETRY_BUDGET - maximum time spent waiting for retries in a task run (default 120 seconds)
+"""
+
+import datetime
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+import typing
+
+import requests
+from selinon import FatalTaskError
+
+from .metrics import observe_retry
+
+try:
+    import botocore.exceptions
+except ImportError:
+    botocore = None
+
+_LOGGER = logging.getLogger(__name__)
+
+_ATTEMPTS = int(os.getenv("THOTH_WORKER_RETRY_ATTEMPTS", 5))
+_BASE_DELAY = float(os.getenv("THOTH_WORKER_RETRY_BASE_DELAY", 0.5))
+_MAX_DELAY = float(os.getenv("THOTH_WORKER_RETRY_MAX_DELAY", 30.0))
+_BUDGET = float(os.getenv("THOTH_WORKER_RETRY_BUDGET", 120.0))
+
+RETRYABLE_STATUS_CODES = frozenset((408, 429, 500, 502, 503, 504))
+_RETRYABLE_CEPH_ERROR_CODES = frozenset(
+    ("InternalError", "RequestTimeout", "ServiceUnavailable", "SlowDown", "Throttling", "ThrottlingException")
+)
+
+T = typing.TypeVar("T")
+
+# Time left for waiting in the current task run, None if not run in a task. Prefetching threads share the budget.
+_BUDGET_LOCK = threading.Lock()
+_BUDGET_LEFT: typing.List[typing.Optional[float]] = [None]
+
+
+def is_rate_limited(response: requests.models.Response) -> bool:
+    """Check if the response states the request was rate limited (GitHub uses 403 with no remaining requests)."""
+    return response.status_code == 429 or (
+        response.status_code == 403 and response.headers.get("X-RateLimit-Remaining") == "0"
+    )
+
+
+def is_retryable_response(response: requests.models.Response) -> bool:
+    """Check if the request can succeed if issued again."""
+    return response.status_code in RETRYABLE_STATUS_CODES or is_rate_limited(response)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Classify the given error as retryable or fatal."""
+    if isinstance(exc, FatalTaskError):
+        return False
+
+    if isinstance(exc, requests.exceptions.HTTPError):
+        return exc.response is not None and is_retryable_response(exc.response)
+
+    if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+
+    if isinstance(exc, requests.exceptions.ChunkedEncodingError):
+        return True
+
+    if botocore is not None:
+        if isinstance(exc, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError)):
+            return True
+
+        if isinstance(exc, botocore.exceptions.ClientError):
+            error = exc.response.get("Error", {})
+            status_code = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+            return error.get("Code") in _RETRYABLE_CEPH_ERROR_CODES or status_code in RETRYABLE_STATUS_CODES
+
+    return False
+
+
+def get_retry_after(exc: BaseException) -> typing.Optional[float]:
+    """Get time requested by the server to wait before the next attempt, in seconds."""
+    response = getattr(exc, "response", None)
+    if not isinstance(response, requests.models.Response):
+        return None
+
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        if retry_after.strip().isdigit():
+            return float(retry_after)
+
+        try:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            # Malformed dates raise TypeError on older Python versions, ValueError on newer ones.
+            _LOGGER.warning("Ignoring malformed Retry-After header: %r", retry_after)
+            return None
+
+        if retry_at.tzinfo is None:
+            # Dates with "-0000" zone are parsed as naive, they are in UTC.
+            retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+        return max(retry_at.timestamp() - time.time(), 0.0)
+
+    rate_limit_reset = response.headers.get("X-RateLimit-Reset")
+    if is_rate_limited(response) and rate_limit_reset and rate_limit_reset.isdigit():
+        return max(int(rate_limit_reset) - time.time(), 0.0)
+
+    return None
+
+
+def get_delay(attempt: int, retry_after: typing.Optional[float] = None) -> float:
+    """Get delay before the given attempt (starting at 1 for the first retry), exponential with full jitter."""
+    delay = random.uniform(0, min(_MAX_DELAY, _BASE_DELAY * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        # Never retry sooner than the server asked to, jitter spreads retries of concurrent workers.
+        delay += retry_after
+    return delay
+
+
+def _consume_budget(delay: float) -> bool:
+    """Consume the given time from the budget of the current task run, return False if not enough time is left."""
+    with _BUDGET_LOCK:
+        if _BUDGET_LEFT[0] is None:
+            return delay <= _BUDGET
+
+        if _BUDGET_LEFT[0] < delay:
+            return False
+
+        _BUDGET_LEFT[0] -= delay
+        return True
+
+
+def run_with_retry_budget(func: typing.Callable[[], T]) -> T:
+    """Run the given callable (a task run) with a fresh budget of time for retries."""
+    with _BUDGET_LOCK:
+        _BUDGET_LEFT[0] = _BUDGET
+
+    try:
+        return func()
+    finally:
+        with _BUDGET_LOCK:
+            _BUDGET_LEFT[0] = None
+
+
+def call_with_retry(operation: str, func: typing.Callable[[], T]) -> T:
+    """Call the given callable, retry on retryable errors as long as attempts and budget allow."""
+    attempt = 0
+    while True:
+        try:
+            result = func()
+        except Exception as exc:
+            if not is_retryable(exc):
+                if attempt:
+                    observe_retry(operation, "fatal")
+                raise
+
+            attempt += 1
+            delay = get_delay(attempt, get_retry_after(exc))
+            if attempt >= _ATTEMPTS or not _consume_budget(delay):
+                observe_retry(operation, "exhausted")
+                _LOGGER.warning("Giving up %s after %d attempt(s): %s", operation, attempt, str(exc))
+                raise
+
+            observe_retry(operation, "retried", delay)
+            _LOGGER.info("Retrying %s in %.2f seconds (attempt %d): %s", operation, delay, attempt + 1, str(exc))
+            time.sleep(delay)
+            continue
+
+        if attempt:
+            observe_retry(operation, "recovered")
+        return result
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Serialization of documents stored on Ceph, task results kept in Redis and Celery messages.
+
+Supported formats are "json" (standard library), "orjson" and "msgpack" - the latter two are used only if the
+corresponding package is installed, "json" is used otherwise. Data serialized as JSON (by "json" or "orjson")
+carry no marker so they stay readable by any JSON consumer, other formats are prefixed by a format marker. Data
+without a marker are treated as JSON so previously stored data stay readable regardless of the configured format.
+Formats are configured using environment variables:
+
+ * THOTH_WORKER_SERIALIZER_CEPH - format of documents stored on Ceph (default json)
+ * THOTH_WORKER_SERIALIZER_REDIS - format of task results kept in Redis (default json)
+ * THOTH_WORKER_SERIALIZER_MESSAGES - format of Celery messages carrying node arguments (default json)
+"""
+
+import json
+import logging
+import os
+import re
+import typing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_LOGGER = logging.getLogger(__name__)
+
+# Valid JSON never starts with a null byte.
+_MARKER_PREFIX = b"\x00thoth:"
+_MARKER_SUFFIX = b"\x00"
+# Integers not fitting into 64 bits have at least 20 digits.
+_LONG_NUMBER = re.compile(rb"\d{20}")
+
+
+def _json_dumps(obj: typing.Any, pretty: bool) -> bytes:
+    """Serialize to JSON using the standard library."""
+    if pretty:
+        # Serialized the same way as CephStore.store_document does.
+        return json.dumps(obj, sort_keys=True, separators=(",", ": "), indent=2).encode()
+    return json.dumps(obj).encode()
+
+
+def _json_loads(blob: bytes) -> typing.Any:
+    """Deserialize JSON, using orjson if available as it is faster, the standard library if orjson is not exact."""
+    # orjson silently turns integers not fitting into 64 bits into floats.
+    if orjson is not None and not _LONG_NUMBER.search(blob):
+        try:
+            return orjson.loads(blob)
+        except orjson.JSONDecodeError:
+            # NaN and Infinity written by the standard library are rejected by orjson.
+            pass
+    return json.loads(blob.decode())
+
+
+def _orjson_dumps(obj: typing.Any, pretty: bool) -> bytes:
+    """Serialize to JSON using orjson."""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS if pretty else 0)
+
+
+def _msgpack_dumps(obj: typing.Any, pretty: bool) -> bytes:
+    """Serialize to msgpack, there is no pretty form."""
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def _msgpack_loads(blob: bytes) -> typing.Any:
+    """Deserialize msgpack, map keys are not restricted to strings as in JSON."""
+    return msgpack.unpackb(blob, raw=False, strict_map_key=False)
+
+
+class Serializer(typing.NamedTuple):
+    """A serialization format."""
+
+    name: str
+    dumps: typing.Callable[[typing.Any, bool], bytes]
+    loads: typing.Callable[[bytes], typing.Any]
+    # Serialized data are prefixed by the marker, JSON compatible formats have none.
+    marker: bytes
+
+
+SERIALIZERS: typing.Dict[str, Serializer] = {"json": Serializer("json", _json_dumps, _json_loads, b"")}
+if orjson is not None:
+    SERIALIZERS["orjson"] = Serializer("orjson", _orjson_dumps, _json_loads, b"")
+if msgpack is not None:
+    SERIALIZERS["msgpack"] = Serializer(
+        "msgpack", _msgpack_dumps, _msgpack_loads, _MARKER_PREFIX + b"msgpack" + _MARKER_SUFFIX
+    )
+
+
+def get_serializer(name: str) -> Serializer:
+    """Get serializer of the given format, fall back to JSON if the format is not available."""
+    serializer = SERIALIZERS.get(name)
+    if serializer is None:
+        _LOGGER.warning("Serialization format %r is not available, falling back to JSON", name)
+        serializer = SERIALIZERS["json"]
+    return serializer
+
+
+def get_configured_serializer(target: str) -> Serializer:
+    """Get serializer configured for the given target - ceph, redis or messages."""
+    return get_serializer(os.getenv(f"THOTH_WORKER_SERIALIZER_{target.upper()}", "json"))
+
+
+def serialize(obj: typing.Any, serializer: Serializer, pretty: bool = False) -> bytes:
+    """Serialize the given object, prefixed by the format marker."""
+    return serializer.marker + serializer.dumps(obj, pretty)
+
+
+def deserialize(blob: bytes) -> typing.Any:
+    """Deserialize data serialized in any supported format, data without a format marker are JSON."""
+    if not blob.startswith(_MARKER_PREFIX):
+        return _json_loads(blob)
+
+    end = blob.index(_MARKER_SUFFIX, len(_MARKER_PREFIX))
+    name = blob[len(_MARKER_PREFIX):end].decode()
+    serializer = SERIALIZERS.get(name)
+    if serializer is None:
+        raise ValueError(f"Data serialized in format {name!r} which is not available, is the package installed?")
+
+    return serializer.loads(blob[end + len(_MARKER_SUFFIX):])
+
+
+def get_celery_configuration() -> dict:
+    """Get Celery configuration of message serialization, messages in JSON are always accepted."""
+    serializer = get_configured_serializer("messages")
+    if serializer.name == "json":
+        return {}
+
+    if serializer.name == "orjson":
+        from kombu.serialization import register
+
+        register(
+            "orjson",
+            lambda obj: orjson.dumps(obj),
+            orjson.loads,
+            content_type="application/x-orjson",
+            content_encoding="binary",
+        )
+
+    # Celery supports msgpack natively.
+    return {
+        "task_serializer": serializer.name,
+        "result_serializer": serializer.name,
+        "accept_content": ["json", serializer.name],
+    }
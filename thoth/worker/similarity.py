@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Similar-project queries over the project2vec model.
+
+Project2vec vectors are binary and sparse, the index keeps them as a sparse matrix in CSR form (keywords of each
+project) together with its transposition (an inverted index - projects stating each keyword). Arrays are stored
+as .npy files so they can be memory mapped. Similarity of a project to all the other projects is computed by
+counting keywords shared with the query project using posting lists of its keywords, only projects sharing at
+least one keyword are considered:
+
+  thoth-worker-similarity build
+  thoth-worker-similarity similar flask --top-k 10
+  thoth-worker-similarity keyword tensorflow
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import typing
+
+import numpy as np
+from selinon import StoragePool
+
+from .exceptions import NotFoundException
+from .utils import set_config_without_tasks
+
+_LOGGER = logging.getLogger(__name__)
+
+_ARRAYS = ("indptr", "indices", "keyword_indptr", "keyword_indices")
+_CACHE_DIR = os.getenv("THOTH_WORKER_SIMILARITY_CACHE_DIR", os.path.join(tempfile.gettempdir(), "thoth-similarity"))
+
+
+def _build_inverted(indptr: np.ndarray, indices: np.ndarray, keywords: int) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Transpose the project-keyword matrix in CSR form into keyword-project posting lists."""
+    projects = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    # A stable sort keeps projects in each posting list sorted.
+    order = np.argsort(indices, kind="stable")
+    keyword_indptr = np.zeros(keywords + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=keywords), out=keyword_indptr[1:])
+    return keyword_indptr, projects[order]
+
+
+def write_index(
+    output_dir: str,
+    package_names: typing.List[str],
+    keywords: typing.List[str],
+    indptr: np.ndarray,
+    indices: np.ndarray,
+) -> None:
+    """Write index of the project-keyword matrix given in CSR form, names are expected to be sorted."""
+    os.makedirs(output_dir, exist_ok=True)
+    keyword_indptr, keyword_indices = _build_inverted(indptr, indices, len(keywords))
+    arrays = {
+        "indptr": indptr.astype(np.int64, copy=False),
+        "indices": indices.astype(np.int32, copy=False),
+        "keyword_indptr": keyword_indptr,
+        "keyword_indices": keyword_indices,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(output_dir, f"{name}.npy"), array)
+
+    with open(os.path.join(output_dir, "names.json"), "w") as names_file:
+        json.dump({"projects": package_names, "keywords": keywords}, names_file)
+
+
+def iter_tsv_vectors(vector_lines: typing.Iterable[str]) -> typing.Generator[np.ndarray, None, None]:
+    """Parse vectors as stored in vectors.tsv of the project2vec model, yield indexes of keywords set."""
+    for line in vector_lines:
+        # Each item is a single digit followed by a separator, no need to split lines.
+        digits = np.frombuffer(line.rstrip("\n").encode(), dtype=np.uint8)[::2]
+        yield np.flatnonzero(digits == ord("1")).astype(np.int32)
+
+
+def build_index(output_dir: str) -> dict:
+    """Build index of the stored project2vec model."""
+    from .tasks.project2vec import Project2VecTask
+
+    model_store = StoragePool.get_connected_storage("Project2VecModelStore")
+    package_names = list(model_store.iter_package_names())
+    keywords = Project2VecTask.get_keywords()
+
+    try:
+        model_vocabulary_version = model_store.retrieve_inputs().get("vocabulary_version")
+    except NotFoundException:
+        model_vocabulary_version = None
+
+    # Vectors are parsed as they are downloaded, the TSV file is never held in memory as whole.
+    vector_lines = model_store.iter_vector_lines()
+    if model_vocabulary_version is not None:
+        up_to_date = model_vocabulary_version == Project2VecTask.get_vocabulary_version(keywords)
+    else:
+        # Models stored before inputs were recorded carry no vocabulary version, only dimensions can be checked.
+        first_line = next(vector_lines, None)
+        up_to_date = first_line is None or first_line.count("\t") + 1 == len(keywords)
+        if first_line is not None:
+            vector_lines = itertools.chain([first_line], vector_lines)
+
+    if not up_to_date:
+        raise ValueError("The stored project2vec model was not computed using the current vocabulary")
+
+    rows = []
+    indptr = np.zeros(len(package_names) + 1, dtype=np.int64)
+    for idx, row in enumerate(iter_tsv_vectors(vector_lines)):
+        rows.append(row)
+        indptr[idx + 1] = indptr[idx] + len(row)
+
+    indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+    write_index(output_dir, package_names, keywords, indptr, indices)
+    return {"projects": len(package_names), "keywords": len(keywords), "entries": int(indptr[-1])}
+
+
+class SimilarityIndex:
+    """Memory mapped index answering similar-project and keyword queries."""
+
+    def __init__(self, index_dir: str):
+        """Load index from the given directory, arrays are memory mapped."""
+        for name in _ARRAYS:
+            setattr(self, name, np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r"))
+
+        with open(os.path.join(index_dir, "names.json")) as names_file:
+            names = json.load(names_file)
+
+        self.package_names = names["projects"]
+        self.keywords = names["keywords"]
+        self.sizes = np.diff(self.indptr)
+
+    @staticmethod
+    def _lookup(names: typing.List[str], name: str) -> int:
+        """Find position of the given name in the sorted listing of names."""
+        idx = bisect.bisect_left(names, name)
+        if idx == len(names) or names[idx] != name:
+            raise NotFoundException(f"{name!r} is not present in the similarity index")
+        return idx
+
+    def get_project_keywords(self, package_name: str) -> typing.List[str]:
+        """Get keywords set in the project2vec vector of the given project."""
+        idx = self._lookup(self.package_names, package_name)
+        return [self.keywords[i] for i in self.indices[self.indptr[idx]:self.indptr[idx + 1]]]
+
+    def get_keyword_projects(self, keyword: str) -> typing.List[str]:
+        """Get projects which have the given keyword set in their project2vec vectors."""
+        idx = self._lookup(self.keywords, keyword)
+        projects = self.keyword_indices[self.keyword_indptr[idx]:self.keyword_indptr[idx + 1]]
+        return [self.package_names[i] for i in projects]
+
+    def get_similar_projects(
+        self, package_name: str, top_k: int = 10, metric: str = "jaccard"
+    ) -> typing.List[typing.Tuple[str, float]]:
+        """Get the most similar projects to the given one based on Jaccard or cosine similarity of their vectors."""
+        idx = self._lookup(self.package_names, package_name)
+        query_keywords = self.indices[self.indptr[idx]:self.indptr[idx + 1]]
+        if not len(query_keywords):
+            return []
+
+        postings = np.concatenate(
+            [self.keyword_indices[self.keyword_indptr[i]:self.keyword_indptr[i + 1]] for i in query_keywords]
+        )
+        # Number of keywords each project shares with the query project.
+        shared = np.bincount(postings, minlength=len(self.sizes))
+        shared[idx] = 0
+        candidates = np.flatnonzero(shared)
+        shared = shared[candidates]
+
+        sizes = self.sizes[candidates]
+        if metric == "jaccard":
+            scores = shared / (len(query_keywords) + sizes - shared)
+        elif metric == "cosine":
+            scores = shared / np.sqrt(len(query_keywords) * sizes)
+        else:
+            raise ValueError(f"Unknown similarity metric {metric!r}")
+
+        if len(scores) > top_k:
+            # Keep all the candidates tied with the k-th best score, ties are broken by project name below.
+            threshold = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+            top = np.flatnonzero(scores >= threshold)
+        else:
+            top = np.arange(len(scores))
+
+        top = sorted(top, key=lambda i: (-scores[i], candidates[i]))[:top_k]
+        return [(self.package_names[candidates[i]], float(scores[i])) for i in top]
+
+
+def load_index(cache_dir: str = _CACHE_DIR) -> SimilarityIndex:
+    """Load the latest index stored on Ceph, index files are cached locally so they can be memory mapped."""
+    index_store = StoragePool.get_connected_storage("SimilarityIndexStore")
+    version = index_store.retrieve_latest_version()
+    index_dir = os.path.join(cache_dir, version)
+    if not os.path.isdir(index_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=cache_dir)
+        index_store.retrieve_index(version, tmp_dir)
+        # Atomic, concurrent loaders never see a partially downloaded index.
+        try:
+            os.rename(tmp_dir, index_dir)
+        except OSError:
+            # Downloaded by another process in the meantime.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return SimilarityIndex(index_dir)
+
+
+def main() -> None:
+    """Build or query the similarity index."""
+    parser = argparse.ArgumentParser(description="Similar-project queries over the project2vec model.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("build", help="Build index of the stored project2vec model and store it on Ceph.")
+    similar_parser = subparsers.add_parser("similar", help="Find projects similar to the given one.")
+    similar_parser.add_argument("package_name", help="Name of the project.")
+    similar_parser.add_argument("--top-k", type=int, default=10, help="Number of similar projects reported.")
+    similar_parser.add_argument("--metric", choices=("jaccard", "cosine"), default="jaccard", help="Similarity metric.")
+    keyword_parser = subparsers.add_parser("keyword", help="Find projects with the given keyword.")
+    keyword_parser.add_argument("keyword", help="Keyword to look up.")
+    args = parser.parse_args()
+
+    set_config_without_tasks()
+
+    if args.command == "build":
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stats = build_index(tmp_dir)
+            stats["version"] = StoragePool.get_connected_storage("SimilarityIndexStore").store_index(tmp_dir)
+        json.dump(stats, sys.stdout, indent=2)
+    elif args.command == "similar":
+        json.dump(load_index().get_similar_projects(args.package_name, args.top_k, args.metric), sys.stdout, indent=2)
+    elif args.command == "keyword":
+        json.dump(load_index().get_keyword_projects(args.keyword), sys.stdout, indent=2)
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Streaming listing of projects on a Python package index (simple repository API).
+
+The JSON form of the index (PEP 691) is requested, the HTML form (PEP 503) is parsed if the index does not support
+it. Both forms are parsed incrementally as the response is downloaded, so memory used does not depend on size of
+the index.
+"""
+
+import codecs
+import json
+import logging
+import re
+import typing
+from html.parser import HTMLParser
+
+from . import http_client
+
+_LOGGER = logging.getLogger(__name__)
+
+_JSON_CONTENT_TYPE = "application/vnd.pypi.simple.v1+json"
+_ACCEPT = f"{_JSON_CONTENT_TYPE}, application/vnd.pypi.simple.v1+html;q=0.2, text/html;q=0.1"
+_READ_SIZE = 64 * 1024
+
+_PROJECTS_START_RE = re.compile(r'"projects"\s*:\s*\[')
+_JSON_DECODER = json.JSONDecoder()
+
+
+class _AnchorParser(HTMLParser):
+    """Collect text of anchors, each anchor in the simple index states a project name."""
+
+    def __init__(self):
+        """Start outside of any anchor."""
+        super().__init__()
+        self.names: typing.List[str] = []
+        self._anchor_text: typing.Optional[typing.List[str]] = None
+
+    def handle_starttag(self, tag, attrs):  # noqa
+        """Start collecting text of an anchor."""
+        if tag == "a":
+            self._anchor_text = []
+
+    def handle_data(self, data):  # noqa
+        """Collect text of the current anchor."""
+        if self._anchor_text is not None:
+            self._anchor_text.append(data)
+
+    def handle_endtag(self, tag):  # noqa
+        """Record name stated by the anchor."""
+        if tag == "a" and self._anchor_text is not None:
+            name = "".join(self._anchor_text).strip()
+            if name:
+                self.names.append(name)
+            self._anchor_text = None
+
+
+def iter_html_names(chunks: typing.Iterable[bytes]) -> typing.Generator[str, None, None]:
+    """Parse project names from the HTML form of the index, fed chunk by chunk."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parser = _AnchorParser()
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        yield from parser.names
+        parser.names.clear()
+
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    yield from parser.names
+
+
+def iter_json_names(chunks: typing.Iterable[bytes]) -> typing.Generator[str, None, None]:
+    """Parse project names from the JSON form of the index (PEP 691), fed chunk by chunk.
+
+    Only the projects array is parsed incrementally, entries are decoded one by one as soon as they are complete.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    position = None
+    exhausted = False
+
+    while True:
+        if position is None:
+            match = _PROJECTS_START_RE.search(buffer)
+            if match:
+                buffer = buffer[match.end():]
+                position = 0
+        else:
+            while True:
+                # Skip separators between entries.
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position < len(buffer) and buffer[position] == "]":
+                    return
+
+                try:
+                    entry, position = _JSON_DECODER.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # Entry not downloaded completely yet.
+                    break
+
+                yield entry["name"]
+
+            buffer = buffer[position:]
+            position = 0
+
+        if exhausted:
+            raise ValueError("Unexpected end of the JSON simple index, no complete projects array found")
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buffer += decoder.decode(b"", final=True)
+        else:
+            buffer += decoder.decode(chunk)
+
+
+def iter_project_names(index_url: str) -> typing.Generator[str, None, None]:
+    """Iterate over names of projects listed on the given simple index, as the listing is downloaded."""
+    response = http_client.get(index_url.rstrip("/") + "/", headers={"Accept": _ACCEPT}, stream=True)
+    response.raise_for_status()
+
+    try:
+        content_type = response.headers.get("Content-Type", "").split(";", 1)[0].strip()
+        chunks = response.iter_content(chunk_size=_READ_SIZE)
+        if content_type == _JSON_CONTENT_TYPE:
+            _LOGGER.debug("Parsing JSON simple index at %r", index_url)
+            yield from iter_json_names(chunks)
+        else:
+            _LOGGER.debug("Parsing HTML simple index at %r (content type %r)", index_url, content_type)
+            yield from iter_html_names(chunks)
+    finally:
+        response.close()
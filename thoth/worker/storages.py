@@ -18,20 +18,79 @@
 """Storage adapters for Thoth worker."""
 
 import os
+import json
+import hashlib
 import collections
+import logging
+import functools
 import typing
+import zlib
 
+from botocore.exceptions import ClientError
 from thoth.storages.ceph import CephStore
 from thoth.storages.exceptions import NotFoundError as CephNotFound
 from thoth.common import datetime2datetime_str as datetime_str
 from selinon import DataStorage
+from selinon import StoragePool
+from selinon.storages.redis import Redis
 
+from .dedup import get_deduplicated_task_id
+from .dedup import is_deduplicated
 from .exceptions import NotFoundException
+from .github_index import update_github_repo
+from .incremental import drop_dirty_snapshot
+from .incremental import mark_dirty
+from .listing import iter_document_listing_pages
+from .utils import get_redis_connection
+from .utils import iter_prefetched
+from .metrics import observe_ceph_operation
+from .metrics import observe_ceph_pages
+from .metrics import observe_storage_read
+from .metrics import observe_storage_write
+from .retry import call_with_retry
+from .serialization import deserialize
+from .serialization import get_configured_serializer
+from .serialization import serialize
+from .write_behind import flush_writes
+from .write_behind import is_write_behind_active
+from .write_behind import submit_write
+from .write_behind import write_behind_scope
+
+_LOGGER = logging.getLogger(__name__)
+
+_CEPH_SERIALIZER = get_configured_serializer("ceph")
+_REDIS_SERIALIZER = get_configured_serializer("redis")
+
+
+def _wrap_store(store: typing.Callable) -> typing.Callable:
+    """Wrap store method of a Ceph adapter so that its writes are durable once it returns (see write_behind).
+
+    Results of deduplicated task runs are not stored, the result stored by the deduplicated invocation is kept.
+    """
+
+    @functools.wraps(store)
+    def wrapped_store(self, node_args, flow_name: str, task_name: str, task_id: str, result: typing.Any):
+        if is_deduplicated(result):
+            return result
+
+        with write_behind_scope():
+            return store(self, node_args, flow_name, task_name, task_id, result)
+
+    return wrapped_store
 
 
 class CephWorkerStorageBase(DataStorage):
     """A base class for implementing Ceph based adapters in Thoth's worker."""
 
+    # Size of chunks in which blobs are streamed, in bytes.
+    _STREAM_CHUNK_SIZE = 1024 * 1024
+
+    def __init_subclass__(cls, **kwargs):
+        """Wrap store method implemented in the subclass."""
+        super().__init_subclass__(**kwargs)
+        if "store" in cls.__dict__:
+            cls.store = _wrap_store(cls.__dict__["store"])
+
     def __init__(
         self,
         bucket: str,
@@ -39,6 +98,7 @@ class CephWorkerStorageBase(DataStorage):
         aws_access_key_id: str,
         aws_secret_access_key: str,
         s3_endpoint: str,
+        listing_workers: int = 0,
     ):
         """Initialize storing of project information."""
         self.ceph = None
@@ -47,6 +107,7 @@ class CephWorkerStorageBase(DataStorage):
         self.aws_access_key_id = aws_access_key_id
         self.aws_secret_access_key = aws_secret_access_key
         self.s3_endpoint = s3_endpoint
+        self.listing_workers = listing_workers
 
     def connect(self):
         """Connect to the remote Ceph."""
@@ -67,9 +128,160 @@ class CephWorkerStorageBase(DataStorage):
         """Disconnect from remote Ceph."""
         self.ceph = None
 
+    def _store_blob(self, blob: typing.Union[bytes, str], object_key: str) -> typing.Optional[dict]:
+        """Store the given blob on Ceph, done behind if in a write-behind scope (no response is returned then)."""
+        if isinstance(blob, str):
+            blob = blob.encode()
+
+        if is_write_behind_active():
+            submit_write(self.__class__.__name__, lambda: self._write_blob(blob, object_key))
+            return None
+
+        return self._write_blob(blob, object_key)
+
+    def _write_blob(self, blob: bytes, object_key: str) -> dict:
+        """Write the given blob to Ceph, retry on transient failures and record the operation in metrics.
+
+        Writes are done concurrently by threads flushing writes behind or storing keywords contributions, the low
+        level client is thread safe unlike boto3 resources used by the Ceph adapter.
+        """
+        write = functools.partial(
+            self.ceph._s3.meta.client.put_object,
+            Bucket=self.ceph.bucket,
+            Key=f"{self.ceph.prefix}{object_key}",
+            Body=blob,
+        )
+        with observe_ceph_operation(self.__class__.__name__, "store"):
+            response = call_with_retry("ceph:store", write)
+
+        observe_storage_write(self.__class__.__name__, len(blob))
+        return response
+
+    def _get_object(self, object_key: str) -> dict:
+        """Get the given object from Ceph using the low level client, its body is streamed as it is read.
+
+        Adapters are shared by threads prefetching documents, the low level client is thread safe unlike boto3
+        resources used by the Ceph adapter.
+        """
+        try:
+            return self.ceph._s3.meta.client.get_object(Bucket=self.ceph.bucket, Key=f"{self.ceph.prefix}{object_key}")
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise CephNotFound(f"Failed to retrieve object, object {object_key!r} does not exist") from exc
+            raise
+
+    def _retrieve_blob(self, object_key: str) -> bytes:
+        """Retrieve the given blob from Ceph, retry on transient failures and record the operation in metrics."""
+        with observe_ceph_operation(self.__class__.__name__, "retrieve"):
+            blob = call_with_retry("ceph:retrieve", lambda: self._get_object(object_key)["Body"].read())
+
+        observe_storage_read(self.__class__.__name__, len(blob))
+        return blob
+
+    def _iter_blob_lines(self, object_key: str) -> typing.Generator[str, None, None]:
+        """Iterate over lines of the given text blob as it is downloaded, the blob is never held in memory as whole."""
+        with observe_ceph_operation(self.__class__.__name__, "retrieve"):
+            body = call_with_retry("ceph:retrieve", lambda: self._get_object(object_key))["Body"]
+
+        size = 0
+        for line in body.iter_lines(chunk_size=self._STREAM_CHUNK_SIZE):
+            size += len(line) + 1
+            yield line.decode()
+
+        observe_storage_read(self.__class__.__name__, size)
+
+    def _store_document(self, document: dict, object_key: str) -> typing.Optional[dict]:
+        """Store the given document on Ceph, serialized in the configured format."""
+        return self._store_blob(serialize(document, _CEPH_SERIALIZER, pretty=True), object_key)
+
+    def _retrieve_document(self, object_key: str) -> dict:
+        """Retrieve the given document from Ceph, serialized in any supported format."""
+        return deserialize(self._retrieve_blob(object_key))
+
+    def _get_document_listing(self) -> typing.Generator[str, None, None]:
+        """List documents stored under the configured prefix, record listing of each page in metrics."""
+        pages = iter_document_listing_pages(self.ceph, workers=self.listing_workers)
+        for keys in observe_ceph_pages(self.__class__.__name__, "list", pages):
+            yield from keys
+
+
+class ProjectInfoProjectionStore(CephWorkerStorageBase):
+    """Store compact projections of project information keeping only fields read by downstream tasks."""
+
+    # Bumped when fields kept change, projections of other versions are ignored by readers.
+    VERSION = 1
+
+    def retrieve(self, flow_name: str, task_name: str, task_id: str) -> dict:
+        # Projections are retrieved through ProjectInfoStore, this adapter is not assigned to any task.
+        raise NotImplementedError
+
+    def store(self, node_args: dict, flow_name: str, task_name: str, task_id: str, result: dict) -> str:
+        # Projections are stored through ProjectInfoStore, this adapter is not assigned to any task.
+        raise NotImplementedError
+
+    @classmethod
+    def project(cls, document: dict) -> dict:
+        """Create projection of the given project information document as provided by PyPI."""
+        info = document.get("info") or {}
+        return {
+            "version": cls.VERSION,
+            "info": {
+                "name": info.get("name"),
+                # PyPIProjectKeywordsTask.
+                "keywords": info.get("keywords"),
+                # Project2VecTask.
+                "description": info.get("description"),
+                # Tasks retrieving information from GitHub.
+                "home_page": info.get("home_page"),
+            },
+        }
+
+    def store_projection(self, package_name: str, projection: dict) -> None:
+        """Store projection of project information of the given project."""
+        self._store_document(projection, package_name)
+
+    def retrieve_projection(self, package_name: str) -> typing.Optional[dict]:
+        """Retrieve projection of project information, None if not stored or stored in a different version."""
+        try:
+            projection = self._retrieve_document(package_name)
+        except CephNotFound:
+            return None
+
+        return projection if projection.get("version") == self.VERSION else None
+
 
 class ProjectInfoStore(CephWorkerStorageBase):
-    """Store information about the given Python project."""
+    """Store information about the given Python project, together with its projection if configured."""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str,
+        aws_access_key_id: str,
+        aws_secret_access_key: str,
+        s3_endpoint: str,
+        listing_workers: int = 0,
+        projection_prefix: typing.Optional[str] = None,
+    ):
+        """Initialize storing of project information, projections are stored under projection_prefix if given."""
+        super().__init__(bucket, prefix, aws_access_key_id, aws_secret_access_key, s3_endpoint, listing_workers)
+        self.projection_store = None
+        if projection_prefix:
+            self.projection_store = ProjectInfoProjectionStore(
+                bucket, projection_prefix, aws_access_key_id, aws_secret_access_key, s3_endpoint
+            )
+
+    def connect(self):
+        """Connect to the remote Ceph."""
+        super().connect()
+        if self.projection_store is not None:
+            self.projection_store.connect()
+
+    def disconnect(self):
+        """Disconnect from remote Ceph."""
+        super().disconnect()
+        if self.projection_store is not None:
+            self.projection_store.disconnect()
 
     def retrieve(self, flow_name: str, task_name: str, task_id: str) -> dict:
         # We do not provide implementation of this method as we store project information based on project name.
@@ -78,27 +290,98 @@ class ProjectInfoStore(CephWorkerStorageBase):
     def retrieve_project_info(self, package_name: str):
         """Retrieve project information as stored on Ceph."""
         try:
-            return self.ceph.retrieve_document(package_name)
+            return self._retrieve_document(package_name)
         except CephNotFound as exc:
             raise NotFoundException(
                 f"No project information found for project {package_name}"
             ) from exc
 
+    def retrieve_project_info_projection(self, package_name: str) -> dict:
+        """Retrieve projection of project information, see ProjectInfoProjectionStore.project for fields kept.
+
+        The full document is retrieved and projected if no projection in the current version is stored.
+        """
+        if self.projection_store is not None:
+            projection = self.projection_store.retrieve_projection(package_name)
+            if projection is not None:
+                return projection
+
+        return ProjectInfoProjectionStore.project(self.retrieve_project_info(package_name))
+
     def store(
         self, node_args: dict, flow_name: str, task_name: str, task_id: str, result: str
     ) -> str:
-        """Store package information."""
-        return self.ceph.store_document(result, node_args["package_name"])
+        """Store package information and its projection, the project is marked as changed for incremental runs.
+
+        The index of GitHub repositories is updated based on the home page stated.
+        """
+        response = self._store_document(result, node_args["package_name"])
+        projection = ProjectInfoProjectionStore.project(result)
+        if self.projection_store is not None:
+            self.projection_store.store_projection(node_args["package_name"], projection)
+        try:
+            update_github_repo(node_args["package_name"], projection)
+        except Exception as exc:
+            # Project information is stored, the index is corrected on the next update or build.
+            _LOGGER.warning(
+                "Failed to update GitHub repository index for project %r: %s", node_args["package_name"], str(exc)
+            )
+
+        try:
+            mark_dirty(node_args["package_name"])
+        except Exception as exc:
+            # Project information is stored, the project is processed by the next full run.
+            _LOGGER.warning(
+                "Failed to mark project %r as changed for incremental runs: %s", node_args["package_name"], str(exc)
+            )
 
-    def iter_project_info_documents(self) -> dict:
-        """Iterate over documents stored on Ceph."""
-        yield from (document for _, document in self.ceph.iterate_results())
+        return response
+
+    def iter_project_info_documents(
+        self,
+        prefetch: int = 0,
+        window: typing.Optional[int] = None,
+        ordered: bool = True,
+        projection: typing.Optional[typing.Callable[[dict], typing.Any]] = None,
+        with_ids: bool = False,
+        projected: bool = False,
+    ) -> typing.Generator[typing.Any, None, None]:
+        """Iterate over documents stored on Ceph.
+
+        :param prefetch: number of threads retrieving documents concurrently, documents are retrieved one by one if 0
+        :param window: maximum number of documents retrieved or buffered at once, defaults to 2 * prefetch
+        :param ordered: yield documents in listing order, otherwise as soon as they are retrieved
+        :param projection: a callable applied on each document before it is buffered (e.g. to drop unneeded fields)
+        :param with_ids: yield tuples of document id and document
+        :param projected: retrieve projections of documents (see retrieve_project_info_projection) instead
+        """
+        def retrieve(document_id: str) -> typing.Any:
+            try:
+                if projected:
+                    document = self.retrieve_project_info_projection(document_id)
+                else:
+                    document = self._retrieve_document(document_id)
+            except (CephNotFound, NotFoundException):
+                # Removed after listing was done.
+                return None
+
+            document = projection(document) if projection else document
+            return (document_id, document) if with_ids else document
+
+        if prefetch <= 0:
+            documents = (retrieve(document_id) for document_id in self._get_document_listing())
+        else:
+            documents = iter_prefetched(
+                retrieve, self._get_document_listing(), workers=prefetch, window=window, ordered=ordered
+            )
+
+        yield from (document for document in documents if document is not None)
 
     def get_project_listing(self):
         """Get listing of projects for which there is stored project info."""
         return [
             document_id.split("/")[-1]
-            for document_id in self.ceph.get_document_listing()
+            for document_id in self._get_document_listing()
         ]
 
 
@@ -117,7 +400,7 @@ class ReadmeStore(CephWorkerStorageBase):
     def retrieve_project_readme(self, project_name: str) -> dict:
         """Retrieve a project readme file."""
         try:
-            return self.ceph.retrieve_document(self._get_object_key(project_name))
+            return self._retrieve_document(self._get_object_key(project_name))
         except CephNotFound as exc:
             raise NotFoundException(
                 f"Readme for project {project_name} not found"
@@ -134,7 +417,7 @@ class ReadmeStore(CephWorkerStorageBase):
         """Store the given readme file for the given project."""
         project_name = node_args["package_name"]
         document = {"result": result, "@meta": {"datetime": datetime_str()}}
-        return self.ceph.store_document(document, self._get_object_key(project_name))
+        return self._store_document(document, self._get_object_key(project_name))
 
 # TODO: make more generic with README store
 
@@ -153,7 +436,7 @@ class GitHubInfoStore(CephWorkerStorageBase):
     def retrieve_project_readme(self, project_name: str) -> dict:
         """Retrieve a project GitHub info."""
         try:
-            return self.ceph.retrieve_document(self._get_object_key(project_name))
+            return self._retrieve_document(self._get_object_key(project_name))
         except CephNotFound as exc:
             raise NotFoundException(
                 f"No GitHub info for project {project_name} not found"
@@ -170,7 +453,7 @@ class GitHubInfoStore(CephWorkerStorageBase):
         """Store the given readme file for the given project."""
         project_name = node_args["package_name"]
         document = {"result": result, "@meta": {"datetime": datetime_str()}}
-        return self.ceph.store_document(document, self._get_object_key(project_name))
+        return self._store_document(document, self._get_object_key(project_name))
 
 
 class Project2VecModelStore(CephWorkerStorageBase):
@@ -178,6 +461,10 @@ class Project2VecModelStore(CephWorkerStorageBase):
 
     _METADATA_DOCUMENT_ID = "metadata.tsv"
     _VECTOR_DOCUMENT_ID = "vectors.tsv"
+    _INPUTS_DOCUMENT_ID = "inputs.json"
+    # Redis hash mirroring hashes of inputs per project for lookups done in incremental runs.
+    _INPUTS_HASHES_KEY = "thoth:project2vec:inputs"
+    _INPUTS_HASHES_CHUNK_SIZE = 10000
 
     def retrieve(self, flow_name: str, task_name: str, task_id: str) -> tuple:
         """Retrieve the given project2vec model representation."""
@@ -189,10 +476,10 @@ class Project2VecModelStore(CephWorkerStorageBase):
         flow_name: str,
         task_name: str,
         task_id: str,
-        result: dict,
+        result: tuple,
     ) -> None:
-        """Store keywords stored on Ceph."""
-        package_names, vector_space = result
+        """Store keywords stored on Ceph, optionally with hashes of inputs used for computing vectors."""
+        package_names, vector_space = result[:2]
 
         metadata_file_content = "Index\tPackage name\n"
         for idx, package_name in enumerate(package_names):
@@ -202,8 +489,40 @@ class Project2VecModelStore(CephWorkerStorageBase):
         for vector in vector_space:
             vector_file_content += "\t".join(str(i) for i in vector) + "\n"
 
-        self.ceph.store_blob(metadata_file_content, self._METADATA_DOCUMENT_ID)
-        self.ceph.store_blob(vector_file_content, self._VECTOR_DOCUMENT_ID)
+        self._store_blob(metadata_file_content, self._METADATA_DOCUMENT_ID)
+        self._store_blob(vector_file_content, self._VECTOR_DOCUMENT_ID)
+
+        # Hashes are stored only after the model so they never describe vectors that were not stored.
+        inputs = result[2] if len(result) > 2 else {"vocabulary_version": None, "projects": {}}
+        inputs["@meta"] = {"datetime": datetime_str()}
+        self._store_document(inputs, self._INPUTS_DOCUMENT_ID)
+        self._mirror_inputs_hashes(inputs["projects"])
+
+    def _mirror_inputs_hashes(self, inputs_hashes: typing.Dict[str, str]) -> None:
+        """Mirror hashes of inputs to Redis, the hash is replaced atomically."""
+        connection = get_redis_connection()
+        tmp_key = f"{self._INPUTS_HASHES_KEY}:tmp"
+        connection.delete(tmp_key)
+        items = list(inputs_hashes.items())
+        for idx in range(0, len(items), self._INPUTS_HASHES_CHUNK_SIZE):
+            connection.hset(tmp_key, mapping=dict(items[idx:idx + self._INPUTS_HASHES_CHUNK_SIZE]))
+
+        if items:
+            connection.rename(tmp_key, self._INPUTS_HASHES_KEY)
+        else:
+            connection.delete(self._INPUTS_HASHES_KEY)
+
+    def retrieve_inputs(self) -> dict:
+        """Retrieve hashes of inputs used for computing vectors of the stored model."""
+        try:
+            return self._retrieve_document(self._INPUTS_DOCUMENT_ID)
+        except CephNotFound as exc:
+            raise NotFoundException("No inputs of the project2vec model found") from exc
+
+    def retrieve_inputs_hash(self, package_name: str) -> typing.Optional[str]:
+        """Retrieve hash of inputs used for computing the stored vector of the given project, if known."""
+        inputs_hash = get_redis_connection().hget(self._INPUTS_HASHES_KEY, package_name)
+        return inputs_hash.decode() if inputs_hash is not None else None
 
     def retrieve_model(self) -> tuple:
         """Retrieve model - use this method instead of retrieve that is intended for Selinon."""
@@ -222,12 +541,35 @@ class Project2VecModelStore(CephWorkerStorageBase):
 
     def retrieve_tsv_model(self):
         """Retrieve model in a TSV form suitable for TensorBoard projector."""
-        metadata_file_content = self.ceph.retrieve_blob(
-            self._METADATA_DOCUMENT_ID
-        ).decode()
-        vector_file_content = self.ceph.retrieve_blob(self._VECTOR_DOCUMENT_ID).decode()
+        try:
+            metadata_file_content = self._retrieve_blob(
+                self._METADATA_DOCUMENT_ID
+            ).decode()
+            vector_file_content = self._retrieve_blob(self._VECTOR_DOCUMENT_ID).decode()
+        except CephNotFound as exc:
+            raise NotFoundException("No project2vec model found") from exc
+
         return metadata_file_content, vector_file_content
 
+    def _iter_tsv_lines(self, document_id: str) -> typing.Generator[str, None, None]:
+        """Iterate over lines of the given TSV file of the stored model as it is downloaded."""
+        try:
+            yield from self._iter_blob_lines(document_id)
+        except CephNotFound as exc:
+            raise NotFoundException("No project2vec model found") from exc
+
+    def iter_package_names(self) -> typing.Generator[str, None, None]:
+        """Iterate over names of projects in the stored model, in the order of their vectors."""
+        lines = self._iter_tsv_lines(self._METADATA_DOCUMENT_ID)
+        # Skip the header.
+        next(lines, None)
+        for line in lines:
+            yield line.split("\t")[1]
+
+    def iter_vector_lines(self) -> typing.Generator[str, None, None]:
+        """Iterate over lines of the stored model with vectors, as stored in TSV form suitable for TensorBoard."""
+        return self._iter_tsv_lines(self._VECTOR_DOCUMENT_ID)
+
 
 class KeywordsStoreBase(CephWorkerStorageBase):
     """Storing JSON documents with aggregated keywords."""
@@ -236,11 +578,11 @@ class KeywordsStoreBase(CephWorkerStorageBase):
 
     def retrieve_keywords(self):
         """Retrieve keywords, more sutable for use instead of raw retrieve that is intended to be used by Selinon."""
-        return self.ceph.retrieve_document(self._DOCUMENT_ID)
+        return self._retrieve_document(self._DOCUMENT_ID)
 
     def retrieve(self, flow_name: str, task_name: str, task_id: str) -> dict:
         """Retrieve keywords stored on Ceph."""
-        return self.ceph.retrieve_document(self._DOCUMENT_ID)
+        return self._retrieve_document(self._DOCUMENT_ID)
 
     def store(
         self,
@@ -252,7 +594,7 @@ class KeywordsStoreBase(CephWorkerStorageBase):
     ) -> dict:
         """Store keywords stored on Ceph."""
         document = {"result": result, "@meta": {"datetime": datetime_str()}}
-        return self.ceph.store_document(document, self._DOCUMENT_ID)
+        return self._store_document(document, self._DOCUMENT_ID)
 
 
 class PyPIKeywordsStore(KeywordsStoreBase):
@@ -272,6 +614,35 @@ class AggregatedKeywordsStore(KeywordsStoreBase):
 
     _DOCUMENT_ID = "keywords_aggregated.json"
 
+    def retrieve_generation(self) -> typing.Optional[str]:
+        """Retrieve generation (id of the task which computed them) of the stored aggregated keywords."""
+        try:
+            return self.retrieve_keywords()["@meta"].get("generation")
+        except CephNotFound:
+            return None
+
+    def store(
+        self,
+        node_args: typing.Optional[dict],
+        flow_name: str,
+        task_name: str,
+        task_id: str,
+        result: dict,
+    ) -> dict:
+        """Store aggregated keywords, then apply contributions of projects aggregated in them.
+
+        Storing aggregated keywords commits contributions stored as pending by the aggregation (see
+        KeywordsContributionStore), once applied the snapshot of changed projects of an incremental run is dropped.
+        """
+        document = {"result": result, "@meta": {"datetime": datetime_str(), "generation": task_id}}
+        response = self._store_document(document, self._DOCUMENT_ID)
+
+        StoragePool.get_connected_storage("KeywordsContributionStore").apply_pending(task_id)
+        if (node_args or {}).get("incremental"):
+            drop_dirty_snapshot("keywords")
+
+        return response
+
 
 class PerformanceMaskStore(KeywordsStoreBase):
     """Persisting performance mask."""
@@ -287,11 +658,411 @@ class PerformanceMaskStore(KeywordsStoreBase):
 
     def retrieve_performance_mask_document(self) -> dict:
         """Retrieve performance mask document as stored on Ceph."""
-        return self.ceph.retrieve_document(self._DOCUMENT_ID)
+        return self._retrieve_document(self._DOCUMENT_ID)
 
     def store_performance_mask_document(self, document) -> None:
         """Store performance mask document onto Ceph."""
-        self.ceph.store_document(document, self._DOCUMENT_ID)
+        self._store_document(document, self._DOCUMENT_ID)
+
+
+class VocabularyStore(CephWorkerStorageBase):
+    """Store versions of the vocabulary used in project2vec, the latest version is used by Project2VecTask."""
+
+    _LATEST_DOCUMENT_ID = "latest.json"
+
+    def retrieve(self, flow_name: str, task_name: str, task_id: str) -> dict:
+        # Vocabulary is created outside of flows, this adapter is not assigned to any task.
+        raise NotImplementedError
+
+    def store(self, node_args: dict, flow_name: str, task_name: str, task_id: str, result: dict) -> str:
+        # Vocabulary is created outside of flows, this adapter is not assigned to any task.
+        raise NotImplementedError
+
+    def store_vocabulary(self, document: dict) -> None:
+        """Store the given version of vocabulary and make it the latest one."""
+        document = dict(document, **{"@meta": {"datetime": datetime_str()}})
+        self._store_document(document, f"{document['version']}.json")
+        self._store_document(document, self._LATEST_DOCUMENT_ID)
+
+    def retrieve_vocabulary(self, version: typing.Optional[str] = None) -> dict:
+        """Retrieve the given version of vocabulary, the latest if no version is given."""
+        try:
+            return self._retrieve_document(f"{version}.json" if version else self._LATEST_DOCUMENT_ID)
+        except CephNotFound as exc:
+            raise NotFoundException(f"No vocabulary found (version {version or 'latest'!r})") from exc
+
+
+class SimilarityIndexStore(CephWorkerStorageBase):
+    """Store versions of the similarity index built on top of the project2vec model."""
+
+    _LATEST_DOCUMENT_ID = "latest.json"
+    # Stored with each version, lists files of the version.
+    _MANIFEST_DOCUMENT_ID = "manifest.json"
+
+    def retrieve(self, flow_name: str, task_name: str, task_id: str) -> dict:
+        # The index is built outside of flows, this adapter is not assigned to any task.
+        raise NotImplementedError
+
+    def store(self, node_args: dict, flow_name: str, task_name: str, task_id: str, result: dict) -> str:
+        # The index is built outside of flows, this adapter is not assigned to any task.
+        raise NotImplementedError
+
+    def store_index(self, index_dir: str) -> str:
+        """Store index files present in the given directory as a new version, return the version."""
+        file_names = sorted(os.listdir(index_dir))
+        digest = hashlib.sha256()
+        for file_name in file_names:
+            with open(os.path.join(index_dir, file_name), "rb") as index_file:
+                for chunk in iter(lambda: index_file.read(1024 * 1024), b""):
+                    digest.update(chunk)
+
+        version = digest.hexdigest()
+        for file_name in file_names:
+            with open(os.path.join(index_dir, file_name), "rb") as index_file:
+                self._store_blob(index_file.read(), f"{version}/{file_name}")
+
+        self._store_document(
+            {"version": version, "files": file_names, "@meta": {"datetime": datetime_str()}},
+            f"{version}/{self._MANIFEST_DOCUMENT_ID}",
+        )
+        # Stored last, readers never see a partially stored index.
+        self._store_document(
+            {"version": version, "files": file_names, "@meta": {"datetime": datetime_str()}}, self._LATEST_DOCUMENT_ID
+        )
+        return version
+
+    def retrieve_latest_version(self) -> str:
+        """Retrieve version of the latest index stored."""
+        try:
+            return self._retrieve_document(self._LATEST_DOCUMENT_ID)["version"]
+        except CephNotFound as exc:
+            raise NotFoundException("No similarity index found") from exc
+
+    def _retrieve_manifest(self, version: str) -> dict:
+        """Retrieve manifest of the given index version."""
+        try:
+            return self._retrieve_document(f"{version}/{self._MANIFEST_DOCUMENT_ID}")
+        except CephNotFound:
+            pass
+
+        # Versions stored before manifests were introduced are listed only in the latest document.
+        try:
+            latest = self._retrieve_document(self._LATEST_DOCUMENT_ID)
+        except CephNotFound as exc:
+            raise NotFoundException(f"No similarity index of version {version!r} found") from exc
+
+        if latest["version"] != version:
+            raise NotFoundException(f"No similarity index of version {version!r} found")
+
+        return latest
+
+    def retrieve_index(self, version: str, index_dir: str) -> None:
+        """Retrieve files of the given index version into the given directory."""
+        for file_name in self._retrieve_manifest(version)["files"]:
+            with open(os.path.join(index_dir, file_name), "wb") as index_file:
+                index_file.write(self._retrieve_blob(f"{version}/{file_name}"))
+
+
+class KeywordsContributionStore(CephWorkerStorageBase):
+    """Store keywords each project contributed to aggregated keywords, used in incremental keywords runs.
+
+    Contributions are first stored as pending together with generation of aggregated keywords they are part of and
+    applied once the aggregated keywords are stored. Pending contributions of stored aggregated keywords which were
+    not applied completely (e.g. the worker was killed) are applied again by the next aggregation.
+    """
+
+    # Project names cannot contain "@".
+    _PENDING_DOCUMENT_ID = "@pending.json"
+    # Number of threads storing contributions of projects.
+    _WRITERS = 32
+
+    def retrieve(self, flow_name: str, task_name: str, task_id: str) -> dict:
+        # Contributions are stored based on project name by the aggregation task, not as a task result.
+        raise NotImplementedError
+
+    def store(self, node_args: dict, flow_name: str, task_name: str, task_id: str, result: dict) -> str:
+        # Contributions are stored based on project name by the aggregation task, not as a task result.
+        raise NotImplementedError
+
+    def retrieve_contribution(self, package_name: str) -> typing.Optional[typing.Dict[str, int]]:
+        """Retrieve keywords the given project contributed, None if no contribution was recorded yet."""
+        try:
+            return self._retrieve_document(package_name)["result"]
+        except CephNotFound:
+            return None
+
+    def store_contribution(self, package_name: str, keywords: typing.Dict[str, int]) -> None:
+        """Store keywords the given project contributed."""
+        self._store_document({"result": keywords, "@meta": {"datetime": datetime_str()}}, package_name)
+
+    def store_pending(self, generation: str, contributions: typing.Dict[str, typing.Dict[str, int]]) -> None:
+        """Store contributions of projects to aggregated keywords of the given generation which are not stored yet."""
+        document = {"generation": generation, "result": contributions, "@meta": {"datetime": datetime_str()}}
+        self._store_document(document, self._PENDING_DOCUMENT_ID)
+
+    def _retrieve_pending(self, generation: typing.Optional[str]) -> typing.Dict[str, typing.Dict[str, int]]:
+        """Retrieve pending contributions if they are part of aggregated keywords of the given generation.
+
+        Pending contributions of any other generation were not committed (storing aggregated keywords failed) and
+        are ignored.
+        """
+        try:
+            document = self._retrieve_document(self._PENDING_DOCUMENT_ID)
+        except CephNotFound:
+            return {}
+
+        if generation is None or document["generation"] != generation:
+            return {}
+
+        return document["result"]
+
+    def iter_contributions(
+        self, generation: typing.Optional[str], prefetch: int = 32
+    ) -> typing.Generator[typing.Tuple[str, typing.Dict[str, int]], None, None]:
+        """Iterate over keywords contributed by projects to aggregated keywords of the given generation."""
+        pending = self._retrieve_pending(generation)
+        listing = (
+            package_name
+            for package_name in self._get_document_listing()
+            if package_name != self._PENDING_DOCUMENT_ID and package_name not in pending
+        )
+        yield from iter_prefetched(
+            lambda package_name: (package_name, self.retrieve_contribution(package_name)),
+            listing,
+            workers=prefetch,
+            ordered=False,
+        )
+        yield from pending.items()
+
+    def apply_pending(self, generation: typing.Optional[str]) -> typing.Dict[str, typing.Dict[str, int]]:
+        """Store pending contributions if they are part of aggregated keywords of the given generation, return them."""
+        contributions = self._retrieve_pending(generation)
+        if not contributions:
+            return {}
+
+        _LOGGER.info("Storing keywords contributions of %d projects (generation %r)", len(contributions), generation)
+        # Writing threads are not in any write-behind scope, each contribution is written once its thread returns.
+        for _ in iter_prefetched(
+            lambda contribution: self.store_contribution(*contribution),
+            contributions.items(),
+            workers=self._WRITERS,
+            ordered=False,
+        ):
+            pass
+
+        # All the writes need to be durable before the pending contributions are dropped.
+        flush_writes()
+        with observe_ceph_operation(self.__class__.__name__, "delete"):
+            self.ceph.delete(self._PENDING_DOCUMENT_ID)
+        return contributions
+
+
+class ProfilingStore(CephWorkerStorageBase):
+    """Store profiles of task runs for offline analysis."""
+
+    def retrieve(self, flow_name: str, task_name: str, task_id: str) -> dict:
+        # Profiles are not results of tasks, this adapter is not assigned to any task.
+        raise NotImplementedError
+
+    def store(self, node_args: dict, flow_name: str, task_name: str, task_id: str, result: dict) -> str:
+        # Profiles are not results of tasks, this adapter is not assigned to any task.
+        raise NotImplementedError
+
+    def store_profile(self, task_name: str, task_id: str, document: dict, profile: bytes) -> None:
+        """Store profile of a task run together with a document describing the task run."""
+        self._store_blob(profile, f"{task_name}/{task_id}.prof")
+        self._store_document(
+            dict(document, **{"@meta": {"datetime": datetime_str()}}), f"{task_name}/{task_id}.json"
+        )
+
+    def retrieve_profile(self, task_name: str, task_id: str) -> typing.Tuple[dict, bytes]:
+        """Retrieve profile of a task run and the document describing the task run."""
+        try:
+            document = self._retrieve_document(f"{task_name}/{task_id}.json")
+            profile = self._retrieve_blob(f"{task_name}/{task_id}.prof")
+        except CephNotFound as exc:
+            raise NotFoundException(f"No profile found for task {task_name!r} with id {task_id!r}") from exc
+
+        return document, profile
+
+
+class ClaimCheckStore(CephWorkerStorageBase):
+    """Store compressed task results offloaded from ClaimCheckRedis."""
+
+    def retrieve(self, flow_name: str, task_name: str, task_id: str) -> dict:
+        # Offloaded results are retrieved through ClaimCheckRedis, this adapter is not assigned to any task.
+        raise NotImplementedError
+
+    def store(self, node_args: dict, flow_name: str, task_name: str, task_id: str, result: dict) -> str:
+        # Offloaded results are stored through ClaimCheckRedis, this adapter is not assigned to any task.
+        raise NotImplementedError
+
+    def store_result(self, object_key: str, serialized_result: bytes) -> None:
+        """Store serialized task result compressed."""
+        self._store_blob(zlib.compress(serialized_result), object_key)
+
+    def retrieve_result(self, object_key: str) -> bytes:
+        """Retrieve serialized task result."""
+        return zlib.decompress(self._retrieve_blob(object_key))
+
+    def delete_result(self, object_key: str) -> None:
+        """Delete the given task result."""
+        with observe_ceph_operation(self.__class__.__name__, "delete"):
+            self.ceph.delete(object_key)
+
+
+class ExpiringRedis(Redis):
+    """Redis storage for temporary results, results expire after ttl seconds and can be deleted once consumed."""
+
+    # Number of keys deleted in a single round trip.
+    _DELETE_CHUNK_SIZE = 1000
+    # Keys of records stored by Selinon's Redis adapter which wraps results with task metadata.
+    _SELINON_RECORD_KEYS = frozenset(("node_args", "flow_name", "task_name", "task_id", "result"))
+
+    def __init__(self, ttl: typing.Optional[int] = None, **redis_configuration):
+        """Initialize Redis adapter, results never expire if no ttl is given."""
+        super().__init__(**redis_configuration)
+        self.ttl = ttl
+
+    def _set(self, task_id: str, serialized_result: bytes) -> None:
+        """Set the given result with expiration configured."""
+        self.conn.set(task_id, serialized_result, ex=self.ttl)
+
+    def store(self, node_args: dict, flow_name: str, task_name: str, task_id: str, result: typing.Any) -> str:
+        """Store the given task result, it expires after the configured ttl.
+
+        Results are kept per task, the result stored by the invocation a deduplicated task run reused is copied.
+        """
+        if is_deduplicated(result):
+            result = self.retrieve(flow_name, task_name, get_deduplicated_task_id(result))
+
+        self._set(task_id, self._serialize_result(flow_name, task_name, task_id, result))
+        return task_id
+
+    def _serialize_result(self, flow_name: str, task_name: str, task_id: str, result: typing.Any) -> bytes:
+        """Serialize the given task result as stored in Redis."""
+        return serialize(result, _REDIS_SERIALIZER)
+
+    def retrieve(self, flow_name: str, task_name: str, task_id: str) -> typing.Any:
+        """Retrieve the given task result, serialized in any supported format."""
+        serialized_result = self.conn.get(task_id)
+        if serialized_result is None:
+            raise FileNotFoundError(f"Record not found in database for task {task_name!r} with id {task_id!r}")
+
+        result = self._deserialize_result(serialized_result)
+        if (
+            isinstance(result, dict)
+            and result.keys() == self._SELINON_RECORD_KEYS
+            and result["task_name"] == task_name
+        ):
+            # Stored by Selinon's Redis adapter by flows in flight when the storage was switched.
+            return result["result"]
+
+        return result
+
+    def _deserialize_result(self, serialized_result: bytes) -> typing.Any:
+        """Deserialize the given task result as stored in Redis."""
+        return deserialize(serialized_result)
+
+    def _delete_chunk(self, task_ids: typing.List[str]) -> typing.Tuple[int, int]:
+        """Delete results of the given tasks, return number of keys deleted and memory reclaimed."""
+        pipe = self.conn.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.execute_command("MEMORY", "USAGE", task_id)
+        try:
+            sizes = pipe.execute()
+        except Exception:
+            # MEMORY USAGE is available since Redis 4.0, fall back to size of values.
+            pipe = self.conn.pipeline(transaction=False)
+            for task_id in task_ids:
+                pipe.strlen(task_id)
+            sizes = pipe.execute()
+
+        deleted = self.conn.delete(*task_ids)
+        return deleted, sum(size or 0 for size in sizes)
+
+    def delete_results(self, task_ids: typing.List[str]) -> typing.Tuple[int, int]:
+        """Delete results of the given tasks, return number of keys deleted and memory reclaimed in bytes."""
+        deleted = reclaimed = 0
+        for idx in range(0, len(task_ids), self._DELETE_CHUNK_SIZE):
+            chunk_deleted, chunk_reclaimed = self._delete_chunk(task_ids[idx:idx + self._DELETE_CHUNK_SIZE])
+            deleted += chunk_deleted
+            reclaimed += chunk_reclaimed
+
+        return deleted, reclaimed
+
+
+class ClaimCheckRedis(ExpiringRedis):
+    """Redis storage keeping only small results inline, large results are offloaded compressed onto Ceph.
+
+    A reference to the offloaded result is kept in Redis instead, retrieval is transparent to callers.
+    """
+
+    _CLAIM_CHECK_KEY = "@claim_check"
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str,
+        aws_access_key_id: str,
+        aws_secret_access_key: str,
+        s3_endpoint: str,
+        threshold: int = 64 * 1024,
+        **redis_configuration
+    ):
+        """Initialize Redis adapter and Ceph adapter used for offloading results larger than threshold bytes."""
+        super().__init__(**redis_configuration)
+        self.threshold = threshold
+        self.claim_check_store = ClaimCheckStore(bucket, prefix, aws_access_key_id, aws_secret_access_key, s3_endpoint)
+
+    def connect(self):
+        """Connect to Redis and Ceph."""
+        super().connect()
+        self.claim_check_store.connect()
+
+    def disconnect(self):
+        """Disconnect from Redis and Ceph."""
+        super().disconnect()
+        self.claim_check_store.disconnect()
+
+    def _get_claim_check(self, serialized_result: bytes) -> typing.Optional[str]:
+        """Get key of the offloaded result if the given serialized result is a reference."""
+        if not serialized_result.startswith(b'{"' + self._CLAIM_CHECK_KEY.encode()):
+            return None
+
+        result = json.loads(serialized_result.decode())
+        if isinstance(result, dict) and len(result) == 1 and self._CLAIM_CHECK_KEY in result:
+            return result[self._CLAIM_CHECK_KEY]
+
+        return None
+
+    def _serialize_result(self, flow_name: str, task_name: str, task_id: str, result: typing.Any) -> bytes:
+        """Serialize the given task result, offload it onto Ceph if it is large."""
+        serialized_result = super()._serialize_result(flow_name, task_name, task_id, result)
+        if len(serialized_result) > self.threshold:
+            object_key = f"{flow_name}/{task_name}/{task_id}"
+            self.claim_check_store.store_result(object_key, serialized_result)
+            # References are always JSON so they can be recognized regardless of the configured format.
+            serialized_result = json.dumps({self._CLAIM_CHECK_KEY: object_key}).encode()
+
+        return serialized_result
+
+    def _deserialize_result(self, serialized_result: bytes) -> typing.Any:
+        """Deserialize the given task result, fetch it from Ceph if it was offloaded."""
+        object_key = self._get_claim_check(serialized_result)
+        if object_key is not None:
+            serialized_result = self.claim_check_store.retrieve_result(object_key)
+
+        return super()._deserialize_result(serialized_result)
+
+    def _delete_chunk(self, task_ids: typing.List[str]) -> typing.Tuple[int, int]:
+        """Delete results of the given tasks including results offloaded onto Ceph."""
+        for serialized_result in self.conn.mget(task_ids):
+            object_key = self._get_claim_check(serialized_result) if serialized_result is not None else None
+            if object_key is not None:
+                self.claim_check_store.delete_result(object_key)
+
+        return super()._delete_chunk(task_ids)
 
 
 class TravisLogsStorage(CephWorkerStorageBase):
@@ -301,9 +1072,147 @@ class TravisLogsStorage(CephWorkerStorageBase):
             repo=node_args['repo'],
             build=node_args['build']
         )
-        self.ceph.store_document(result, object_key)
+        self._store_document(result, object_key)
         return object_key
 
     def retrieve(self, flow_name, task_name, task_id):  # noqa
         # TODO: implement
         raise NotImplementedError
+
+    def retrieve_build_logs(self, organization: str, repo: str, build: int) -> typing.List[dict]:
+        """Retrieve logs of jobs of the given build."""
+        try:
+            return self._retrieve_document(f"{organization}/{repo}/{build}.json")
+        except CephNotFound as exc:
+            raise NotFoundException(f"No logs found for build {build} of {organization}/{repo}") from exc
+
+
+class TravisLogIndexStore(CephWorkerStorageBase):
+    """Store segments and shards of the inverted index over Travis CI logs (see thoth.worker.log_index)."""
+
+    _SEGMENTS_PREFIX = "segments/"
+    _MANIFEST_DOCUMENT_ID = "latest.json"
+
+    def retrieve(self, flow_name: str, task_name: str, task_id: str) -> dict:
+        # Segments are keyed by build, they are retrieved when merged into the index.
+        raise NotImplementedError
+
+    def store(self, node_args: dict, flow_name: str, task_name: str, task_id: str, result: dict) -> str:
+        """Store index segment created for the given build."""
+        segment_id = f"{self._SEGMENTS_PREFIX}{node_args['organization']}/{node_args['repo']}/{node_args['build']}"
+        self._store_document(result, segment_id)
+        return segment_id
+
+    def iter_segment_ids(self) -> typing.Generator[str, None, None]:
+        """Iterate over segments not merged into the index yet."""
+        for document_id in self._get_document_listing():
+            if document_id.startswith(self._SEGMENTS_PREFIX):
+                yield document_id
+
+    def retrieve_segment(self, segment_id: str) -> dict:
+        """Retrieve the given index segment."""
+        return self._retrieve_document(segment_id)
+
+    def delete_segment(self, segment_id: str) -> None:
+        """Delete the given segment, once it was merged into the index."""
+        with observe_ceph_operation(self.__class__.__name__, "delete"):
+            self.ceph.delete(segment_id)
+
+    def store_shard(self, shard_key: str, blob: bytes) -> None:
+        """Store the given encoded shard of the index."""
+        self._store_blob(blob, shard_key)
+
+    def retrieve_shard(self, shard_key: str) -> bytes:
+        """Retrieve the given encoded shard of the index."""
+        return self._retrieve_blob(shard_key)
+
+    def delete_generation(self, generation: int, shards: int) -> None:
+        """Delete shards of the given generation of the index."""
+        from .log_index import get_shard_key
+
+        for kind in ("postings", "jobs"):
+            for shard in range(shards):
+                with observe_ceph_operation(self.__class__.__name__, "delete"):
+                    self.ceph.delete(get_shard_key(generation, kind, shard))
+
+    def store_manifest(self, manifest: dict) -> None:
+        """Store manifest of a new generation of the index, it is used by readers since then."""
+        self._store_document(dict(manifest, **{"@meta": {"datetime": datetime_str()}}), self._MANIFEST_DOCUMENT_ID)
+
+    def retrieve_manifest(self) -> typing.Optional[dict]:
+        """Retrieve manifest of the latest generation of the index, None if no index was built yet."""
+        try:
+            return self._retrieve_document(self._MANIFEST_DOCUMENT_ID)
+        except CephNotFound:
+            return None
+
+
+class PyPIListingStore(CephWorkerStorageBase):
+    """Store listings of projects on PyPI split into chunks of project names, written as the index is parsed."""
+
+    _LATEST_DOCUMENT_ID = "latest.json"
+    _CHUNK_SIZE = int(os.getenv("THOTH_WORKER_PYPI_LISTING_CHUNK_SIZE", 10000))
+
+    def retrieve(self, flow_name: str, task_name: str, task_id: str) -> dict:
+        # Listings are written by PyPIListingTask, its result is the manifest of the listing.
+        raise NotImplementedError
+
+    def store(self, node_args: dict, flow_name: str, task_name: str, task_id: str, result: dict) -> str:
+        # Chunks are stored while the task runs.
+        raise NotImplementedError
+
+    @staticmethod
+    def _get_chunk_id(listing_id: str, chunk: int) -> str:
+        """Get id of the given chunk of the listing."""
+        return f"{listing_id}/chunk-{chunk:06d}"
+
+    def store_listing(self, listing_id: str, names: typing.Iterable[str]) -> dict:
+        """Store the given project names in chunks as they are produced, return manifest of the listing.
+
+        The listing becomes the latest one. The previous latest listing is kept for a generation as flows spawned
+        from it may still read its chunks, chunks of the listing it replaced are deleted.
+        """
+        chunks = 0
+        projects = 0
+        chunk: typing.List[str] = []
+        for name in names:
+            chunk.append(name)
+            if len(chunk) == self._CHUNK_SIZE:
+                self._store_document(chunk, self._get_chunk_id(listing_id, chunks))
+                projects += len(chunk)
+                chunks += 1
+                chunk = []
+
+        if chunk:
+            self._store_document(chunk, self._get_chunk_id(listing_id, chunks))
+            projects += len(chunk)
+            chunks += 1
+
+        # Chunks written behind need to be durable before the listing is referenced.
+        flush_writes()
+        manifest = {"listing_id": listing_id, "chunks": chunks, "projects": projects}
+        try:
+            previous = self._retrieve_document(self._LATEST_DOCUMENT_ID)
+        except CephNotFound:
+            previous = None
+
+        latest = dict(manifest, **{"@meta": {"datetime": datetime_str()}})
+        expired = None
+        if previous and previous["listing_id"] != listing_id:
+            latest["previous"] = {"listing_id": previous["listing_id"], "chunks": previous["chunks"]}
+            expired = previous.get("previous")
+        elif previous:
+            latest["previous"] = previous.get("previous")
+
+        self._store_document(latest, self._LATEST_DOCUMENT_ID)
+        if expired and expired["listing_id"] != listing_id:
+            for chunk_idx in range(expired["chunks"]):
+                with observe_ceph_operation(self.__class__.__name__, "delete"):
+                    self.ceph.delete(self._get_chunk_id(expired["listing_id"], chunk_idx))
+
+        return manifest
+
+    def iter_listing(self, manifest: dict) -> typing.Generator[str, None, None]:
+        """Iterate over project names of the listing described by the given manifest, chunk by chunk."""
+        for chunk in range(manifest["chunks"]):
+            yield from self._retrieve_document(self._get_chunk_id(manifest["listing_id"], chunk))
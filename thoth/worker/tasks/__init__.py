@@ -15,7 +15,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-"""Tasks available in Selinon worker for data aggregation and processing."""
+"""Tasks available in Selinon worker for data aggregation and processing.
+
+Task implementations are intentionally not imported here - nodes.yaml references each task by its module so a
+worker imports only modules implementing tasks for queues it serves (see thoth.worker.utils.set_config).
+"""
 
 import logging
 
@@ -24,21 +28,3 @@ logging.getLogger("botocore").setLevel(logging.WARNING)
 logging.getLogger("boto3").setLevel(logging.WARNING)
 logging.getLogger("libarchive").setLevel(logging.WARNING)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
-
-from .keywords import KeywordsAggregationTask
-from .keywords import PyPIProjectKeywordsTask
-from .keywords import StackOverflowKeywordsAggregationTask
-from .project2vec import Project2VecCreationTask
-from .project2vec import Project2VecTask
-from .pypi import ProjectInfoTask
-from .pypi import PyPIListingTask
-from .github import RetrieveProjectReadmeTask
-from .github import RetrieveGitHubInfoTask
-from .sync import GraphSyncAnalysisTask
-from .sync import GraphSyncSolverTask
-from .sync import SyncListingTask
-from .travis import TravisActiveRepos
-from .travis import TravisLogTxt
-from .travis import TravisRepoBuilds
-from .travis import TravisRepoBuildsCount
-from .travis import TravisLogCleanup
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""A base class for tasks in thoth-worker."""
+
+import functools
+import typing
+
+from selinon import SelinonTask
+
+from thoth.worker.dedup import run_deduplicated
+from thoth.worker.lifecycle import register_consumed
+from thoth.worker.profiling import run_profiled
+from thoth.worker.retry import run_with_retry_budget
+from thoth.worker.write_behind import write_behind_scope
+
+
+def _wrap_run(run: typing.Callable) -> typing.Callable:
+    """Wrap run method of a task so that it can be profiled, retries are bounded and duplicates are collapsed.
+
+    Ceph writes done in the run are durable once the run returns (see thoth.worker.write_behind).
+    """
+
+    def run_scoped(task, args):
+        with write_behind_scope():
+            return run_with_retry_budget(lambda: run_profiled(task, run, args))
+
+    @functools.wraps(run)
+    def wrapped_run(self, node_args):
+        return run_deduplicated(self, run_scoped, node_args)
+
+    return wrapped_run
+
+
+class WorkerTaskBase(SelinonTask):
+    """A base class for all the tasks, run method of subclasses is transparently wrapped."""
+
+    def __init_subclass__(cls, **kwargs):
+        """Wrap run method implemented in the subclass."""
+        super().__init_subclass__(**kwargs)
+        if "run" in cls.__dict__:
+            cls.run = _wrap_run(cls.__dict__["run"])
+
+    def run(self, node_args: typing.Any) -> typing.Any:
+        """Run the task - to be implemented in subclasses."""
+        raise NotImplementedError
+
+    def register_consumed_results(self, flow_name: str, task_name: str) -> None:
+        """Register results of tasks in the given parent subflow as consumed, they are deleted once the flow ends.
+
+        Reducers calling this need to be listed in thoth.worker.lifecycle so that their flows are cleaned up.
+        """
+        task_ids = (self.parent or {}).get(flow_name, {}).get(task_name, [])
+        register_consumed(self.dispatcher_id, task_name, list(task_ids))
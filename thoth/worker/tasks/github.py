@@ -19,53 +19,56 @@
 
 import os
 import logging
-from urllib.parse import urlparse
 from collections import OrderedDict
 
-from selinon import SelinonTask
 from selinon import StoragePool
 from selinon import FatalTaskError
 
-import requests
 from thoth.python import Source
 
+from thoth.worker import http_client
+from thoth.worker.github_index import parse_github_repo
+from .base import WorkerTaskBase
+
 _LOGGER = logging.getLogger(__name__)
 _LOGGER.setLevel(logging.DEBUG)
 
 
 PYPI = Source(url="https://pypi.org/simple")
 
+_GITHUB_RAW_URL = os.getenv("THOTH_WORKER_GITHUB_RAW_URL", "https://raw.githubusercontent.com")
+_GITHUB_API_URL = os.getenv("THOTH_WORKER_GITHUB_API_URL", "https://api.github.com")
+
 
-class _GitHubTaskBase(SelinonTask):
+class _GitHubTaskBase(WorkerTaskBase):
     """A base class for GitHub related routines."""
 
-    def get_project_repo_github(self, package_name: str):
-        """Get project and repo for the given package based on aggregated package info from PyPI."""
+    def get_project_repo_github(self, node_args: dict):
+        """Get project and repo for the given package based on aggregated package info from PyPI.
+
+        Project and repo are taken from node arguments if stated by the index of GitHub repositories.
+        """
+        if node_args.get("owner") and node_args.get("repo"):
+            return node_args["owner"], node_args["repo"]
+
+        package_name = node_args["package_name"]
         project_info_store = StoragePool.get_connected_storage("ProjectInfoStore")
 
         home_page = (
-            project_info_store.retrieve_project_info(package_name)
+            project_info_store.retrieve_project_info_projection(package_name)
             .get("info", {})
             .get("home_page")
         )
         if not home_page:
             raise FatalTaskError(f"No home page found for project {package_name!r}")
 
-        home_page = urlparse(home_page)
-        if home_page.netloc != "github.com":
-            raise FatalTaskError(
-                f"No GitHub home page associated for project {package_name!r}"
-            )
-
-        path_parts = home_page.path.split("/")
-        if len(path_parts) < 3:
-            # 3 because of leading slash
+        project_repo = parse_github_repo(home_page)
+        if project_repo is None:
             raise FatalTaskError(
-                f"Unable to parse GitHub organization and repo for project {package_name!r}"
+                f"No GitHub organization and repo found in home page {home_page!r} of project {package_name!r}"
             )
 
-        project, repo = path_parts[1], path_parts[2]
-        return project, repo
+        return project_repo
 
     def run(self, node_args: dict) -> dict:
         raise NotImplementedError
@@ -75,7 +78,7 @@ class RetrieveProjectReadmeTask(_GitHubTaskBase):
     """Retrieve README file from GitHub/GitLab if available."""
 
     _GITHUB_README_PATH = (
-        "https://raw.githubusercontent.com/{project}/{repo}/master/README{extension}"
+        _GITHUB_RAW_URL + "/{project}/{repo}/master/README{extension}"
     )
 
     # Based on https://github.com/github/markup#markups
@@ -99,7 +102,7 @@ class RetrieveProjectReadmeTask(_GitHubTaskBase):
     def run(self, node_args) -> dict:
         """Retrieve README file from GitHub."""
         # TODO: add GitLab support.
-        project, repo = self.get_project_repo_github(node_args["package_name"])
+        project, repo = self.get_project_repo_github(node_args)
 
         for readme_type, extensions in self.README_TYPES.items():
             for extension in extensions:
@@ -108,7 +111,7 @@ class RetrieveProjectReadmeTask(_GitHubTaskBase):
                 url = self._GITHUB_README_PATH.format(
                     project=project, repo=repo, extension=extension
                 )
-                response = requests.get(url)
+                response = http_client.get(url)
                 if response.status_code != 200:
                     _LOGGER.debug(
                         'No README%s found for type "%s" at "%s"',
@@ -138,7 +141,7 @@ class RetrieveGitHubInfoTask(_GitHubTaskBase):
     }
 
     _GITHUB_TOPICS_URL = (
-        "https://api.github.com/repos/{project}/{repo}/topics"
+        _GITHUB_API_URL + "/repos/{project}/{repo}/topics"
     )
 
     _GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
@@ -151,12 +154,12 @@ class RetrieveGitHubInfoTask(_GitHubTaskBase):
             _LOGGER.warning("No GitHub token configured, API requests will be throttled")
             headers = self._HEADERS
 
-        response = requests.get(url, headers=headers)
+        response = http_client.get(url, headers=headers)
         return response
 
     def run(self, node_args: dict) -> dict:
         """Aggregate information for a Python package based on URL stated in the project info on PyPI."""
-        project, repo = self.get_project_repo_github(node_args["package_name"])
+        project, repo = self.get_project_repo_github(node_args)
 
         # Topics gathering.
         response = self.requests(self._GITHUB_TOPICS_URL.format(project=project, repo=repo))
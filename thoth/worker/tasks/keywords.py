@@ -17,24 +17,27 @@
 
 """Gathering keywords and tags for project2vec."""
 
+import os
 import logging
 import re
 import itertools
 
 import xmltodict
-import requests
-from selinon import SelinonTask
 from selinon import StoragePool
 from selinon.errors import NoParentNodeError
 
+from thoth.worker import http_client
+from .base import WorkerTaskBase
+
 _LOGGER = logging.getLogger(__name__)
 
 
-class StackOverflowKeywordsAggregationTask(SelinonTask):
+class StackOverflowKeywordsAggregationTask(WorkerTaskBase):
     """Aggregate keywords from StackOverflow."""
 
-    _STACKOVERFLOW_URL = (
-        "https://archive.org/download/stackexchange/stackoverflow.com-Tags.7z"
+    _STACKOVERFLOW_URL = os.getenv(
+        "THOTH_WORKER_STACKOVERFLOW_TAGS_URL",
+        "https://archive.org/download/stackexchange/stackoverflow.com-Tags.7z",
     )
 
     def run(self, node_args: dict) -> dict:
@@ -42,7 +45,7 @@ class StackOverflowKeywordsAggregationTask(SelinonTask):
         # Move import here as we run this task locally, there are issues with libarchive.so in Python's s2i.
         import libarchive.public
 
-        response = requests.get(self._STACKOVERFLOW_URL)
+        response = http_client.get(self._STACKOVERFLOW_URL)
         if not response.ok:
             raise RuntimeError(
                 "Failed to fetch stack overflow tags, request ended with status code %s: %s",
@@ -72,38 +75,75 @@ class StackOverflowKeywordsAggregationTask(SelinonTask):
         return result
 
 
-class KeywordsAggregationTask(SelinonTask):
+class KeywordsAggregationTask(WorkerTaskBase):
     """Combine keywords from multiple sources and aggregate it into a single dict used in model creation."""
 
+    @staticmethod
+    def add_keywords(result: dict, keywords: dict) -> None:
+        """Add keywords of a single project to the aggregated result."""
+        for keyword, count in keywords.items():
+            if keyword not in result:
+                result[keyword] = 0
+
+            result[keyword] += count
+
+    @staticmethod
+    def subtract_keywords(result: dict, keywords: dict) -> None:
+        """Subtract keywords of a single project from the aggregated result."""
+        for keyword, count in keywords.items():
+            result[keyword] = result.get(keyword, 0) - count
+            if result[keyword] <= 0:
+                # Keep the result identical to a full recount which has no keywords with zero occurrences.
+                result.pop(keyword)
+
     def run(self, node_args: dict) -> dict:
-        """Combine keywords from multiple sources."""
+        """Combine keywords from multiple sources.
+
+        In incremental mode, only changed projects are aggregated - their previous contribution is subtracted from
+        the stored aggregated keywords and the current contribution is added. Contributions of changed projects are
+        stored as pending, they are applied once the result is stored (see AggregatedKeywordsStore).
+        """
+        incremental = bool((node_args or {}).get("incremental"))
+        aggregated_keywords_store = StoragePool.get_connected_storage("AggregatedKeywordsStore")
+        contribution_store = StoragePool.get_connected_storage("KeywordsContributionStore")
+        # Contributions of the stored aggregated keywords not applied completely, they supersede stored ones.
+        committed = contribution_store.apply_pending(aggregated_keywords_store.retrieve_generation())
+
         result = {}
+        if incremental:
+            result = aggregated_keywords_store.retrieve_keywords()["result"]
+
+        changed = {}
         for i in itertools.count():
             try:
-                keywords = self.parent_flow_result(
+                project = self.parent_flow_result(
                     "_pypi_keywords_flow", "PyPIProjectKeywordsTask", i
                 )
             except NoParentNodeError:
                 # This exception is raised if there are no more parent tasks.
                 break
 
-            for keyword, count in keywords.items():
-                if keyword not in result:
-                    result[keyword] = 0
+            previous = committed.get(project["project"], project["previous"])
+            if incremental and previous:
+                self.subtract_keywords(result, previous)
 
-                result[keyword] += count
+            self.add_keywords(result, project["keywords"])
+            if project["keywords"] != previous:
+                changed[project["project"]] = project["keywords"]
 
+        _LOGGER.info("Storing keywords contributions of %d changed projects as pending", len(changed))
+        contribution_store.store_pending(self.task_id, changed)
+
+        self.register_consumed_results("_pypi_keywords_flow", "PyPIProjectKeywordsTask")
         return result
 
 
-class PyPIProjectKeywordsTask(SelinonTask):
+class PyPIProjectKeywordsTask(WorkerTaskBase):
     """Get keywords for a single project."""
 
-    def run(self, node_args: dict) -> dict:
-        package_name = node_args["package_name"]
-        project_info_store = StoragePool.get_connected_storage("ProjectInfoStore")
-        document = project_info_store.retrieve_project_info(package_name)
-
+    @staticmethod
+    def get_project_keywords(document: dict) -> dict:
+        """Get keywords and their number of occurrences stated in the given project info document."""
         keywords = document.get("info", {}).get("keywords") or ""
         keywords = re.split(r"[\s+,;]", keywords)
 
@@ -116,3 +156,15 @@ class PyPIProjectKeywordsTask(SelinonTask):
             keywords_dict[keyword] = keywords_dict.get(keyword, 0) + 1
 
         return keywords_dict
+
+    def run(self, node_args: dict) -> dict:
+        """Get keywords of the project together with keywords the project contributed in the previous run."""
+        package_name = node_args["package_name"]
+        project_info_store = StoragePool.get_connected_storage("ProjectInfoStore")
+        contribution_store = StoragePool.get_connected_storage("KeywordsContributionStore")
+        document = project_info_store.retrieve_project_info_projection(package_name)
+        return {
+            "project": package_name,
+            "keywords": self.get_project_keywords(document),
+            "previous": contribution_store.retrieve_contribution(package_name),
+        }
@@ -18,19 +18,20 @@
 """Implementation of project2vec vector space creation using Map-Reduce."""
 
 import typing
+import hashlib
 import itertools
 import logging
 
-from selinon import SelinonTask
 from selinon import StoragePool
 from selinon.errors import NoParentNodeError
 
 from thoth.worker.exceptions import NotFoundException
+from .base import WorkerTaskBase
 
 _LOGGER = logging.getLogger(__name__)
 
 
-class Project2VecTask(SelinonTask):
+class Project2VecTask(WorkerTaskBase):
     """Implementation of project2vec for a single project (one vector in the resulting project2vec vector space)."""
 
     _KEYWORD_OCCURRENCE_THRESHOLD = 0
@@ -43,7 +44,7 @@ class Project2VecTask(SelinonTask):
 
         # TODO: try to perform cleaning for README files - we could use content type, the same applies for description
         try:
-            yield project_info_store.retrieve_project_info(package_name).get(
+            yield project_info_store.retrieve_project_info_projection(package_name).get(
                 "info", {}
             ).get("description", "")
         except NotFoundException:
@@ -60,7 +61,13 @@ class Project2VecTask(SelinonTask):
 
     @classmethod
     def get_keywords(cls) -> typing.List[str]:
-        """Retrieve keywords vector aggregated before."""
+        """Retrieve keywords of the latest vocabulary, keywords aggregated before if no vocabulary was built."""
+        vocabulary_store = StoragePool.get_connected_storage("VocabularyStore")
+        try:
+            return vocabulary_store.retrieve_vocabulary()["keywords"]
+        except NotFoundException:
+            _LOGGER.debug("No vocabulary found, using all aggregated keywords")
+
         aggregated_keywords_store = StoragePool.get_connected_storage(
             "AggregatedKeywordsStore"
         )
@@ -71,43 +78,120 @@ class Project2VecTask(SelinonTask):
             if occurrence > cls._KEYWORD_OCCURRENCE_THRESHOLD
         )
 
-    def run(self, node_args: dict) -> dict:
-        """Compute a single vector for project2vec for the given project."""
+    @staticmethod
+    def get_vocabulary_version(keywords: typing.List[str]) -> str:
+        """Get version of the vocabulary used, vectors are comparable only if computed with the same vocabulary."""
+        return hashlib.sha256("\n".join(keywords).encode()).hexdigest()
+
+    @staticmethod
+    def get_inputs_hash(vocabulary_version: str, documents: typing.List[str]) -> str:
+        """Hash inputs used for computing vector of a project - the vocabulary version and documents."""
+        digest = hashlib.sha256(vocabulary_version.encode())
+        for document in documents:
+            digest.update(b"\0")
+            digest.update((document or "").encode())
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def compute_vector(keywords: typing.List[str], documents: typing.Iterable[str]) -> typing.List[int]:
+        """Compute a vector for the given documents - 1 if the keyword on the given position occurs in any document."""
         from nltk import word_tokenize
-        package_name = node_args["package_name"]
 
-        keywords = self.get_keywords()
         vector = [0] * len(keywords)
 
-        for document in self.get_documents(package_name):
+        for document in documents:
             if not document:
                 continue
 
-            document = word_tokenize(document)
+            # A set for constant time lookups, the keyword vector can be large.
+            document = set(word_tokenize(document))
             for idx, keyword in enumerate(keywords):
                 if keyword in document:
                     vector[idx] = 1
 
-        return {"project": package_name, "vector": vector}
+        return vector
 
+    def run(self, node_args: dict) -> dict:
+        """Compute a single vector for project2vec for the given project.
 
-class Project2VecCreationTask(SelinonTask):
+        In incremental mode, the vector is not computed if inputs did not change since the stored model was created.
+        """
+        package_name = node_args["package_name"]
+
+        keywords = self.get_keywords()
+        documents = list(self.get_documents(package_name))
+        vocabulary_version = self.get_vocabulary_version(keywords)
+        inputs_hash = self.get_inputs_hash(vocabulary_version, documents)
+        result = {"project": package_name, "inputs_hash": inputs_hash, "vocabulary_version": vocabulary_version}
+
+        if node_args.get("incremental"):
+            model_store = StoragePool.get_connected_storage("Project2VecModelStore")
+            if model_store.retrieve_inputs_hash(package_name) == inputs_hash:
+                _LOGGER.debug("Inputs of project %r did not change, vector is not recomputed", package_name)
+                result["vector"] = None
+                result["unchanged"] = True
+                return result
+
+        result["vector"] = self.compute_vector(keywords, documents)
+        return result
+
+
+class Project2VecCreationTask(WorkerTaskBase):
     """Implementation of project2vec - creation of project2vec vector space (reduce part)."""
 
+    def _get_stored_vectors(self) -> typing.Dict[str, typing.List[int]]:
+        """Get vectors of the stored model keyed by project name."""
+        try:
+            package_names, vector_space = StoragePool.get_connected_storage("Project2VecModelStore").retrieve_model()
+        except NotFoundException:
+            _LOGGER.warning("No stored project2vec model found, all unchanged vectors will be recomputed")
+            return {}
+
+        return dict(zip(package_names, vector_space))
+
     def run(
         self, node_args: dict
-    ) -> typing.Tuple[typing.List[str], typing.List[typing.List[int]]]:
-        """Aggregate project2vec results into a single vector space."""
+    ) -> typing.Tuple[typing.List[str], typing.List[typing.List[int]], dict]:
+        """Aggregate project2vec results into a single vector space.
+
+        Vectors of projects with unchanged inputs (incremental mode) are patched in from the stored model.
+        """
         projects = []
+        inputs = {"vocabulary_version": None, "projects": {}}
+        stored_vectors = None
+        keywords = None
+        changed = 0
         for i in itertools.count():
             try:
                 result = self.parent_flow_result("_project2vec", "Project2VecTask", i)
             except NoParentNodeError:
                 # This exception is raised if there are no more parent tasks.
-                _LOGGER.exception("Foo")
+                _LOGGER.debug("Collected results of %d project2vec tasks", i)
                 break
 
-            projects.append((result["project"], result["vector"]))
+            vector = result["vector"]
+            if not result.get("unchanged"):
+                changed += 1
+            else:
+                if stored_vectors is None:
+                    stored_vectors = self._get_stored_vectors()
+                vector = stored_vectors.get(result["project"])
+
+                if vector is None:
+                    # Not present in the stored model, compute it here so the model stays complete.
+                    keywords = keywords if keywords is not None else Project2VecTask.get_keywords()
+                    vector = Project2VecTask.compute_vector(keywords, Project2VecTask.get_documents(result["project"]))
+
+            projects.append((result["project"], vector))
+            inputs["vocabulary_version"] = result.get("vocabulary_version")
+            if result.get("inputs_hash"):
+                inputs["projects"][result["project"]] = result["inputs_hash"]
+
+        if stored_vectors is not None:
+            _LOGGER.info(
+                "Patched %d changed vectors into the stored model of %d projects", changed, len(stored_vectors)
+            )
 
         # Sort by project names
         project_names = []
@@ -116,4 +200,5 @@ class Project2VecCreationTask(SelinonTask):
             project_names.append(project[0])
             vector_space.append(project[1])
 
-        return project_names, vector_space
+        self.register_consumed_results("_project2vec", "Project2VecTask")
+        return project_names, vector_space, inputs
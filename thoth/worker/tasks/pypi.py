@@ -17,33 +17,39 @@
 
 """Tasks related to PyPI."""
 
+import os
 import logging
 from urllib.parse import urlparse
 from collections import OrderedDict
 
-from selinon import SelinonTask
 from selinon import StoragePool
 from selinon import FatalTaskError
 
-import requests
 from thoth.python import Source
 
+from thoth.worker import http_client
+from thoth.worker.simple_index import iter_project_names
+from .base import WorkerTaskBase
+
 _LOGGER = logging.getLogger(__name__)
 _LOGGER.setLevel(logging.DEBUG)
 
 
-PYPI = Source(url="https://pypi.org/simple")
+PYPI = Source(url=os.getenv("THOTH_WORKER_PYPI_URL", "https://pypi.org/simple"))
+# JSON API URL, derived from the simple index URL if not set explicitly.
+_PYPI_API_URL = os.getenv("THOTH_WORKER_PYPI_API_URL")
 
 
-class PyPIListingTask(SelinonTask):
+class PyPIListingTask(WorkerTaskBase):
     """List available Python projects on PyPI."""
 
-    def run(self, node_args):
-        """"Get listing of available packages on PyPI."""
-        return [{"package_name": package_name} for package_name in PYPI.get_packages()]
+    def run(self, node_args) -> dict:
+        """Stream listing of available packages on PyPI into chunks stored on Ceph, return manifest of the listing."""
+        listing_store = StoragePool.get_connected_storage("PyPIListingStore")
+        return listing_store.store_listing(self.task_id, iter_project_names(PYPI.url))
 
 
-class ProjectInfoTask(SelinonTask):
+class ProjectInfoTask(WorkerTaskBase):
     """Aggregate project information as provided by PyPI."""
 
     def run(self, node_args) -> dict:
@@ -52,8 +58,8 @@ class ProjectInfoTask(SelinonTask):
         package_name = node_args["package_name"]
 
         # For now we retrieve description for the latest release.
-        api_url = PYPI.get_api_url()
-        response = requests.get(api_url + f"/{package_name}/json")
+        api_url = _PYPI_API_URL or PYPI.get_api_url()
+        response = http_client.get(api_url + f"/{package_name}/json")
         response.raise_for_status()
 
         result = response.json()
@@ -19,18 +19,18 @@
 
 import logging
 
-from selinon import SelinonTask
-
 from thoth.storages.graph import GraphDatabase
 from thoth.storages import SolverResultsStore
 from thoth.storages import AnalysisResultsStore
+from ..listing import iter_document_listing
+from .base import WorkerTaskBase
 
 
 _LOGGER = logging.getLogger(__name__)
 _LOGGER.setLevel(logging.DEBUG)
 
 
-class SyncListingTask(SelinonTask):
+class SyncListingTask(WorkerTaskBase):
     """List available documents present on Ceph that should be synced into the graph database."""
 
     def run(self, node_args):
@@ -40,20 +40,20 @@ class SyncListingTask(SelinonTask):
         solver_store.connect()
 
         _LOGGER.info("Retrieving solver documents")
-        for document_id in solver_store.get_document_listing():
+        for document_id in iter_document_listing(solver_store.ceph):
             result.append({"document_id": document_id, "solver": True})
 
         analysis_store = AnalysisResultsStore()
         analysis_store.connect()
 
         _LOGGER.info("Retrieving analysis documents")
-        for document_id in analysis_store.get_document_listing():
+        for document_id in iter_document_listing(analysis_store.ceph):
             result.append({"document_id": document_id, "solver": False})
 
         return result
 
 
-class GraphSyncSolverTask(SelinonTask):
+class GraphSyncSolverTask(WorkerTaskBase):
     """Sync solver document into graph."""
 
     def run(self, node_args):
@@ -72,7 +72,7 @@ class GraphSyncSolverTask(SelinonTask):
         graph.sync_solver_result(solver_document)
 
 
-class GraphSyncAnalysisTask(SelinonTask):
+class GraphSyncAnalysisTask(WorkerTaskBase):
     """Sync analysis document into graph."""
 
     def run(self, node_args):
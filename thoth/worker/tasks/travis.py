@@ -1,19 +1,25 @@
 """Interact with Travis CI API."""
 
-import re
+import os
 import typing
 from urllib.parse import quote_plus as url_quote
 
-from selinon import SelinonTask
 import requests
 
+from selinon import StoragePool
 
-_TRAVIS_API_URL = 'https://api.travis-ci.org'
+from thoth.worker import http_client
+from thoth.worker.log_index import clean_log
+from thoth.worker.log_index import extract_segment
+from .base import WorkerTaskBase
+
+
+_TRAVIS_API_URL = os.getenv('THOTH_WORKER_TRAVIS_API_URL', 'https://api.travis-ci.org')
 
 
 def _travis_get(url: str, token: str, **params) -> requests.models.Response:
     """Issue HTTP GET method on the given URL to Travis CI. Check for HTTP status."""
-    response = requests.get(url, params=params, headers={
+    response = http_client.get(url, params=params, headers={
         'Travis-API-Version': '3',
         'Authorization': f'token {token}'
     })
@@ -35,7 +41,7 @@ def _travis_response(url: str, token: str, iter_key: str, params: dict=None, pag
         offset += 1
 
 
-class TravisActiveRepos(SelinonTask):
+class TravisActiveRepos(WorkerTaskBase):
     """List active repos available for the given organization."""
 
     def run(self, node_args: dict) -> list:
@@ -50,7 +56,7 @@ class TravisActiveRepos(SelinonTask):
         return repos
 
 
-class TravisRepoBuildsCount(SelinonTask):
+class TravisRepoBuildsCount(WorkerTaskBase):
     """Retrieve number of builds for the given repo so build ids can be gathered in parallel."""
 
     def run(self, node_args: dict) -> dict:
@@ -61,7 +67,7 @@ class TravisRepoBuildsCount(SelinonTask):
         return {'count': response.json()['@pagination']['count']}
 
 
-class TravisRepoBuilds(SelinonTask):
+class TravisRepoBuilds(WorkerTaskBase):
     """Get builds available for the given repo (org/repo slug)."""
 
     def run(self, node_args: dict) -> list:
@@ -88,7 +94,7 @@ class TravisRepoBuilds(SelinonTask):
         return builds
 
 
-class TravisLogTxt(SelinonTask):
+class TravisLogTxt(WorkerTaskBase):
     """Download the given log in a text form."""
 
     def run(self, node_args: dict) -> list:
@@ -109,15 +115,23 @@ class TravisLogTxt(SelinonTask):
         return result
 
 
-class TravisLogCleanup(SelinonTask):
+class TravisLogCleanup(WorkerTaskBase):
     """Clean logs from non-utf8 characters and escape sequences."""
 
     def run(self, _):
         build_log = self.parent_task_result('TravisLogTxt')
 
         for job in build_log:
-            log = re.sub(u'\u001b\[.*?[@-~]', '', job['log'])
-            log = log.encode('ascii', 'ignore').decode()
-            job['log'] = log
+            job['log'] = clean_log(job['log'])
 
         return build_log
+
+
+class TravisLogIndexTask(WorkerTaskBase):
+    """Extract error lines of logs of the given build into a segment of the log index."""
+
+    def run(self, node_args: dict) -> dict:
+        build_log = StoragePool.get_connected_storage('TravisLogsStorage').retrieve_build_logs(
+            node_args['organization'], node_args['repo'], node_args['build']
+        )
+        return extract_segment(build_log)
@@ -18,10 +18,30 @@
 """Initialization and core utilities for Thoth's worker."""
 
 import os
+import hashlib
+import logging
+import tempfile
+import typing
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from functools import lru_cache
 
+import selinon
 from selinon import Config
 
+from .serialization import get_celery_configuration
+
+_LOGGER = logging.getLogger(__name__)
+
 _BASE_NAME = os.path.join(os.path.dirname(os.path.relpath(__file__)), "config")
+# Redis used for worker's bookkeeping, a separate database from the ones used for Selinon's results.
+_REDIS_URL = os.getenv("THOTH_WORKER_REDIS_URL", "redis://redis:6379/4")
+# Generated Selinon configuration is cached in this directory and reused on next worker start, empty turns caching off.
+_CONFIG_CACHE_DIR = os.getenv(
+    "THOTH_WORKER_CONFIG_CACHE_DIR", os.path.join(tempfile.gettempdir(), "thoth_worker_config")
+)
 
 
 def get_config_files():
@@ -35,6 +55,131 @@ def get_config_files():
     return os.path.join(_BASE_NAME, "nodes.yaml"), flow_definition_files
 
 
+def iter_prefetched(
+    fetch: typing.Callable,
+    items: typing.Iterable,
+    workers: int,
+    window: typing.Optional[int] = None,
+    ordered: bool = True,
+) -> typing.Generator[typing.Any, None, None]:
+    """Apply fetch on items concurrently using a bounded thread pool, yield results as a stream.
+
+    At most window items (defaults to 2 * workers) are fetched or buffered at any time - new fetches are submitted
+    only as results are consumed so memory stays flat regardless of the number of items. If ordered is false,
+    results are yielded as soon as they are available.
+    """
+    window = window or 2 * workers
+    items = iter(items)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if ordered:
+            in_flight = deque()
+            for item in items:
+                in_flight.append(executor.submit(fetch, item))
+                if len(in_flight) >= window:
+                    yield in_flight.popleft().result()
+
+            while in_flight:
+                yield in_flight.popleft().result()
+        else:
+            pending = set()
+            for item in items:
+                pending.add(executor.submit(fetch, item))
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+
+@lru_cache(maxsize=1)
+def get_redis_connection():
+    """Get a connection to Redis used for worker's bookkeeping (progress tracking and similar)."""
+    # Imported lazily, not needed for CLI runs.
+    import redis
+
+    return redis.Redis.from_url(_REDIS_URL)
+
+
+def get_worker_queues() -> typing.Optional[typing.Set[str]]:
+    """Get queues the worker was configured to listen on (THOTH_WORKER_QUEUES), None if not restricted."""
+    # Read on each call, app.py exports the resolved queue listing before Celery imports the entrypoint.
+    worker_queues = os.getenv("THOTH_WORKER_QUEUES")
+    if worker_queues is None:
+        return None
+
+    return {queue.strip() for queue in worker_queues.split(",") if queue.strip()}
+
+
+def get_config_hash(queues: typing.Optional[typing.Iterable[str]] = None) -> str:
+    """Compute a hash of configuration files, Selinon version and queues served used to key cached configuration."""
+    nodes_definition_file, flow_definition_files = get_config_files()
+
+    digest = hashlib.sha256()
+    digest.update(selinon.__version__.encode())
+    for config_file in [nodes_definition_file] + sorted(flow_definition_files):
+        digest.update(os.path.basename(config_file).encode())
+        with open(config_file, "rb") as config_file_content:
+            digest.update(config_file_content.read())
+
+    if queues is not None:
+        digest.update(("queues:" + ",".join(sorted(queues))).encode())
+
+    return digest.hexdigest()
+
+
+def _compile_config(config_py: str, queues: typing.Optional[typing.Set[str]] = None) -> None:
+    """Generate Selinon's Python configuration out of YAML configuration files."""
+    from selinon.system import System
+
+    system = System.from_files(*get_config_files())
+
+    if queues is not None:
+        for task in system.tasks:
+            if task.queue_name not in queues:
+                # The task is never run by this worker, do not import its implementation (and its dependencies).
+                task.import_path = "selinon"
+                task.class_name = "SelinonTask"
+
+    # Write to a temporary file first so concurrently starting workers never see a partially written file.
+    tmp_config_py = f"{config_py}.{os.getpid()}.tmp"
+    with open(tmp_config_py, "w") as output:
+        system.dump2stream(output)
+
+    os.replace(tmp_config_py, config_py)
+
+
+def set_config(queues: typing.Optional[typing.Iterable[str]] = None) -> None:
+    """Set Selinon configuration, use precompiled configuration unless caching is turned off.
+
+    :param queues: queues the worker serves - only tasks listening on these queues are imported, None imports all
+    """
+    if not _CONFIG_CACHE_DIR:
+        # All the tasks are imported, the configuration is not generated into a Python module.
+        Config.set_config_yaml(*get_config_files())
+        return
+
+    queues = set(queues) if queues is not None else None
+    config_py = os.path.join(_CONFIG_CACHE_DIR, f"selinon_config_{get_config_hash(queues)}.py")
+    if not os.path.isfile(config_py):
+        _LOGGER.info("Precompiling Selinon configuration to %r", config_py)
+        os.makedirs(_CONFIG_CACHE_DIR, exist_ok=True)
+        _compile_config(config_py, queues)
+    else:
+        _LOGGER.debug("Using precompiled Selinon configuration %r", config_py)
+
+    Config.set_config_py(config_py)
+
+
+def set_config_without_tasks() -> None:
+    """Set Selinon configuration with no task imported, for tools using only storages or queue configuration."""
+    set_config(queues=())
+
+
 def init(with_result_backend=False):
     """Init Celery and Selinon.
 
@@ -44,7 +189,7 @@ def init(with_result_backend=False):
     # Avoid exception on CLI run.
     from celery import Celery
 
-    conf = {"broker_url": os.environ["BROKER_URL"]}
+    conf = {"broker_url": os.environ["BROKER_URL"], **get_celery_configuration()}
 
     if with_result_backend:
         conf["result_backend"] = os.environ["RESULT_BACKEND_URL"]
@@ -53,7 +198,7 @@ def init(with_result_backend=False):
     app.config_from_object(conf)
 
     # Set Selinon configuration.
-    Config.set_config_yaml(*get_config_files())
+    set_config(queues=get_worker_queues())
     # Prepare Celery
     Config.set_celery_app(app)
 
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Construction of the project2vec vocabulary from aggregated keywords.
+
+Keywords are pruned based on configuration taken from environment variables:
+
+ * THOTH_WORKER_VOCABULARY_MIN_DF - minimal number of projects stating the keyword (default 1)
+ * THOTH_WORKER_VOCABULARY_MAX_DF - maximal number of projects stating the keyword (default 100%, no limit)
+
+Document frequencies are absolute numbers of projects, a value suffixed with "%" is a percentage of all the projects
+with aggregated keywords (e.g. THOTH_WORKER_VOCABULARY_MAX_DF=50%).
+ * THOTH_WORKER_VOCABULARY_TOP_K - keep only the given number of the most frequent keywords (default 0, no limit)
+ * THOTH_WORKER_VOCABULARY_STOP_WORDS - remove English stop words, "0" turns removal off (default 1)
+ * THOTH_WORKER_VOCABULARY_EXTRA_STOP_WORDS - additional comma separated stop words
+ * THOTH_WORKER_VOCABULARY_STACKOVERFLOW - keep only keywords that are also StackOverflow tags (default 0)
+
+Number of projects stating each keyword is counted from keywords contributions of projects recorded by the keywords
+flow (see KeywordsContributionStore) as aggregated keywords count occurrences.
+
+The vocabulary is stored in VocabularyStore as a versioned artifact, the version is the hash of keywords as used
+in project2vec (see Project2VecTask.get_vocabulary_version):
+
+  thoth-worker-vocabulary build
+  thoth-worker-vocabulary report
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import typing
+
+from selinon import StoragePool
+
+from .exceptions import NotFoundException
+from .utils import set_config_without_tasks
+
+_LOGGER = logging.getLogger(__name__)
+
+# Common English stop words, keywords stated on PyPI are often taken from project descriptions.
+ENGLISH_STOP_WORDS = frozenset(
+    """
+    a about above after again against all am an and any are as at be because been before being below between both
+    but by can could did do does doing down during each few for from further had has have having he her here hers
+    herself him himself his how i if in into is it its itself just me more most my myself no nor not now of off on
+    once only or other our ours ourselves out over own same she should so some such than that the their theirs them
+    themselves then there these they this those through to too under until up very was we were what when where
+    which while who whom why will with would you your yours yourself yourselves
+    """.split()
+)
+
+
+def _parse_document_frequency(value: str) -> typing.Union[int, float]:
+    """Parse document frequency - an absolute number of projects, or a proportion if given as a percentage."""
+    value = value.strip()
+    try:
+        if value.endswith("%"):
+            return float(value[:-1]) / 100
+        return int(value)
+    except ValueError:
+        raise ValueError(
+            f"Document frequency {value!r} is neither a number of projects nor a percentage of projects (e.g. 50%)"
+        ) from None
+
+
+def get_vocabulary_configuration() -> dict:
+    """Get vocabulary configuration as set in the environment."""
+    extra_stop_words = os.getenv("THOTH_WORKER_VOCABULARY_EXTRA_STOP_WORDS", "")
+    return {
+        "min_df": _parse_document_frequency(os.getenv("THOTH_WORKER_VOCABULARY_MIN_DF", "1")),
+        "max_df": _parse_document_frequency(os.getenv("THOTH_WORKER_VOCABULARY_MAX_DF", "100%")),
+        "top_k": int(os.getenv("THOTH_WORKER_VOCABULARY_TOP_K", 0)),
+        "stop_words": bool(int(os.getenv("THOTH_WORKER_VOCABULARY_STOP_WORDS", 1))),
+        "extra_stop_words": sorted(word.strip() for word in extra_stop_words.split(",") if word.strip()),
+        "stackoverflow": bool(int(os.getenv("THOTH_WORKER_VOCABULARY_STACKOVERFLOW", 0))),
+    }
+
+
+def _get_limit(document_frequency: typing.Union[int, float], projects: int) -> float:
+    """Turn a document frequency into an absolute number of projects."""
+    return document_frequency * projects if isinstance(document_frequency, float) else document_frequency
+
+
+def get_document_frequency(prefetch: int = 32) -> typing.Tuple[typing.Dict[str, int], int]:
+    """Count projects stating each keyword based on keywords contributions of projects, return also number of projects.
+
+    Aggregated keywords count occurrences, a project stating a keyword multiple times counts once here.
+    """
+    generation = StoragePool.get_connected_storage("AggregatedKeywordsStore").retrieve_generation()
+    document_frequency = {}
+    projects = 0
+    for _, keywords in StoragePool.get_connected_storage("KeywordsContributionStore").iter_contributions(
+        generation, prefetch
+    ):
+        projects += 1
+        for keyword in keywords or {}:
+            document_frequency[keyword] = document_frequency.get(keyword, 0) + 1
+
+    return document_frequency, projects
+
+
+def build_vocabulary(
+    keywords: typing.Dict[str, int],
+    configuration: dict,
+    document_frequency: typing.Dict[str, int],
+    projects: int,
+    stackoverflow_tags: typing.Optional[typing.Iterable[str]] = None,
+) -> typing.Tuple[typing.List[str], typing.Dict[str, int]]:
+    """Build vocabulary from aggregated keywords, return sorted keywords and number of keywords pruned per rule."""
+    min_df = _get_limit(configuration["min_df"], projects)
+    max_df = _get_limit(configuration["max_df"], projects)
+    stop_words = set(configuration["extra_stop_words"])
+    if configuration["stop_words"]:
+        stop_words.update(ENGLISH_STOP_WORDS)
+    stackoverflow_tags = frozenset(stackoverflow_tags) if configuration["stackoverflow"] else None
+
+    pruned = {"min_df": 0, "max_df": 0, "stop_words": 0, "stackoverflow": 0, "top_k": 0}
+    kept = []
+    for keyword in keywords:
+        frequency = document_frequency.get(keyword, 0)
+        if frequency < min_df or frequency <= 0:
+            pruned["min_df"] += 1
+        elif frequency > max_df:
+            pruned["max_df"] += 1
+        elif keyword in stop_words:
+            pruned["stop_words"] += 1
+        elif stackoverflow_tags is not None and keyword not in stackoverflow_tags:
+            pruned["stackoverflow"] += 1
+        else:
+            kept.append(keyword)
+
+    if configuration["top_k"] and len(kept) > configuration["top_k"]:
+        # The most frequent first, ties are broken by keyword so the vocabulary is deterministic.
+        kept.sort(key=lambda keyword: (-keywords[keyword], keyword))
+        pruned["top_k"] = len(kept) - configuration["top_k"]
+        kept = kept[:configuration["top_k"]]
+
+    return sorted(kept), pruned
+
+
+def _get_stackoverflow_tags() -> typing.List[str]:
+    """Get StackOverflow tags as aggregated by StackOverflowKeywordsAggregationTask."""
+    return list(StoragePool.get_connected_storage("StackOverflowKeywordsStore").retrieve_keywords()["result"])
+
+
+def create_vocabulary(configuration: typing.Optional[dict] = None, store: bool = True, prefetch: int = 32) -> dict:
+    """Create vocabulary from the stored aggregated keywords, store it as a new version if requested."""
+    from .tasks.project2vec import Project2VecTask
+
+    configuration = configuration or get_vocabulary_configuration()
+    keywords = StoragePool.get_connected_storage("AggregatedKeywordsStore").retrieve_keywords()["result"]
+    document_frequency, projects = get_document_frequency(prefetch)
+    if keywords and not projects:
+        raise NotFoundException(
+            "No keywords contributions of projects found, run the keywords flow to record them before building "
+            "the vocabulary"
+        )
+    stackoverflow_tags = _get_stackoverflow_tags() if configuration["stackoverflow"] else None
+
+    vocabulary, pruned = build_vocabulary(keywords, configuration, document_frequency, projects, stackoverflow_tags)
+    document = {
+        "version": Project2VecTask.get_vocabulary_version(vocabulary),
+        "configuration": configuration,
+        "keywords": vocabulary,
+        "stats": {"keywords": len(keywords), "projects": projects, "dimensions": len(vocabulary), "pruned": pruned},
+    }
+
+    if store:
+        StoragePool.get_connected_storage("VocabularyStore").store_vocabulary(document)
+        _LOGGER.info("Stored vocabulary version %r with %d keywords", document["version"], len(vocabulary))
+
+    return document
+
+
+def get_report(document: dict) -> dict:
+    """Report dimensionality of the given vocabulary and estimated size of project2vec model and results."""
+    dimensions = document["stats"]["dimensions"]
+    keywords = document["stats"]["keywords"]
+    projects = document["stats"]["projects"]
+    return {
+        "version": document["version"],
+        "configuration": document["configuration"],
+        "keywords": keywords,
+        "dimensions": dimensions,
+        "pruned": document["stats"]["pruned"],
+        "projects": projects,
+        # Each vector item is a single digit followed by a tab (or newline) in vectors.tsv.
+        "model_size": 2 * dimensions * projects,
+        "model_size_unpruned": 2 * keywords * projects,
+        # Vectors are serialized to JSON in results of Project2VecTask (", " separated digits).
+        "results_size": 3 * dimensions * projects,
+        "results_size_unpruned": 3 * keywords * projects,
+    }
+
+
+def main() -> None:
+    """Build or report the project2vec vocabulary."""
+    parser = argparse.ArgumentParser(description="Build project2vec vocabulary from aggregated keywords.")
+    parser.add_argument("command", choices=("build", "report"), help="Build a new vocabulary or report the current.")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Report vocabulary based on the current configuration, do not store it."
+    )
+    parser.add_argument(
+        "--prefetch", type=int, default=32, help="Number of concurrent downloads of keywords contributions."
+    )
+    args = parser.parse_args()
+
+    set_config_without_tasks()
+
+    try:
+        if args.command == "build" or args.dry_run:
+            document = create_vocabulary(store=not args.dry_run, prefetch=args.prefetch)
+        else:
+            document = StoragePool.get_connected_storage("VocabularyStore").retrieve_vocabulary()
+    except NotFoundException as exc:
+        _LOGGER.error(str(exc))
+        sys.exit(1)
+
+    json.dump(get_report(document), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# thoth-worker
+# Copyright(C) 2020 Fridolin Pokorny
+#
+# This program is free software: you can redistribute it and / or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Write-behind of Ceph writes done by storage adapters, turned on by THOTH_WORKER_CEPH_WRITE_BEHIND=1.
+
+Writes done in a write-behind scope are put into a bounded in-process queue (the writer blocks if the queue is full)
+and flushed concurrently by a pool of background threads. Leaving the outermost scope is a durability barrier - it waits
+for all the writes submitted in the scope to finish and raises if any of them failed. Scopes are tracked per thread,
+writes are done by the low level boto3 client which is thread safe unlike boto3 resources. Task runs and store methods
+of Ceph storage adapters run in a scope, so writes are durable before Selinon marks the task successful. Writes outside
+of any scope (e.g. done by CLI tools) stay synchronous. Configuration is taken from environment variables:
+
+ * THOTH_WORKER_CEPH_WRITE_BEHIND - set to 1 to turn write-behind on (default off)
+ * THOTH_WORKER_WRITE_BEHIND_WORKERS - number of threads flushing writes (default 8)
+ * THOTH_WORKER_WRITE_BEHIND_QUEUE_SIZE - maximum number of writes waiting in the queue (default 64)
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+import typing
+from contextlib import contextmanager
+
+from .exceptions import ThothWorkerException
+from .metrics import observe_write_behind_barrier
+from .metrics import observe_write_behind_depth
+from .metrics import observe_write_behind_flush
+
+_LOGGER = logging.getLogger(__name__)
+
+_ENABLED = os.getenv("THOTH_WORKER_CEPH_WRITE_BEHIND", "0") == "1"
+_WORKERS = int(os.getenv("THOTH_WORKER_WRITE_BEHIND_WORKERS", 8))
+_QUEUE_SIZE = int(os.getenv("THOTH_WORKER_WRITE_BEHIND_QUEUE_SIZE", 64))
+
+
+class WriteBehindError(ThothWorkerException):
+    """An exception raised on a durability barrier if any of the writes behind failed."""
+
+
+class _ScopeState:
+    """State of write-behind scopes entered in a thread, writes are tracked per thread that submitted them."""
+
+    def __init__(self):
+        """Create state of a thread with no scope entered."""
+        self.depth = 0
+        self.pending = 0
+        self.errors: typing.List[Exception] = []
+
+
+class _WriteBehind:
+    """A queue of writes flushed by background threads, created lazily in each (forked) worker process."""
+
+    def __init__(self):
+        """Create an idle write-behind, threads are started on the first write."""
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._pid: typing.Optional[int] = None
+        self._queue: typing.Optional[queue.Queue] = None
+        self._local = threading.local()
+
+    @property
+    def state(self) -> _ScopeState:
+        """Get state of scopes entered in the current thread."""
+        state = getattr(self._local, "state", None)
+        if state is None:
+            state = _ScopeState()
+            self._local.state = state
+        return state
+
+    def _start(self) -> None:
+        """Start flushing threads unless already started in this process (threads do not survive fork)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self._queue = queue.Queue(maxsize=_QUEUE_SIZE)
+            # Writes submitted before fork are not flushed in this process.
+            self.state.pending = 0
+            self.state.errors = []
+            for _ in range(_WORKERS):
+                threading.Thread(target=self._flush_writes, daemon=True).start()
+            self._pid = os.getpid()
+
+    def _flush_writes(self) -> None:
+        """Flush writes from the queue, run in background threads."""
+        while True:
+            adapter, write, submitted, state = self._queue.get()
+            try:
+                write()
+            except Exception as exc:
+                _LOGGER.exception("Failed to write behind for adapter %r: %s", adapter, str(exc))
+                with self._lock:
+                    state.errors.append(exc)
+            finally:
+                observe_write_behind_flush(adapter, time.monotonic() - submitted)
+                observe_write_behind_depth(self._queue.qsize())
+                with self._finished:
+                    state.pending -= 1
+                    self._finished.notify_all()
+
+    def submit(self, adapter: str, write: typing.Callable[[], typing.Any]) -> None:
+        """Submit the given write, block if the queue is full."""
+        self._start()
+        state = self.state
+        with self._lock:
+            state.pending += 1
+        self._queue.put((adapter, write, time.monotonic(), state))
+        observe_write_behind_depth(self._queue.qsize())
+
+    def flush(self) -> typing.List[Exception]:
+        """Wait for all the writes submitted by the current thread to finish, return errors of failed writes."""
+        state = self.state
+        start = time.monotonic()
+        with self._finished:
+            while state.pending:
+                self._finished.wait()
+            errors, state.errors = state.errors, []
+
+        observe_write_behind_barrier(time.monotonic() - start)
+        return errors
+
+
+_WRITE_BEHIND = _WriteBehind()
+
+
+def is_write_behind_active() -> bool:
+    """Check whether writes are done behind, i.e. write-behind is turned on and a scope is entered."""
+    return _ENABLED and _WRITE_BEHIND.state.depth > 0
+
+
+def submit_write(adapter: str, write: typing.Callable[[], typing.Any]) -> None:
+    """Submit a write done by the given storage adapter to be flushed in background."""
+    _WRITE_BEHIND.submit(adapter, write)
+
+
+def flush_writes() -> None:
+    """A durability barrier - wait for all the writes done behind to finish, raise if any of them failed."""
+    if not is_write_behind_active():
+        return
+
+    errors = _WRITE_BEHIND.flush()
+    if errors:
+        raise WriteBehindError(f"{len(errors)} write(s) done behind failed, first error: {errors[0]}") from errors[0]
+
+
+@contextmanager
+def write_behind_scope() -> typing.Generator[None, None, None]:
+    """Do writes in the scope behind, leaving the outermost scope is a durability barrier."""
+    if not _ENABLED:
+        yield
+        return
+
+    state = _WRITE_BEHIND.state
+    state.depth += 1
+    try:
+        yield
+    except Exception:
+        state.depth -= 1
+        if not state.depth:
+            # Writes are finished so nothing is written once the failure is reported, their errors are superseded.
+            _WRITE_BEHIND.flush()
+        raise
+
+    try:
+        if state.depth == 1:
+            flush_writes()
+    finally:
+        state.depth -= 1